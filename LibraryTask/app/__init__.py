@@ -1,7 +1,14 @@
 from flask import Flask
+from .commands import register_commands
 from .config import Config
-from .extensions import db, migrate
+from .engine import configure_engine, init_engines
+from .jsonprovider import init_json
+from .extensions import admission, cache, db, metrics, migrate
+from .jobs import jobs
 from .routes import register_routes
+from .search import init_search
+from .sharding import init_sharding
+from . import tasks  # registers the job handlers
 
 def create_app(test_config=None):
     app = Flask(__name__)
@@ -10,8 +17,19 @@ def create_app(test_config=None):
     if test_config:
         app.config.update(test_config)
 
+    init_json(app)
+    configure_engine(app)
     db.init_app(app)
+    init_engines(app, db)
+    metrics.init_app(app, db)
+    # after metrics: its timer starts before a request waits for admission
+    admission.init_app(app)
     migrate.init_app(app, db)
+    cache.init_app(app)
+    init_search(app)
+    init_sharding(app)
+    jobs.init_app(app)
 
     register_routes(app)
+    register_commands(app)
     return app
@@ -0,0 +1,155 @@
+import math
+import threading
+import time
+from flask import g, jsonify, request
+
+
+# ---------------- budgets ----------------
+
+class Budget:
+    """At most `limit` requests of one class in flight; up to `queue` more wait for a slot, each for at
+    most `timeout` seconds. Anything beyond that is turned away at once.
+
+    Adaptive budgets resize `limit` between 1 and `ceiling` after every window of `limit` completions:
+    while the window's mean latency stays within `tolerance` times the lowest one seen the limit grows
+    by one, above that it shrinks in proportion. The lowest latency creeps up 1% per window so a lasting
+    change (a bigger table, a slower disk) becomes the new baseline.
+    """
+
+    def __init__(self, name, limit, queue, timeout, adaptive=False, tolerance=2.0):
+        self.name = name
+        self.limit = self.ceiling = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.active = self.waiting = self.admitted = self.shed = 0
+        self._cond = threading.Condition()
+        self._window = []
+        self._best = math.inf
+
+    def acquire(self, wait=True):
+        """True once a slot is held (release() it afterwards), False when the request should be shed.
+        With wait=False, None rather than queueing: the event loop of asgi.py waits on a thread instead."""
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue:
+                self.shed += 1
+                return False
+            if not wait:
+                return None
+            self.waiting += 1
+            try:
+                got = self._cond.wait_for(lambda: self.active < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+            if not got:
+                self.shed += 1
+                return False
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def release(self, elapsed=None):
+        with self._cond:
+            self.active -= 1
+            if self.adaptive and elapsed is not None:
+                self._observe(elapsed)
+            self._cond.notify_all()
+
+    def _observe(self, elapsed):
+        self._window.append(elapsed)
+        if len(self._window) < self.limit:
+            return
+        mean = sum(self._window) / len(self._window)
+        self._window = []
+        self._best = min(self._best * 1.01, mean)
+        if mean <= self._best * self.tolerance:
+            self.limit = min(self.ceiling, self.limit + 1)
+        else:
+            self.limit = max(1, int(self.limit * self._best * self.tolerance / mean))
+
+
+# ---------------- request classes ----------------
+
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def scans(view):
+    """Marks a listing view: unpaged (no ?limit=, ?cursor= or ?ids=) or searching (?q=), it reads many
+    rows and is admitted under the "scan" budget rather than "read"."""
+    view.admission_scan = True
+    return view
+
+
+def request_class(view, req=request):
+    if req.method not in SAFE_METHODS:
+        return "write"
+    args = req.args
+    if getattr(view, "admission_scan", False) and ("q" in args or not ("limit" in args or "cursor" in args or "ids" in args)):
+        return "scan"
+    return "read"
+
+
+def shed_body(budget):
+    return {"error": "server busy, retry later", "class": budget.name}
+
+
+class AdmissionControl:
+    """Caps concurrent requests per class, "read" (point reads and pages), "scan" (searches and unpaged
+    listings) and "write", so a spike queues briefly in the process and is then shed with a fast 503
+    and Retry-After instead of every request waiting on the connection pool until it times out.
+
+    The async views of asgi.py draw on the same budgets; background jobs are not counted. GET /metrics
+    exports the per-class figures when metrics are on.
+    """
+
+    def init_app(self, app):
+        if not app.config["ADMISSION_CONTROL"]:
+            return
+        limits, queues = app.config["ADMISSION_LIMITS"], app.config["ADMISSION_QUEUES"]
+        timeout = app.config["ADMISSION_QUEUE_TIMEOUT_MS"] / 1000
+        budgets = app.extensions["admission"] = {
+            name: Budget(name, limits[name], queues[name], timeout, app.config["ADMISSION_ADAPTIVE"])
+            for name in ("read", "scan", "write")
+        }
+        retry_after = str(app.config["ADMISSION_RETRY_AFTER"])
+        if "metrics" in app.extensions:
+            app.extensions["metrics"].collectors.append(lambda: render(budgets))
+
+        @app.before_request
+        def admit():
+            view = app.view_functions.get(request.endpoint)
+            if view is None or request.endpoint == "metrics":
+                return None
+            budget = budgets[request_class(view)]
+            if not budget.acquire():
+                resp = jsonify(shed_body(budget))
+                resp.headers["Retry-After"] = retry_after
+                return resp, 503
+            g.admission = (budget, time.perf_counter())
+            return None
+
+        @app.teardown_request
+        def leave(exc):
+            admitted = g.pop("admission", None)
+            if admitted is not None:
+                budget, start = admitted
+                budget.release(time.perf_counter() - start)
+
+
+def render(budgets):
+    lines = []
+    for metric, kind, help, attr in (
+        ("admission_limit", "gauge", "Concurrent requests allowed per class.", "limit"),
+        ("admission_in_flight", "gauge", "Requests running per class.", "active"),
+        ("admission_waiting", "gauge", "Requests queued for a slot per class.", "waiting"),
+        ("admission_admitted_total", "counter", "Requests admitted per class.", "admitted"),
+        ("admission_shed_total", "counter", "Requests answered 503 per class.", "shed"),
+    ):
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{class="{b.name}"}} {getattr(b, attr)}' for b in budgets.values()]
+    return lines
@@ -0,0 +1,333 @@
+"""ASGI mode (asgi.py): the read-only routes run on an AsyncEngine inside the event loop, so a slow
+database round trip no longer pins a worker thread. Every other request (writes, streamed exports,
+errors) is handed to the Flask app unchanged, on a pool of ASYNC_WSGI_THREADS threads.
+
+Needs uvicorn and the async driver for the database, aiosqlite for SQLite or asyncpg for Postgres:
+pip install -r requirements-async.txt.
+"""
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import quote_etag
+from werkzeug.sansio.request import Request
+
+from .admission import request_class, shed_body
+from .engine import engine_options, install_sqlite_pragmas
+from .metrics import current_metrics, start_counters
+from .models import Book, Library, User
+from .pagination import page_request, seek_statement, split_page
+from .routes import (BOOK_KEYS, batch_projection, batch_results, book_projection, library_json, requested_fields,
+                     requested_ids, user_json)
+from .streaming import wants_stream
+from .versioning import etag
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+# Flask endpoint name -> coroutine serving it; a view returns (body, status[, headers]), or None to defer to Flask
+ASYNC_VIEWS = {}
+# left to Flask when BOOK_SHARDS is set: only its session routes statements to the shards
+BOOK_VIEWS = {"user_books_count", "books_under_library", "list_books"}
+
+
+def async_url(url):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"no async driver known for {url.get_backend_name()}")
+    return url.set(drivername=driver)
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = "HTTP_" + key
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def view(endpoint):
+    def register(fn):
+        ASYNC_VIEWS[endpoint] = fn
+        return fn
+    return register
+
+
+class AsyncApp:
+    """ASGI application around a Flask app created by create_app().
+
+    Reads go to DATABASE_REPLICA_URL when one is configured, like GET requests in the Flask app.
+    Async views do not read or fill the response cache; writes still invalidate it through Flask.
+    The Flask app's before/after_request hooks do not run for them either: dispatch() applies the
+    admission budgets and the request metrics (Server-Timing, GET /metrics) itself, and answers
+    If-None-Match with a 304 like the cached Flask routes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        url = self.config["DATABASE_REPLICA_URL"] or self.config["SQLALCHEMY_DATABASE_URI"]
+        options = engine_options(self.config, url)
+        if make_url(url).get_backend_name() == "sqlite" and make_url(url).database not in (None, "", ":memory:"):
+            # unlike pysqlite, aiosqlite pools file connections in a queue pool, which caps concurrent reads
+            options.update(pool_size=self.config["DB_POOL_SIZE"], max_overflow=self.config["DB_MAX_OVERFLOW"],
+                           pool_timeout=self.config["DB_POOL_TIMEOUT"])
+        self.engine = create_async_engine(async_url(url), **options)
+        if self.engine.dialect.name == "sqlite":
+            install_sqlite_pragmas(self.engine.sync_engine, self.config)
+        if "metrics" in app.extensions:
+            app.extensions["metrics"].watch(self.engine.sync_engine)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=False)
+        self.search = app.extensions["book_search"]
+        self.urls = app.url_map.bind("localhost")
+        self.threads = ThreadPoolExecutor(self.config["ASYNC_WSGI_THREADS"], thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        response = None
+        if scope["type"] == "http" and scope["method"] == "GET":
+            response = await self.dispatch(scope)
+        if response is None:
+            return await self.call_wsgi(scope, receive, send)
+        # werkzeug drops the body and entity headers of a 304 here
+        body, _, headers = response.get_wsgi_response({"REQUEST_METHOD": "GET"})
+        await send({"type": "http.response.start", "status": response.status_code,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        await send({"type": "http.response.body", "body": b"".join(body)})
+
+    async def dispatch(self, scope):
+        try:
+            endpoint, values = self.urls.match(scope["path"], "GET")
+        except HTTPException:
+            return None
+        fn = ASYNC_VIEWS.get(endpoint)
+        if fn is None or (self.config["BOOK_SHARDS"] and endpoint in BOOK_VIEWS):
+            return None
+        headers = Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]])
+        req = Request("GET", scope.get("scheme", "http"), scope.get("server"), scope.get("root_path", ""),
+                      scope["path"], scope["query_string"], headers, None)
+        m = start_counters(endpoint)
+        budget = self.budget(endpoint, req)
+        if budget is not None and not await self.acquire(budget):
+            return self.finish(m, shed_body(budget), 503, {"Retry-After": str(self.config["ADMISSION_RETRY_AFTER"])})
+        token = current_metrics.set(m)
+        try:
+            async with self.sessions() as session:
+                result = await fn(self, session, req, **values)
+            if result is None:
+                return None
+            response = self.finish(m, *result)
+        finally:
+            current_metrics.reset(token)
+            if budget is not None:
+                budget.release(time.perf_counter() - m["start"])
+        if "If-None-Match" in req.headers and response.status_code == 200:
+            response.make_conditional({"REQUEST_METHOD": "GET", "HTTP_IF_NONE_MATCH": req.headers["If-None-Match"]})
+        return response
+
+    def budget(self, endpoint, req):
+        budgets = self.app.extensions.get("admission")
+        if budgets is None:
+            return None
+        return budgets[request_class(self.app.view_functions[endpoint], req)]
+
+    async def acquire(self, budget):
+        admitted = budget.acquire(wait=False)
+        if admitted is None:
+            # queueing blocks on a condition: wait on a thread, not in the event loop
+            admitted = await asyncio.get_running_loop().run_in_executor(None, budget.acquire)
+        return admitted
+
+    def finish(self, m, body, status, *headers):
+        response = self.app.json.response(body)
+        response.status_code = status
+        response.headers.update(*headers)
+        registry = self.app.extensions.get("metrics")
+        if registry is not None:
+            response.headers.add("Server-Timing", registry.record(m))
+        return response
+
+    async def call_wsgi(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = []
+        while True:
+            message = await receive()
+            body.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.threads, self.run_wsgi, scope, b"".join(body), send, loop)
+
+    # runs in a pool thread; chunks are sent as the app yields them, so streamed exports stay streamed
+    def run_wsgi(self, scope, body, send, loop):
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = []
+
+        def start_response(status, headers, exc_info=None):
+            start[:] = [{"type": "http.response.start", "status": int(status.split(" ", 1)[0]),
+                         "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]}]
+
+        result = self.app(wsgi_environ(scope, body), start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not started:
+                    emit(start[0])
+                    started = True
+                if chunk:
+                    emit({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                emit(start[0])
+            emit({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                self.threads.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # async twin of listing() in routes.py; streamed exports stay on the Flask side
+    async def listing(self, session, req, stmt, keys, to_json, order=None, scalars=False):
+        try:
+            page = page_request(req.args, keys, self.config["DEFAULT_PAGE_SIZE"], self.config["MAX_PAGE_SIZE"])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if page is None and order is not None:
+            stmt = stmt.order_by(order)
+        if page is not None:
+            stmt = seek_statement(stmt, keys, page)
+        result = await session.execute(stmt)
+        rows = result.scalars().all() if scalars else result.all()
+        if page is None:
+            return [to_json(x) for x in rows], 200
+        items, next_cursor = split_page(rows, keys, page)
+        return {"items": [to_json(x) for x in items], "next_cursor": next_cursor}, 200
+
+    async def book_listing(self, session, req, filters):
+        if wants_stream(req):
+            return None
+        try:
+            fields = requested_fields(req.args)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        columns, to_json = book_projection(fields, "limit" in req.args or "cursor" in req.args)
+        stmt, rank = filters(select(*columns))
+        return await self.listing(session, req, stmt, list(BOOK_KEYS), to_json, order=rank)
+
+    # async twin of batch_read() in routes.py
+    async def batch_read(self, session, req, stmt_for, name, to_json, scalars=False):
+        try:
+            ids = requested_ids(req.args, self.config["BATCH_MAX_IDS"])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        result = await session.execute(stmt_for(sorted(set(ids))))
+        rows = result.scalars().all() if scalars else result.all()
+        return batch_results(ids, rows, name, to_json), 200
+
+    def users_with_library(self):
+        loader = selectinload if self.config["USER_LIBRARY_LOADING"] == "selectin" else joinedload
+        return select(User).options(loader(User.library))
+
+
+# ---------------- Users ----------------
+
+@view("list_users")
+async def list_users(aio, session, req):
+    if "ids" in req.args:
+        return await aio.batch_read(session, req, lambda ids: aio.users_with_library().where(User.id.in_(ids)),
+                                    "user", user_json, scalars=True)
+    return await aio.listing(session, req, aio.users_with_library(), [User.id], user_json, scalars=True)
+
+
+@view("get_user")
+async def get_user(aio, session, req, user_id):
+    u = await session.scalar(aio.users_with_library().where(User.id == user_id))
+    if not u:
+        return {"error": "user not found"}, 404
+    return user_json(u), 200, {"ETag": quote_etag(etag(u, u.library))}
+
+
+@view("user_books_count")
+async def user_books_count(aio, session, req, user_id):
+    lib = (await session.execute(select(Library.id, Library.book_count).where(Library.user_id == user_id).limit(1))).first()
+    if not lib:
+        return {"error": "user or library not found"}, 404
+    return {"user_id": user_id, "library_id": lib.id, "count": lib.book_count}, 200
+
+
+# ---------------- Libraries ----------------
+
+@view("list_libraries")
+async def list_libraries(aio, session, req):
+    return await aio.listing(session, req, select(Library), [Library.id], library_json, scalars=True)
+
+
+@view("books_under_library")
+async def books_under_library(aio, session, req, library_id):
+    if not await session.get(Library, library_id):
+        return {"error": "library not found"}, 404
+    return await aio.book_listing(session, req, lambda stmt: (stmt.where(Book.library_id == library_id), None))
+
+
+# ---------------- Books ----------------
+
+@view("list_books")
+async def list_books(aio, session, req):
+    if "ids" in req.args:
+        try:
+            columns, to_json = batch_projection(requested_fields(req.args))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return await aio.batch_read(session, req, lambda ids: select(*columns).where(Book.id.in_(ids)), "book", to_json)
+
+    library_id = req.args.get("library_id", type=int)
+    q = req.args.get("q", type=str)
+
+    def filters(stmt):
+        if library_id is not None:
+            stmt = stmt.where(Book.library_id == library_id)
+        if q:
+            return aio.search.apply(stmt, q)
+        return stmt, None
+
+    return await aio.book_listing(session, req, filters)
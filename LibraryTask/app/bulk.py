@@ -0,0 +1,197 @@
+import json
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from itertools import groupby
+from sqlalchemy import bindparam, insert, select, update
+from .counters import adjust_book_counts
+from .engine import sharded
+from .extensions import db
+from .models import Book, Library
+from .sharding import by_shard, fan_out, next_book_ids
+from .streaming import NDJSON
+
+# stays well below SQLite's default 32766 bound parameters per statement
+IN_CHUNK = 10000
+
+
+class BadItem:
+    """Placeholder for an NDJSON line that is not valid JSON."""
+
+
+def parse_items(req, max_items):
+    """Reads a bulk body: a JSON array, or one JSON value per line for application/x-ndjson."""
+    if req.mimetype == NDJSON:
+        items = []
+        for line in req.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(BadItem())
+    else:
+        items = req.get_json(silent=True)
+        if isinstance(items, dict) and isinstance(items.get("items"), list):
+            items = items["items"]
+        if not isinstance(items, list):
+            raise ValueError("body must be a JSON array or NDJSON")
+    if not items:
+        raise ValueError("no items")
+    if len(items) > max_items:
+        raise ValueError(f"at most {max_items} items per request")
+    return items
+
+
+def chunks(seq, size):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def existing_ids(column, ids):
+    """Which of ids exist, with one IN query per IN_CHUNK values."""
+    ids = list(set(ids))
+    found = set()
+    for chunk in chunks(ids, IN_CHUNK):
+        found.update(db.session.scalars(select(column).where(column.in_(chunk))))
+    return found
+
+
+def library_ids_of(book_ids):
+    """{book id: library id} for the books that exist, with one IN query per IN_CHUNK ids
+    (sent to every shard at once when books are sharded)."""
+    found = {}
+    for chunk in chunks(list(set(book_ids)), IN_CHUNK):
+        stmt = select(Book.id, Book.library_id).where(Book.id.in_(chunk))
+        for rows in fan_out(stmt) if sharded() else [db.session.execute(stmt).all()]:
+            found.update(rows)
+    return found
+
+
+def create_books(items, batch_size):
+    """INSERTs the valid items in batch_size statements and bumps book counts, without committing.
+    Returns one result per item, in input order, and the ids of the libraries that got books."""
+    results = [None] * len(items)
+    pending = []
+    for i, d in enumerate(items):
+        if isinstance(d, BadItem) or not isinstance(d, dict):
+            results[i] = {"status": 400, "error": "item must be a JSON object"}
+        elif not all(isinstance(d.get(k), str) and d[k] for k in ("title", "author")) or not is_id(d.get("library_id")):
+            results[i] = {"status": 400, "error": "title, author, library_id are required"}
+        else:
+            pending.append(i)
+
+    libs = existing_ids(Library.id, [items[i]["library_id"] for i in pending])
+    rows = []
+    for i in pending:
+        if items[i]["library_id"] in libs:
+            rows.append((i, {"title": items[i]["title"], "author": items[i]["author"], "library_id": items[i]["library_id"]}))
+        else:
+            results[i] = {"status": 404, "error": "library not found"}
+
+    # multi-row INSERT ... RETURNING does not promise input order (and asking SQLAlchemy to sort
+    # falls back to one statement per row on SQLite), so rows are matched back by content;
+    # identical items are interchangeable
+    stmt = insert(Book).returning(Book.id, Book.title, Book.author, Book.library_id, Book.created_at)
+    for shard, shard_rows in by_shard(rows, lambda r: r[1]["library_id"]):
+        with shard:
+            if sharded():
+                for (_, row), book_id in zip(shard_rows, next_book_ids(len(shard_rows))):
+                    row["id"] = book_id
+            for batch in chunks(shard_rows, batch_size):
+                waiting = defaultdict(deque)
+                for i, row in batch:
+                    waiting[row["title"], row["author"], row["library_id"]].append(i)
+                for book_id, title, author, library_id, created_at in db.session.execute(stmt, [row for _, row in batch]):
+                    i = waiting[title, author, library_id].popleft()
+                    results[i] = {"status": 201, "book": {
+                        "id": book_id, "title": title, "author": author,
+                        "library_id": library_id, "created_at": created_at,
+                    }}
+            adjust_book_counts(Counter(row["library_id"] for _, row in shard_rows))
+    return results, {row["library_id"] for _, row in rows}
+
+
+def update_books(changes, batch_size):
+    """UPDATE book by id for [{"id", <columns>...}], one executemany per run of items that set the
+    same columns (input order is kept, so a book listed twice ends with its last change).
+    version_id is bumped in SQL; the ORM's own bulk path would check it row by row instead."""
+    table = Book.__table__
+    for columns, run in groupby(changes, key=lambda c: tuple(sorted(k for k in c if k != "id"))):
+        stmt = update(table).where(table.c.id == bindparam("b_id")).values(version_id=table.c.version_id + 1)
+        params = [{"b_id": c["id"], **{k: c[k] for k in columns}} for c in run]
+        for batch in chunks(params, batch_size):
+            db.session.execute(stmt, batch)
+
+
+def is_id(v):
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def parse_transfer(d):
+    """Turns a transfer body into either a list of book ids or a list of WHERE clauses."""
+    if "book_ids" in d:
+        ids = d["book_ids"]
+        if not isinstance(ids, list) or not ids or not all(is_id(i) for i in ids):
+            raise ValueError("book_ids must be a non-empty list of integers")
+        return ids, None
+
+    where = []
+    if d.get("from_library_id") is not None:
+        if not is_id(d["from_library_id"]):
+            raise ValueError("from_library_id must be an integer")
+        where.append(Book.library_id == d["from_library_id"])
+    if d.get("author"):
+        where.append(Book.author == d["author"])
+    for key, op in (("created_after", "__ge__"), ("created_before", "__lt__")):
+        if d.get(key):
+            try:
+                when = datetime.fromisoformat(str(d[key]).removesuffix("Z"))
+            except ValueError:
+                raise ValueError(f"{key} must be an ISO timestamp")
+            where.append(getattr(Book.created_at, op)(when))
+    # moving every book in the catalog has to be asked for explicitly
+    if not where and d.get("all") is not True:
+        raise ValueError("book_ids, a filter (from_library_id, author, created_after, created_before) or all=true is required")
+    return None, where
+
+
+def _move_rows(to_id, rows_stmt, on_chunk=None):
+    # rows are read (and locked where the database supports it) first so every source library's
+    # counter can be decremented by exactly what left it
+    rows = db.session.execute(rows_stmt.with_for_update()).all()
+    deltas = Counter()
+    if rows:
+        stmt = update(Book).where(Book.id.in_([r.id for r in rows])).values(library_id=to_id, version_id=Book.version_id + 1)
+        db.session.execute(stmt, execution_options={"synchronize_session": False})
+        for r in rows:
+            deltas[r.library_id] -= 1
+        deltas[to_id] += len(rows)
+        adjust_book_counts(deltas)
+    sources = set(deltas) - {to_id}
+    if on_chunk:
+        on_chunk(len(rows), sources)
+    db.session.commit()
+    return len(rows), sources
+
+
+def transfer_books(to_id, ids=None, where=None, chunk_size=1000, on_chunk=None):
+    """Set-based move of books into library to_id, committed chunk by chunk so write locks
+    are only held for one chunk at a time. Returns how many books changed library and the set
+    of libraries they left. on_chunk(moved, sources) runs inside each chunk's transaction, right
+    before its commit."""
+    moved, sources = 0, set()
+    if ids is not None:
+        for chunk in chunks(sorted(set(ids)), chunk_size):
+            count, left = _move_rows(to_id, select(Book.id, Book.library_id).where(Book.id.in_(chunk), Book.library_id != to_id), on_chunk)
+            moved += count
+            sources |= left
+        return moved, sources
+
+    # moved rows stop matching library_id != to_id, so each pass picks up the next chunk
+    while True:
+        stmt = select(Book.id, Book.library_id).where(*where, Book.library_id != to_id).order_by(Book.id).limit(chunk_size)
+        count, left = _move_rows(to_id, stmt, on_chunk)
+        moved += count
+        sources |= left
+        if count < chunk_size:
+            return moved, sources
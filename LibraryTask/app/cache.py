@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, g, make_response, request
+from .streaming import wants_stream
+
+
+# ---------------- backends ----------------
+
+class LRUCache:
+    """In-process cache bounded by entry count, with a TTL. Not shared between worker processes."""
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisCache:
+    """Works with any client exposing redis-py's get/set(ex=)/delete."""
+
+    def __init__(self, client, ttl=60, prefix="librarytask:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def make_backend(app):
+    backend = app.config["CACHE_BACKEND"]
+    if not isinstance(backend, str):
+        return backend  # an already configured backend instance
+    if backend == "none":
+        return None
+    if backend == "lru":
+        return LRUCache(app.config["CACHE_MAX_ENTRIES"], app.config["CACHE_TTL"])
+    if backend == "redis":
+        import redis
+        return RedisCache(redis.Redis.from_url(app.config["CACHE_REDIS_URL"]), app.config["CACHE_TTL"])
+    raise ValueError(f"unknown CACHE_BACKEND {backend!r}")
+
+
+# ---------------- response cache ----------------
+
+class ResponseCache:
+    """Read-through cache for GET handlers.
+
+    Entries are keyed by request path + query string and record the generation of every resource
+    tag they were built from ("user:1", "library:3", ...). Writers call invalidate(tag), which gives
+    the tag a fresh generation, so every entry built from it stops matching without having to find
+    and delete the entries themselves.
+    """
+
+    def init_app(self, app):
+        app.extensions["response_cache"] = make_backend(app)
+
+    @property
+    def backend(self):
+        return current_app.extensions.get("response_cache")
+
+    def _generation(self, tag):
+        gen = self.backend.get("tag:" + tag)
+        if gen is None:
+            gen = uuid.uuid4().hex
+            self.backend.set("tag:" + tag, gen)
+        return gen
+
+    def tag(self, *tags):
+        """Adds resource tags to the entry being built; for tags only known inside the view."""
+        if self.backend is not None and "cache_tags" in g:
+            for t in tags:
+                g.cache_tags[t] = self._generation(t)
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for t in tags:
+            self.backend.set("tag:" + t, uuid.uuid4().hex)
+
+    def _fresh(self, entry):
+        return all(self.backend.get("tag:" + t) == gen for t, gen in entry["tags"].items())
+
+    def cached(self, *tags):
+        """Decorator; tags are format strings filled from the view arguments, e.g. "user:{user_id}".
+        Successful responses also get an ETag, so If-None-Match is answered with a 304."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # a streamed body is never stored, and the key ignores Accept: keep NDJSON clients off JSON entries
+                if wants_stream(request):
+                    return view(**kwargs)
+                backend = self.backend
+                key = "resp:" + request.full_path
+                entry = backend.get(key) if backend is not None else None
+                if entry is not None and self._fresh(entry):
+                    resp = Response(entry["body"], status=200, mimetype=entry["mimetype"])
+                    resp.set_etag(entry["etag"])
+                    return resp.make_conditional(request)
+
+                # generations are read before the view runs, so a write racing with it leaves the entry stale
+                g.cache_tags = {}
+                self.tag(*(t.format(**kwargs) for t in tags))
+                resp = make_response(view(**kwargs))
+                if resp.status_code != 200 or resp.is_streamed:
+                    return resp
+                resp.add_etag()
+                if backend is not None:
+                    backend.set(key, {
+                        "body": resp.get_data(as_text=True),
+                        "mimetype": resp.mimetype,
+                        "etag": resp.get_etag()[0],
+                        "tags": g.cache_tags,
+                    })
+                return resp.make_conditional(request)
+            return wrapper
+        return decorator
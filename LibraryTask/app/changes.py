@@ -0,0 +1,114 @@
+"""Change feed for GET /changes.
+
+Every insert, update and delete of a user, library or book adds a row to change_log. Triggers write
+them, the same way the full-text index in search.py is kept, so bulk Core statements (bulk
+create/patch/delete, transfers, jobs) are logged as well as ORM flushes. change_log.id is the feed
+order. SQLite has a single writer, so ids commit in order. On Postgres the trigger takes a
+transaction-level advisory lock first, so a lower id can never commit after a reader has already
+moved past it.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import DDL, delete, event, func, select
+from .extensions import db
+from .models import Change
+from .pagination import decode_cursor, encode_cursor
+
+# table -> columns whose updates are changes (book_count and version_id moves are not)
+TRACKED = {"user": ("username",), "library": ("name", "user_id"), "book": ("title", "author", "library_id")}
+
+
+def _sqlite_triggers(table, columns):
+    log = "INSERT INTO change_log(table_name, row_id, op) VALUES ('%s', %s.id, '%s')"
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {table}_change_ai AFTER INSERT ON "{table}" BEGIN {log % (table, "new", "insert")}; END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_change_au AFTER UPDATE OF {", ".join(columns)} ON "{table}" '
+        f'BEGIN {log % (table, "new", "update")}; END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_change_ad AFTER DELETE ON "{table}" BEGIN {log % (table, "old", "delete")}; END',
+    ]
+
+
+SQLITE_CHANGE_DDL = [stmt for table, columns in TRACKED.items() for stmt in _sqlite_triggers(table, columns)]
+
+# arbitrary key for pg_advisory_xact_lock; serializes change_log writers until they commit
+PG_CHANGE_LOCK = 7412019
+PG_CHANGE_DDL = [
+    "CREATE OR REPLACE FUNCTION log_change() RETURNS trigger AS $$ BEGIN "
+    f"PERFORM pg_advisory_xact_lock({PG_CHANGE_LOCK}); "
+    "IF TG_OP = 'DELETE' THEN "
+    "INSERT INTO change_log(table_name, row_id, op) VALUES (TG_TABLE_NAME, OLD.id, 'delete'); "
+    "ELSE "
+    "INSERT INTO change_log(table_name, row_id, op) VALUES (TG_TABLE_NAME, NEW.id, lower(TG_OP)); "
+    "END IF; RETURN NULL; END $$ LANGUAGE plpgsql",
+] + [
+    f'CREATE TRIGGER {table}_change AFTER INSERT OR DELETE OR UPDATE OF {", ".join(columns)} ON "{table}" '
+    "FOR EACH ROW EXECUTE FUNCTION log_change()"
+    for table, columns in TRACKED.items()
+]
+
+# on the metadata rather than a table: the triggers need all four tables in place
+for stmt in SQLITE_CHANGE_DDL:
+    event.listen(db.metadata, "after_create", DDL(stmt).execute_if(dialect="sqlite"))
+for stmt in PG_CHANGE_DDL:
+    event.listen(db.metadata, "after_create", DDL(stmt).execute_if(dialect="postgresql"))
+event.listen(db.metadata, "after_drop", DDL("DROP FUNCTION IF EXISTS log_change() CASCADE").execute_if(dialect="postgresql"))
+
+# for tracked tables replaced wholesale with the triggers off (`flask snapshot restore`): the old rows'
+# history goes and the newest entry moves two ids up, so ids never restart and every token issued so
+# far, even an up-to-date one, now falls before the log and answers 410
+RESET_SQL = [
+    "DELETE FROM change_log WHERE id < (SELECT max(id) FROM change_log)",
+    "UPDATE change_log SET id = id + 2",
+]
+PG_RESET_SQL = RESET_SQL + ["SELECT setval(pg_get_serial_sequence('change_log', 'id'), (SELECT max(id) FROM change_log))"]
+
+
+class ChangesExpired(Exception):
+    """The token points before the oldest change still kept; the consumer has to take a new snapshot."""
+
+
+def parse_since(args):
+    """The change id a ?since= token stands for; 0 (the start of the log) without one. ValueError when the
+    token does not hold a non-negative integer."""
+    token = args.get("since")
+    if not token:
+        return 0
+    since = decode_cursor(token, [Change.id])[0]
+    if since < 0:
+        raise ValueError("invalid cursor")
+    return since
+
+
+def head_token():
+    return encode_cursor([db.session.scalar(select(func.max(Change.id))) or 0])
+
+
+def read_changes(since, limit):
+    """Up to limit change_log rows after since, folded to the last change per row.
+    Returns ([(table, row_id, op, changed_at)], next token, whether more are waiting)."""
+    if since:
+        oldest = db.session.scalar(select(func.min(Change.id)))
+        if oldest is not None and since < oldest - 1:
+            raise ChangesExpired()
+    rows = db.session.execute(
+        select(Change.id, Change.table_name, Change.row_id, Change.op, Change.changed_at)
+        .where(Change.id > since).order_by(Change.id).limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {}
+    for r in rows:
+        latest.pop((r.table_name, r.row_id), None)  # re-inserted so the dict keeps last-change order
+        latest[r.table_name, r.row_id] = (r.table_name, r.row_id, r.op, r.changed_at)
+    return list(latest.values()), encode_cursor([rows[-1].id if rows else since]), has_more
+
+
+def prune_changes(max_age):
+    """Deletes changes older than max_age seconds, always keeping the newest one so ids never restart.
+    Returns how many went."""
+    newest = db.session.scalar(select(func.max(Change.id)))
+    if newest is None:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    result = db.session.execute(delete(Change).where(Change.changed_at < cutoff, Change.id < newest))
+    db.session.commit()
+    return result.rowcount
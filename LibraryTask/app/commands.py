@@ -0,0 +1,86 @@
+import click
+from flask import current_app
+from .changes import prune_changes
+from .counters import reconcile_book_counts
+from .idempotency import prune_idempotency_keys
+from .engine import sharded
+from .jobs import jobs
+from .sharding import create_shard_tables
+from .snapshot import SnapshotError, export_snapshot, restore_snapshot
+from .stats import rebuild_stats
+
+
+def register_commands(app):
+
+    @app.cli.command("reconcile-book-counts")
+    @click.option("--fix", is_flag=True, help="Rewrite drifted counters instead of only reporting them.")
+    def reconcile_book_counts_command(fix):
+        """Check Library.book_count against the book table."""
+        if sharded():
+            raise click.ClickException("book counts cannot be reconciled while books are sharded")
+        drifted = reconcile_book_counts(fix=fix)
+        for lib, stored, actual in drifted:
+            click.echo(f"library {lib}: book_count={stored} actual={actual}")
+        click.echo(f"{len(drifted)} drifted {'and repaired' if fix else '(run with --fix to repair)'}")
+
+    @app.cli.command("prune-idempotency-keys")
+    def prune_idempotency_keys_command():
+        """Delete Idempotency-Key records older than IDEMPOTENCY_TTL."""
+        click.echo(f"{prune_idempotency_keys(current_app.config['IDEMPOTENCY_TTL'])} keys deleted")
+
+    @app.cli.command("run-jobs")
+    def run_jobs_command():
+        """Run queued jobs, and running ones whose worker stopped, until none are left."""
+        jobs.resume()
+        jobs.join()
+        click.echo("no jobs left")
+
+    @app.cli.command("rebuild-stats")
+    @click.option("--chunk-size", default=1000, show_default=True, help="Authors or days rewritten per transaction.")
+    def rebuild_stats_command(chunk_size):
+        """Recompute the GET /stats rollups from the book table."""
+        authors, days = rebuild_stats(chunk_size)
+        click.echo(f"{authors} authors and {days} days rebuilt")
+        if not sharded():
+            click.echo(f"{len(reconcile_book_counts(fix=True))} library book counts repaired")
+
+    @app.cli.command("init-shards")
+    def init_shards_command():
+        """Create the book tables on every database in BOOK_SHARDS."""
+        if not sharded():
+            raise click.ClickException("BOOK_SHARDS is not set")
+        create_shard_tables()
+        click.echo(f"{len(current_app.config['BOOK_SHARDS'])} shards ready")
+
+    @app.cli.command("prune-changes")
+    def prune_changes_command():
+        """Delete change feed entries older than CHANGES_RETENTION."""
+        click.echo(f"{prune_changes(current_app.config['CHANGES_RETENTION'])} changes deleted")
+
+    @app.cli.group("snapshot")
+    def snapshot_group():
+        """Export or restore the whole catalog (users, libraries, books) as gzipped CSV."""
+
+    @snapshot_group.command("export")
+    @click.argument("directory", type=click.Path(file_okay=False))
+    @click.option("--chunk-size", default=10000, show_default=True, help="Rows fetched at a time where COPY and the backup API are unavailable.")
+    def snapshot_export_command(directory, chunk_size):
+        """Write every user, library and book into DIRECTORY."""
+        if sharded():
+            raise click.ClickException("snapshots cannot be taken while books are sharded")
+        counts = export_snapshot(directory, chunk_size)
+        click.echo(", ".join(f"{n} {table}" for table, n in counts.items()) + f" rows written to {directory}")
+
+    @snapshot_group.command("restore")
+    @click.argument("directory", type=click.Path(exists=True, file_okay=False))
+    @click.option("--chunk-size", default=10000, show_default=True, help="Rows inserted at a time where COPY and the backup API are unavailable.")
+    @click.confirmation_option(prompt="This replaces every user, library and book. Writers must be stopped. Continue?")
+    def snapshot_restore_command(directory, chunk_size):
+        """Replace every user, library and book with the snapshot in DIRECTORY."""
+        if sharded():
+            raise click.ClickException("snapshots cannot be restored while books are sharded")
+        try:
+            counts = restore_snapshot(directory, chunk_size)
+        except SnapshotError as e:
+            raise click.ClickException(f"{e}; nothing was changed")
+        click.echo(", ".join(f"{n} {table}" for table, n in counts.items()) + " rows restored; change feed tokens issued before now answer 410")
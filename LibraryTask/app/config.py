@@ -1,6 +1,93 @@
 import os
 
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return default if value in (None, "") else int(value)
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    return default if value in (None, "") else value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# "read=16,write=4" -> the defaults with those entries replaced
+def env_budgets(name, default):
+    value = os.getenv(name)
+    if not value:
+        return default
+    pairs = (item.split("=") for item in value.split(",") if item.strip())
+    return {**default, **{key.strip(): int(n) for key, n in pairs}}
+
+
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "zyoud")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # how User.library is eager-loaded by the user endpoints: "joined" or "selectin"
+    USER_LIBRARY_LOADING = os.getenv("USER_LIBRARY_LOADING", "joined")
+    # opt-in keyset pagination (?limit=&cursor=) on the list endpoints
+    DEFAULT_PAGE_SIZE = env_int("DEFAULT_PAGE_SIZE", 100)
+    MAX_PAGE_SIZE = env_int("MAX_PAGE_SIZE", 1000)
+    # rows fetched per round trip when streaming a listing (Accept: application/x-ndjson or ?stream=1)
+    STREAM_BATCH_SIZE = env_int("STREAM_BATCH_SIZE", 1000)
+    # GET /books?q= backend: "auto" (FTS5 on SQLite, tsvector on Postgres), "fts" or "like"
+    SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+    # /books/bulk: rows per INSERT/UPDATE/DELETE statement and items accepted per request
+    BULK_BATCH_SIZE = env_int("BULK_BATCH_SIZE", 1000)
+    BULK_MAX_ITEMS = env_int("BULK_MAX_ITEMS", 100000)
+    # books moved per UPDATE (and per commit) by POST /libraries/<id>/transfer
+    TRANSFER_CHUNK_SIZE = env_int("TRANSFER_CHUNK_SIZE", 1000)
+    # read-through response cache: "none", "lru" (per process) or "redis"
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "none")
+    CACHE_TTL = env_int("CACHE_TTL", 60)
+    CACHE_MAX_ENTRIES = env_int("CACHE_MAX_ENTRIES", 10000)
+    CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    # engine / pool tuning, applied per dialect by app/engine.py; an explicit
+    # SQLALCHEMY_ENGINE_OPTIONS entry always wins
+    DB_POOL_SIZE = env_int("DB_POOL_SIZE", 10)
+    DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 20)
+    DB_POOL_TIMEOUT = env_int("DB_POOL_TIMEOUT", 30)
+    DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", 1800)
+    DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
+    DB_STATEMENT_TIMEOUT_MS = env_int("DB_STATEMENT_TIMEOUT_MS", 0)  # 0 = no limit
+    # run on every new SQLite connection
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+    # when set, GET/HEAD handlers read from this database instead of the primary
+    DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+    # comma-separated database URLs; when set, books are spread over them by library_id (app/sharding.py).
+    # The count is fixed once books are written; create their tables with `flask init-shards`
+    BOOK_SHARDS = [url.strip() for url in os.getenv("BOOK_SHARDS", "").split(",") if url.strip()]
+    # per-request instrumentation: Server-Timing headers, GET /metrics and the slow query log
+    METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+    SLOW_QUERY_MS = env_int("SLOW_QUERY_MS", 200)  # 0 = off
+    QUERY_COUNT_WARN = env_int("QUERY_COUNT_WARN", 50)  # 0 = off
+    # response encoder: "auto" (orjson when installed, else the json module), "orjson" or "stdlib"
+    JSON_PROVIDER = os.getenv("JSON_PROVIDER", "auto")
+    # how long (seconds) a stored Idempotency-Key response is replayed; `flask prune-idempotency-keys` deletes older ones
+    IDEMPOTENCY_TTL = env_int("IDEMPOTENCY_TTL", 86400)
+    # most ids one GET /users?ids= or /books?ids= resolves (a single IN query)
+    BATCH_MAX_IDS = env_int("BATCH_MAX_IDS", 1000)
+    # how long (seconds) GET /changes history is kept; `flask prune-changes` deletes older entries
+    CHANGES_RETENTION = env_int("CHANGES_RETENTION", 7 * 86400)
+    # background jobs (app/jobs.py): pool threads per process, rows per committed chunk, the size above which
+    # delete_user / bulk import / transfer answer 202 with a job, and how long a silent running job keeps its claim
+    JOB_WORKERS = env_int("JOB_WORKERS", 2)
+    JOB_CHUNK_SIZE = env_int("JOB_CHUNK_SIZE", 1000)
+    JOB_INLINE_LIMIT = env_int("JOB_INLINE_LIMIT", 10000)
+    JOB_LEASE_SECONDS = env_int("JOB_LEASE_SECONDS", 300)
+    # pick up queued and abandoned jobs at the first request a process serves
+    JOB_RESUME = env_bool("JOB_RESUME", True)
+    # admission control (app/admission.py): requests in flight per class ("read" point reads and pages,
+    # "scan" searches and unpaged listings, "write"), how many more may wait and for how long before a
+    # 503 with Retry-After (seconds); ADMISSION_ADAPTIVE shrinks the limits when latency climbs
+    ADMISSION_CONTROL = env_bool("ADMISSION_CONTROL", False)
+    ADMISSION_LIMITS = env_budgets("ADMISSION_LIMITS", {"read": 16, "scan": 4, "write": 8})
+    ADMISSION_QUEUES = env_budgets("ADMISSION_QUEUES", {"read": 64, "scan": 8, "write": 32})
+    ADMISSION_QUEUE_TIMEOUT_MS = env_int("ADMISSION_QUEUE_TIMEOUT_MS", 500)
+    ADMISSION_RETRY_AFTER = env_int("ADMISSION_RETRY_AFTER", 1)
+    ADMISSION_ADAPTIVE = env_bool("ADMISSION_ADAPTIVE", False)
+    # async mode (asgi.py): threads that run the routes still served by the Flask app
+    ASYNC_WSGI_THREADS = env_int("ASYNC_WSGI_THREADS", 8)
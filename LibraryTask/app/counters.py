@@ -0,0 +1,82 @@
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from .engine import SHARD, current_shard, library_shard, sharded
+from .extensions import db
+from .models import Book, Library, library_book_count
+
+library = Library.__table__
+
+# book_count = book_count + :delta, run as one executemany for all touched libraries;
+# updated_at is set to itself so its onupdate does not fire for a counter move
+_adjust = (
+    update(library)
+    .where(library.c.id == bindparam("lib"))
+    .values(book_count=library.c.book_count + bindparam("delta"), updated_at=library.c.updated_at)
+)
+_set = (
+    update(library)
+    .where(library.c.id == bindparam("lib"))
+    .values(book_count=bindparam("count"), updated_at=library.c.updated_at)
+)
+
+
+def _shard_adjust(dialect):
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(library_book_count).values(library_id=bindparam("lib"), book_count=bindparam("delta"))
+    return stmt.on_conflict_do_update(
+        index_elements=[library_book_count.c.library_id],
+        set_={"book_count": library_book_count.c.book_count + stmt.excluded.book_count},
+    )
+
+
+def adjust_book_counts(deltas):
+    """Applies {library_id: delta} to Library.book_count inside the caller's transaction.
+    Inside on_shard() the counters are the shard's library_book_count rows instead."""
+    params = [{"lib": lib, "delta": delta} for lib, delta in deltas.items() if delta]
+    if not params:
+        return
+    if not sharded():
+        db.session.execute(_adjust, params)
+        return
+    shard = current_shard.get()
+    if shard is None:
+        raise RuntimeError("book counters live on the shards; adjust them inside on_shard()")
+    db.session.execute(_shard_adjust(db.engines[SHARD.format(shard)].dialect.name), params)
+
+
+def book_count_of(library):
+    """Library.book_count, or with BOOK_SHARDS the counter kept next to the library's books."""
+    if not sharded():
+        return library.book_count
+    with library_shard(library.id):
+        count = db.session.scalar(select(library_book_count.c.book_count).where(library_book_count.c.library_id == library.id))
+    return count or 0
+
+
+def forget_book_count(library_id):
+    """Drops a deleted library's shard counter; unsharded, the counter goes with the library row."""
+    if current_shard.get() is not None:
+        db.session.execute(delete(library_book_count).where(library_book_count.c.library_id == library_id))
+
+
+def reconcile_book_counts(fix=False, chunk_size=1000):
+    """Compares book_count with COUNT(*) of book, one range of library ids at a time.
+    Returns [(library_id, stored, actual)] for every library that drifted, repairing them when fix is set."""
+    drifted = []
+    last_id = 0
+    while True:
+        ids = db.session.scalars(
+            select(Library.id).where(Library.id > last_id).order_by(Library.id).limit(chunk_size)
+        ).all()
+        if not ids:
+            return drifted
+        actual = dict(db.session.execute(
+            select(Book.library_id, func.count()).where(Book.library_id.in_(ids)).group_by(Book.library_id)
+        ).all())
+        stored = db.session.execute(select(Library.id, Library.book_count).where(Library.id.in_(ids))).all()
+        bad = [(lib, count, actual.get(lib, 0)) for lib, count in stored if count != actual.get(lib, 0)]
+        if fix and bad:
+            db.session.execute(_set, [{"lib": lib, "count": real} for lib, _, real in bad])
+            db.session.commit()
+        drifted.extend(bad)
+        last_id = ids[-1]
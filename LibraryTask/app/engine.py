@@ -0,0 +1,132 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.util import find_tables
+
+REPLICA = "replica"
+# bind key of shard i when BOOK_SHARDS is set (app/sharding.py)
+SHARD = "shard{}"
+# tables that live on every shard instead of the primary when BOOK_SHARDS is set
+SHARDED_TABLES = frozenset({"book", "book_fts", "book_seq", "library_book_count", "author_stats", "daily_book_stats"})
+
+current_shard = ContextVar("current_shard", default=None)
+
+
+def engine_options(config, url):
+    """SQLALCHEMY_ENGINE_OPTIONS for url built from the DB_* settings."""
+    dialect = make_url(url).get_backend_name()
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    # SQLite connections are local file handles (and in-memory databases use a StaticPool),
+    # so queue sizing only matters for server databases
+    if dialect != "sqlite":
+        options.update(
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+        )
+    timeout = config["DB_STATEMENT_TIMEOUT_MS"]
+    if timeout and dialect == "postgresql":
+        options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    elif timeout and dialect == "mysql":
+        options["connect_args"] = {"init_command": f"SET SESSION max_execution_time={timeout}"}
+    return options
+
+
+def configure_engine(app):
+    """Fills in engine options (and the replica bind) before db.init_app reads them."""
+    config = app.config
+    config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **engine_options(config, config["SQLALCHEMY_DATABASE_URI"]),
+        **config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
+    replica = config["DATABASE_REPLICA_URL"]
+    if replica:
+        binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+        binds.setdefault(REPLICA, {"url": replica, **engine_options(config, replica)})
+        config["SQLALCHEMY_BINDS"] = binds
+    if config["BOOK_SHARDS"]:
+        binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+        for i, url in enumerate(config["BOOK_SHARDS"]):
+            binds.setdefault(SHARD.format(i), {"url": url, **engine_options(config, url)})
+        config["SQLALCHEMY_BINDS"] = binds
+
+
+def install_sqlite_pragmas(engine, config):
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+    ]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def init_engines(app, db):
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite":
+                install_sqlite_pragmas(engine, app.config)
+
+    if app.config["DATABASE_REPLICA_URL"]:
+        @app.before_request
+        def route_reads_to_replica():
+            g.db_read_replica = request.method in ("GET", "HEAD")
+
+
+def sharded():
+    return bool(current_app.config["BOOK_SHARDS"])
+
+
+def shard_of(library_id):
+    return library_id % len(current_app.config["BOOK_SHARDS"])
+
+
+@contextmanager
+def on_shard(index):
+    """Routes statements on SHARDED_TABLES to shard index until the block ends."""
+    token = current_shard.set(index)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+def library_shard(library_id):
+    """on_shard() for the shard holding this library's books; does nothing when sharding is off."""
+    return on_shard(shard_of(library_id)) if sharded() else nullcontext()
+
+
+def _touches_shards(mapper, clause):
+    if mapper is not None:
+        return mapper.local_table.name in SHARDED_TABLES
+    if clause is None:
+        return False
+    return any(t.name in SHARDED_TABLES for t in find_tables(clause, include_crud=True, include_joins=True))
+
+
+class RoutingSession(Session):
+    """Sends reads to the replica bind while g.db_read_replica is set; flushes always go to the primary.
+    With BOOK_SHARDS set, statements on SHARDED_TABLES go to the shard chosen with on_shard()."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and current_app.config["BOOK_SHARDS"] and _touches_shards(mapper, clause):
+            shard = current_shard.get()
+            if shard is None:
+                raise RuntimeError("statement on a sharded table outside of on_shard()")
+            return self._db.engines[SHARD.format(shard)]
+        if bind is None and not self._flushing and has_app_context() and g.get("db_read_replica"):
+            engine = self._db.engines.get(REPLICA)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -1,5 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from .admission import AdmissionControl
+from .cache import ResponseCache
+from .engine import RoutingSession
+from .metrics import RequestMetrics
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
+cache = ResponseCache()
+metrics = RequestMetrics()
+admission = AdmissionControl()
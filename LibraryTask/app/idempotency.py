@@ -0,0 +1,95 @@
+"""Idempotency-Key for POST routes, so clients can retry a create or transfer after a timeout.
+
+The first request with a key runs and its response is stored under the key; a retry with the same
+key and body gets that response back (with Idempotent-Replayed: true) instead of running again.
+The key row is inserted in the view's own transaction, so it commits together with the view's
+writes, and a concurrent duplicate collides on the primary key instead of running the view twice.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, current_app, jsonify, make_response, request
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def fingerprint(req):
+    h = hashlib.sha256()
+    for part in (req.method.encode(), req.full_path.encode(), req.get_data()):
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def expired(record):
+    return record.created_at < datetime.utcnow() - timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"])
+
+
+def replay(record, digest):
+    if record is not None and record.request_hash != digest:
+        return jsonify({"error": f"{HEADER} was already used for a different request"}), 422
+    if record is None or record.status is None:
+        return jsonify({"error": f"a request with this {HEADER} is still in progress"}), 409
+    resp = Response(record.body, status=record.status, mimetype=record.mimetype)
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def store(key, digest, resp):
+    # the view may have rolled its transaction (and the claim with it) back, e.g. on a 409
+    record = db.session.get(IdempotencyKey, key)
+    if record is None:
+        record = IdempotencyKey(key=key, request_hash=digest)
+        db.session.add(record)
+    record.status = resp.status_code
+    record.body = resp.get_data(as_text=True)
+    record.mimetype = resp.mimetype
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+
+def idempotent(view):
+    """Decorator for POST views; requests without the header run as before."""
+    @wraps(view)
+    def wrapper(**kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(**kwargs)
+        if len(key) > 255:
+            return jsonify({"error": f"{HEADER} must be at most 255 characters"}), 400
+        digest = fingerprint(request)
+
+        record = db.session.get(IdempotencyKey, key)
+        if record is not None and not expired(record):
+            return replay(record, digest)
+        if record is None:
+            db.session.add(IdempotencyKey(key=key, request_hash=digest))
+        else:
+            # an expired key is reused as if it were new
+            record.request_hash, record.status, record.body, record.created_at = digest, None, None, datetime.utcnow()
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return replay(db.session.get(IdempotencyKey, key), digest)
+
+        resp = make_response(view(**kwargs))
+        if resp.status_code >= 500 or resp.is_streamed:
+            db.session.rollback()
+            return resp
+        store(key, digest, resp)
+        return resp
+    return wrapper
+
+
+def prune_idempotency_keys(ttl):
+    """Deletes keys older than ttl seconds; returns how many went."""
+    result = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < datetime.utcnow() - timedelta(seconds=ttl)))
+    db.session.commit()
+    return result.rowcount
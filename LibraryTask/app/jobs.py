@@ -0,0 +1,240 @@
+"""Background jobs for work too big for one request: deleting a user with a large library, bulk
+imports, filtered transfers, reindexing.
+
+A job is a row in the job table, so it outlives the process that queued it. Each process runs jobs
+on a small thread pool; a worker claims a job with a conditional UPDATE (queued, or running with a
+heartbeat older than JOB_LEASE_SECONDS), so two processes never run the same job at once. Handlers
+work in chunks and call ctx.checkpoint() before committing each one: the job row's progress and
+state are written in the same transaction as the chunk, so a job interrupted by a restart resumes
+after the last chunk that committed. Queued and abandoned jobs are picked up again at the first
+request a process serves (JOB_RESUME) or with `flask run-jobs`.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from flask import current_app, jsonify, request, url_for
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from .extensions import db
+from .models import Job
+
+log = logging.getLogger("app.jobs")
+
+# a job whose worker died this many times is failed instead of being picked up again
+MAX_ATTEMPTS = 3
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Registers fn(ctx) as the handler for jobs of this kind; its return value becomes the job result."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def job_json(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def prefers_async(req):
+    return "respond-async" in req.headers.get("Prefer", "")
+
+
+def wants_async(req, size):
+    """Prefer: respond-async, or more than JOB_INLINE_LIMIT rows to touch."""
+    return prefers_async(req) or (size is not None and size > current_app.config["JOB_INLINE_LIMIT"])
+
+
+def accepted(job):
+    """202 for a queued job, pointing at GET /jobs/<id>."""
+    resp = jsonify(job_json(job))
+    resp.status_code = 202
+    resp.headers["Location"] = url_for("get_job", job_id=job.id)
+    if prefers_async(request):
+        resp.headers["Preference-Applied"] = "respond-async"
+    return resp
+
+
+class JobContext:
+    """What a handler sees: its params, where the last committed chunk left off, and checkpoint()."""
+
+    def __init__(self, job):
+        self.id = job.id
+        self.params = json.loads(job.params)
+        self.progress = job.progress
+        self.total = job.total
+        # running state kept between chunks (counters, partial summaries); becomes the result if unset
+        self.state = json.loads(job.result) if job.result else {}
+        self.chunk_size = current_app.config["JOB_CHUNK_SIZE"]
+
+    def checkpoint(self, progress, total=None, state=None):
+        """Records progress in the caller's open transaction; the handler's next commit makes it durable
+        together with the chunk it describes."""
+        self.progress = progress
+        if total is not None:
+            self.total = total
+        if state is not None:
+            self.state = state
+        db.session.execute(update(Job).where(Job.id == self.id).values(
+            progress=self.progress, total=self.total, result=json.dumps(self.state), heartbeat_at=datetime.utcnow(),
+        ))
+
+
+def _claim(job_id, lease):
+    now = datetime.utcnow()
+    claimable = or_(Job.status == "queued", (Job.status == "running") & (Job.heartbeat_at < now - lease))
+    result = db.session.execute(
+        update(Job).where(Job.id == job_id, claimable, Job.attempts < MAX_ATTEMPTS)
+        .values(status="running", attempts=Job.attempts + 1, started_at=func.coalesce(Job.started_at, now), heartbeat_at=now)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _finish(job_id, **values):
+    db.session.execute(update(Job).where(Job.id == job_id).values(finished_at=datetime.utcnow(), **values))
+    db.session.commit()
+
+
+def run_job(job_id):
+    """Claims and runs one job in the current app context. Returns False if it was not claimable."""
+    if not _claim(job_id, timedelta(seconds=current_app.config["JOB_LEASE_SECONDS"])):
+        return False
+    job = db.session.get(Job, job_id)
+    fn = HANDLERS.get(job.kind)
+    try:
+        if fn is None:
+            raise LookupError(f"no handler for job kind {job.kind!r}")
+        ctx = JobContext(job)
+        result = fn(ctx)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.exception("job %s (%s) failed", job_id, job.kind)
+        _finish(job_id, status="failed", error=f"{type(e).__name__}: {e}")
+    else:
+        _finish(job_id, status="done", progress=ctx.progress, total=ctx.total,
+                result=json.dumps(ctx.state if result is None else result))
+    return True
+
+
+class JobQueue:
+    """Per-app thread pool (JOB_WORKERS threads; 0 runs jobs inline, after the caller's commit)."""
+
+    def init_app(self, app):
+        app.extensions["jobs"] = _Runner(app)
+        if app.config["JOB_RESUME"] and app.config["JOB_WORKERS"]:
+            @app.before_request
+            def resume_jobs():
+                app.extensions["jobs"].resume_once()
+
+    @property
+    def runner(self):
+        return current_app.extensions["jobs"]
+
+    def enqueue(self, kind, total=None, **params):
+        """Inserts and commits the job row, then hands it to the pool."""
+        job = Job(kind=kind, status="queued", params=json.dumps(params), total=total)
+        db.session.add(job)
+        db.session.commit()
+        self.runner.submit(job.id)
+        if not self.runner.workers:
+            db.session.refresh(job)  # already finished, in another session
+        return job
+
+    def join(self):
+        self.runner.join()
+
+    def resume(self):
+        self.runner.resume()
+
+
+class _Runner:
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config["JOB_WORKERS"]
+        self.executor = None
+        self.futures = []
+        self.lock = threading.Lock()
+        self.resumed = False
+
+    def _run(self, job_id):
+        # a fresh app context gets its own scoped session
+        with self.app.app_context():
+            try:
+                run_job(job_id)
+            finally:
+                db.session.remove()
+
+    def _submit(self, fn, *args):
+        # callers hold self.lock
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        self.futures = [f for f in self.futures if not f.done()]
+        self.futures.append(self.executor.submit(fn, *args))
+
+    def submit(self, job_id):
+        if not self.workers:
+            self._run(job_id)
+            return
+        with self.lock:
+            self._submit(self._run, job_id)
+
+    def pending_ids(self):
+        lease = timedelta(seconds=self.app.config["JOB_LEASE_SECONDS"])
+        with self.app.app_context():
+            try:
+                stale = (Job.status == "running") & (Job.heartbeat_at < datetime.utcnow() - lease)
+                given_up = db.session.execute(update(Job).where(stale, Job.attempts >= MAX_ATTEMPTS).values(
+                    status="failed", error=f"abandoned after {MAX_ATTEMPTS} attempts", finished_at=datetime.utcnow()))
+                db.session.commit()
+                if given_up.rowcount:
+                    log.warning("%d abandoned jobs marked failed", given_up.rowcount)
+                return db.session.scalars(select(Job.id).where(or_(Job.status == "queued", stale)).order_by(Job.id)).all()
+            except SQLAlchemyError:
+                # e.g. the job table has not been migrated yet
+                db.session.rollback()
+                log.exception("could not look for jobs to resume")
+                return []
+            finally:
+                db.session.remove()
+
+    def resume(self):
+        for job_id in self.pending_ids():
+            self.submit(job_id)
+
+    def resume_once(self):
+        with self.lock:
+            if self.resumed:
+                return
+            self.resumed = True
+            # looked up on a worker so the request that triggers it does not wait
+            self._submit(self.resume)
+
+    def join(self):
+        # resume() may submit more while we wait
+        while True:
+            with self.lock:
+                futures = [f for f in self.futures if not f.done()]
+            if not futures:
+                return
+            wait(futures)
+
+
+jobs = JobQueue()
@@ -0,0 +1,63 @@
+import json
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib provider below is the fallback
+    orjson = None
+
+
+def _default(o):
+    # naive datetimes are UTC throughout the app (datetime.utcnow), rendered as ISO 8601 with "Z"
+    if isinstance(o, datetime):
+        return o.isoformat() + "Z" if o.tzinfo is None else o.isoformat()
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+class StdlibJSONProvider(JSONProvider):
+    """json module with native datetime support; no key sorting or pretty printing."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault("default", _default)
+        kwargs.setdefault("ensure_ascii", False)
+        kwargs.setdefault("separators", (",", ":"))
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps(obj) + "\n", mimetype=self.mimetype)
+
+
+class OrjsonProvider(JSONProvider):
+    """orjson encodes datetimes, dataclasses and dicts in C; same output as StdlibJSONProvider."""
+
+    mimetype = "application/json"
+    options = (orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self.options | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app):
+    """JSON_PROVIDER: "auto" (orjson when installed), "orjson" or "stdlib"."""
+    choice = app.config["JSON_PROVIDER"]
+    if choice == "orjson" and orjson is None:
+        raise RuntimeError("JSON_PROVIDER=orjson but orjson is not installed")
+    use_orjson = orjson is not None and choice in ("auto", "orjson")
+    app.json = OrjsonProvider(app) if use_orjson else StdlibJSONProvider(app)
@@ -0,0 +1,35 @@
+"""The hottest point reads as cached lambda statements on the Core tables.
+
+A select() of ORM entities goes through the ORM's compile step, autoflush and instance hydration even
+when a route only needs a few columns or wants to know that a row exists. These are built on the
+tables instead, so the session runs them as plain Core statements (no autoflush, no identity map) and
+returns Rows. lambda_stmt keys its cache on the lambda's code: after the first call a lookup only binds
+its arguments, without building or compiling a select().
+"""
+from sqlalchemy import lambda_stmt, literal_column, select
+from .extensions import db
+from .models import Library, User
+
+user = User.__table__
+library = Library.__table__
+
+
+def user_with_library(user_id):
+    """(id, username, version_id, library_id, library_name, library_version_id) of a user, in one
+    LEFT JOIN; the library_* columns are None for a user without a library. None if there is no user."""
+    return db.session.execute(lambda_stmt(lambda: select(
+        user.c.id, user.c.username, user.c.version_id, library.c.id.label("library_id"),
+        library.c.name.label("library_name"), library.c.version_id.label("library_version_id"),
+    ).select_from(user.outerjoin(library, library.c.user_id == user.c.id)).where(user.c.id == user_id))).first()
+
+
+def library_of_user(user_id):
+    """(id, book_count) of the user's library, or None."""
+    return db.session.execute(lambda_stmt(
+        lambda: select(library.c.id, library.c.book_count).where(library.c.user_id == user_id))).first()
+
+
+def library_exists(library_id):
+    # SELECT 1 FROM library WHERE id = ?: answered from the primary key alone
+    return db.session.execute(lambda_stmt(
+        lambda: select(literal_column("1")).select_from(library).where(library.c.id == library_id))).first() is not None
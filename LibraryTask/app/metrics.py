@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import Response, g, has_request_context, request
+from flask.json.provider import JSONProvider
+from sqlalchemy import event
+
+slow_query_log = logging.getLogger("app.slow_query")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+
+# the figures of a request served outside Flask's request context (the async views of asgi.py)
+current_metrics = ContextVar("current_metrics", default=None)
+
+
+def request_counters():
+    """The current request's figures, or None when it is not being measured."""
+    if has_request_context():
+        return g.get("metrics")
+    return current_metrics.get()
+
+
+def start_counters(endpoint):
+    return {"endpoint": endpoint, "start": time.perf_counter(), "queries": 0, "db": 0.0, "serialize": 0.0}
+
+
+# ---------------- Prometheus text format ----------------
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            s = self.series.setdefault(label, [0] * (len(self.buckets) + 1) + [0.0])
+            s[bisect_left(self.buckets, value)] += 1
+            s[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for endpoint, s in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip([*self.buckets, "+Inf"], s[:-1]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{endpoint="{endpoint}"}} {s[-1]}')
+                lines.append(f'{self.name}_count{{endpoint="{endpoint}"}} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self, slow_ms=0, count_warn=0):
+        self.slow_ms = slow_ms
+        self.count_warn = count_warn
+        self.latency = Histogram("http_request_duration_seconds", "Total request latency.", LATENCY_BUCKETS)
+        self.db_time = Histogram("http_request_db_seconds", "Time spent in database calls per request.", LATENCY_BUCKETS)
+        self.serialize_time = Histogram("http_request_serialize_seconds", "Time spent encoding JSON per request.", LATENCY_BUCKETS)
+        self.queries = Histogram("http_request_queries", "Statements executed per request.", QUERY_BUCKETS)
+        self.collectors = []  # other extensions' callables returning more exposition lines
+
+    def render(self):
+        lines = []
+        for h in (self.latency, self.db_time, self.serialize_time, self.queries):
+            lines.extend(h.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+    def watch(self, engine):
+        """Adds engine's statements to the current request's figures and logs the slow ones."""
+        event.listen(engine, "before_cursor_execute", _start_statement)
+        event.listen(engine, "after_cursor_execute", self._end_statement)
+
+    def _end_statement(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        m = request_counters()
+        if m is not None:
+            m["queries"] += 1
+            m["db"] += elapsed
+        if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+            slow_query_log.warning("slow query %.1fms on %s: %s", elapsed * 1000, m and m["endpoint"], statement)
+
+    def record(self, m):
+        """Adds a finished request's figures to the histograms; returns its Server-Timing header."""
+        total = time.perf_counter() - m["start"]
+        endpoint = m["endpoint"] or "unmatched"
+        self.latency.observe(endpoint, total)
+        self.db_time.observe(endpoint, m["db"])
+        self.serialize_time.observe(endpoint, m["serialize"])
+        self.queries.observe(endpoint, m["queries"])
+        if self.count_warn and m["queries"] > self.count_warn:
+            slow_query_log.warning("%s ran %d queries (%.1fms in the database)", endpoint, m["queries"], m["db"] * 1000)
+        return (f'db;dur={m["db"] * 1000:.2f};desc="{m["queries"]} queries", '
+                f'serialize;dur={m["serialize"] * 1000:.2f}, '
+                f'total;dur={total * 1000:.2f}')
+
+
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+# ---------------- hooks ----------------
+
+class TimedJSONProvider(JSONProvider):
+    """Wraps the app's JSON provider and adds encoding time to the current request's counters."""
+
+    def __init__(self, app, inner):
+        super().__init__(app)
+        self.inner = inner
+
+    def _timed(self, fn, *args, **kwargs):
+        m = request_counters()
+        if m is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            m["serialize"] += time.perf_counter() - start
+
+    def dumps(self, obj, **kwargs):
+        return self._timed(self.inner.dumps, obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return self.inner.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        return self._timed(self.inner.response, *args, **kwargs)
+
+
+class RequestMetrics:
+    """Per-endpoint query count, DB time, serialization time and latency.
+
+    Exposed on each response as a Server-Timing header and in aggregate at GET /metrics.
+    Statements slower than SLOW_QUERY_MS, and requests running more than QUERY_COUNT_WARN
+    statements (an N+1 loop, typically), are logged to "app.slow_query" with their route.
+    Figures are per process.
+    """
+
+    def init_app(self, app, db):
+        if not app.config["METRICS_ENABLED"]:
+            return
+        registry = app.extensions["metrics"] = Registry(app.config["SLOW_QUERY_MS"], app.config["QUERY_COUNT_WARN"])
+        app.json = TimedJSONProvider(app, app.json)
+        with app.app_context():
+            for engine in db.engines.values():
+                registry.watch(engine)
+
+        @app.before_request
+        def start_request_metrics():
+            g.metrics = start_counters(request.endpoint)
+
+        @app.after_request
+        def record_request_metrics(response):
+            m = g.pop("metrics", None)
+            if m is None or request.endpoint == "metrics":
+                return response
+            response.headers.add("Server-Timing", registry.record(m))
+            return response
+
+        @app.get("/metrics")
+        def metrics():
+            return Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -4,16 +4,125 @@ from .extensions import db
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(255), unique=True, nullable=False)
+    # optimistic concurrency: the ORM adds "AND version_id = <loaded>" to every UPDATE/DELETE and bumps it;
+    # ETags and If-Match are built on it (app/versioning.py)
+    version_id = db.Column(db.Integer, nullable=False, server_default="1")
+    # set on insert and by every UPDATE, ORM or Core (onupdate applies to both)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __mapper_args__ = {"version_id_col": version_id}
+
+    library = db.relationship("Library", back_populates="user", uselist=False)
 
 class Library(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
 
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), unique=True, nullable=False)
+    # maintained by every book write path (app/counters.py); `flask reconcile-book-counts` repairs drift
+    book_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # book_count moves do not bump it: the counter is not part of what a client edits
+    version_id = db.Column(db.Integer, nullable=False, server_default="1")
+    # counter updates leave it alone too (app/counters.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __mapper_args__ = {"version_id_col": version_id}
+
+    user = db.relationship("User", back_populates="library")
+    # write_only: a library can hold far too many books to ever load as a list
+    books = db.relationship("Book", back_populates="library", lazy="write_only", passive_deletes=True)
 
 class Book(db.Model):
+    __table_args__ = (
+        # keyset pagination seeks: GET /books and GET /libraries/<id>/books
+        db.Index("ix_book_created_at_id", "created_at", "id"),
+        db.Index("ix_book_library_id_created_at_id", "library_id", "created_at", "id"),
+        # transfers filtered by author walk matches in id order, chunk by chunk
+        db.Index("ix_book_author_id", "author", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     author = db.Column(db.String(255), nullable=False)
     library_id = db.Column(db.Integer, db.ForeignKey("library.id"), nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Core bulk updates (bulk PATCH, transfers) bump it themselves
+    version_id = db.Column(db.Integer, nullable=False, server_default="1")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    library = db.relationship("Library", back_populates="books")
+
+    __mapper_args__ = {"version_id_col": version_id}
+
+# one row per Idempotency-Key seen on a POST (app/idempotency.py); status stays NULL until the response is stored
+class IdempotencyKey(db.Model):
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer)
+    body = db.Column(db.Text)
+    mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+# background work run by app/jobs.py; params and result are JSON text
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # queued -> running -> done | failed
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    params = db.Column(db.Text, nullable=False)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    # refreshed by every checkpoint; a running job that stops beating is picked up again
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+# written by the triggers in app/changes.py, read by GET /changes; id is the feed order
+class Change(db.Model):
+    __tablename__ = "change_log"
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(20), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    # insert | update | delete
+    op = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp(), index=True)
+
+# rollups for GET /stats, kept by the triggers in app/stats.py; `flask rebuild-stats` recomputes them
+class AuthorStats(db.Model):
+    __tablename__ = "author_stats"
+
+    author = db.Column(db.String(255), primary_key=True)
+    book_count = db.Column(db.Integer, nullable=False)
+
+# top authors: ORDER BY book_count DESC, author LIMIT n reads the first n entries
+db.Index("ix_author_stats_top", AuthorStats.book_count.desc(), AuthorStats.author)
+
+class DailyBookStats(db.Model):
+    __tablename__ = "daily_book_stats"
+
+    # UTC day of Book.created_at
+    day = db.Column(db.Date, primary_key=True)
+    book_count = db.Column(db.Integer, nullable=False)
+
+# tables that only exist on the book shards (BOOK_SHARDS, app/sharding.py), created by `flask init-shards`
+# together with a copy of book; they are not part of db.metadata, so migrations leave them alone
+shard_metadata = db.MetaData()
+
+# a single row handing out this shard's book ids (app/sharding.py explains the numbering)
+book_seq = db.Table(
+    "book_seq", shard_metadata,
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("next_value", db.Integer, nullable=False),
+)
+
+# Library.book_count for the libraries on this shard, so a book write never touches the primary
+library_book_count = db.Table(
+    "library_book_count", shard_metadata,
+    db.Column("library_id", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("book_count", db.Integer, nullable=False),
+)
@@ -0,0 +1,74 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import DateTime, Integer, String, tuple_
+
+
+class Page:
+    def __init__(self, limit, after=None):
+        self.limit = limit
+        self.after = after
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, keys):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("invalid cursor")
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("invalid cursor")
+    try:
+        return [_key_value(k, v) for k, v in zip(keys, values)]
+    except (TypeError, ValueError):
+        raise ValueError("invalid cursor")
+
+
+def _key_value(key, v):
+    # a cursor is client input: every value must have its key's type before it reaches the WHERE clause
+    if isinstance(key.type, DateTime):
+        return datetime.fromisoformat(v)
+    if isinstance(key.type, Integer) and not (isinstance(v, int) and not isinstance(v, bool)):
+        raise ValueError("invalid cursor")
+    if isinstance(key.type, String) and not isinstance(v, str):
+        raise ValueError("invalid cursor")
+    return v
+
+
+def page_request(args, keys, default_limit, max_limit):
+    """Returns a Page when the client asked for one (limit or cursor), otherwise None."""
+    if "limit" not in args and "cursor" not in args:
+        return None
+    limit = args.get("limit", default_limit)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+    cursor = args.get("cursor")
+    return Page(limit, decode_cursor(cursor, keys) if cursor else None)
+
+
+def seek(query, keys, page):
+    """Keyset page: WHERE (keys) > (cursor) ORDER BY keys LIMIT n, so deep pages cost the same as the first."""
+    return split_page(seek_statement(query, keys, page).all(), keys, page)
+
+
+# the two halves of seek, for callers that run the statement themselves (e.g. on an AsyncSession)
+def seek_statement(query, keys, page):
+    if page.after is not None:
+        query = query.filter(tuple_(*keys) > tuple_(*page.after))
+    return query.order_by(*keys).limit(page.limit + 1)
+
+
+def split_page(rows, keys, page):
+    items = rows[:page.limit]
+    next_cursor = None
+    if len(rows) > page.limit:
+        next_cursor = encode_cursor([getattr(items[-1], k.key) for k in keys])
+    return items, next_cursor
@@ -1,77 +1,286 @@
-from flask import request, jsonify
+import heapq
+from collections import Counter
+from datetime import date, datetime, timedelta
+from functools import wraps
+from flask import Response, current_app, request, jsonify, stream_with_context
+from sqlalchemy import delete, func, select
 from sqlalchemy.exc import IntegrityError
-from .extensions import db
-from .models import User, Library, Book
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from .admission import scans
+from .extensions import cache, db
+from .models import User, Library, Book, Job, library_book_count
+from .changes import ChangesExpired, head_token, parse_since, read_changes
+from .counters import adjust_book_counts, book_count_of, forget_book_count
+from .engine import library_shard, on_shard, shard_of, sharded
+from .sharding import by_shard, fan_out, move_book, next_book_ids, shard_count
+from .stats import daily_counts, top_authors
+from .bulk import BadItem, chunks, create_books, existing_ids, is_id, library_ids_of, parse_items, parse_transfer, transfer_books, update_books
+from .idempotency import idempotent
+from .lookups import library_exists, library_of_user, user_with_library
+from .jobs import accepted, job_json, jobs, wants_async
+from .versioning import etag, etag_of, precondition_failed, stale_write, tagged
+from .pagination import page_request, seek, seek_statement, split_page
+from .streaming import NDJSON, json_array_rows, ndjson_rows, wants_stream
+
+
+# listings select just these columns and get light Row tuples back instead of hydrated Books
+BOOK_COLUMNS = (Book.id, Book.title, Book.author, Book.library_id, Book.created_at)
+BOOK_FIELDS = tuple(c.key for c in BOOK_COLUMNS)
+BOOK_KEYS = (Book.created_at, Book.id)
+
+
+# same dict as book_json from a BOOK_COLUMNS row; zip over the tuple is several times cheaper than Row attributes
+def book_row_json(r):
+    return dict(zip(BOOK_FIELDS, r))
+
+
+def user_json(u):
+    lib = u.library
+    return {
+        "id": u.id,
+        "username": u.username,
+        "library": {"id": lib.id, "name": lib.name} if lib else None
+    }
+
+
+# user_json from a lookups.user_with_library row
+def user_row_json(r):
+    return {
+        "id": r.id,
+        "username": r.username,
+        "library": {"id": r.library_id, "name": r.library_name} if r.library_id is not None else None
+    }
+
+
+def library_json(l):
+    return {"id": l.id, "name": l.name, "user_id": l.user_id}
+
+
+# ?fields=id,title keeps only those columns in the SELECT; None means the full row
+def requested_fields(args):
+    raw = args.get("fields", type=str)
+    if not raw:
+        return None
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in BOOK_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"unknown fields {unknown}; choose from {list(BOOK_FIELDS)}")
+    return fields
+
+
+# requested columns first, then any keyset column a page cursor needs; zip stops at the requested ones
+def book_projection(fields, paged):
+    if fields is None:
+        return BOOK_COLUMNS, book_row_json
+    columns = [getattr(Book, f) for f in fields]
+    if paged:
+        columns += [k for k in BOOK_KEYS if k.key not in fields]
+    return columns, lambda r: dict(zip(fields, r))
+
+
+# ?ids=3,1,3 -> [3, 1, 3]; None without ?ids=
+def requested_ids(args, max_ids):
+    raw = args.get("ids", type=str)
+    if raw is None:
+        return None
+    try:
+        ids = [int(i) for i in raw.split(",") if i.strip()]
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of integers")
+    if not ids:
+        raise ValueError("ids must not be empty")
+    if len(ids) > max_ids:
+        raise ValueError(f"at most {max_ids} ids per request")
+    return ids
+
+
+# ?limit= for the endpoints that return one bounded list rather than pages
+def requested_limit(args, default, maximum):
+    limit = args.get("limit", default, type=int)
+    if not 1 <= limit <= maximum:
+        raise ValueError(f"limit must be between 1 and {maximum}")
+    return limit
+
+
+# one entry per requested id, in request order (repeats included), shaped like the bulk results
+def batch_results(ids, rows, name, to_json):
+    found = {r.id: r for r in rows}
+    return {"results": [
+        {"id": i, "status": 200, name: to_json(found[i])} if i in found else {"id": i, "status": 404, "error": f"{name} not found"}
+        for i in ids
+    ]}
+
+
+# like book_projection, plus the id the rows are matched back by
+def batch_projection(fields):
+    columns, to_json = book_projection(fields, False)
+    if fields is not None and "id" not in fields:
+        columns = [*columns, Book.id]
+    return columns, to_json
 
 
 def register_routes(app):
 
+    # the JSON provider renders created_at
     def book_json(b):
         return {
             "id": b.id,
             "title": b.title,
             "author": b.author,
             "library_id": b.library_id,
-            "created_at": b.created_at.isoformat() + "Z",
+            "created_at": b.created_at,
         }
 
+    def book_rows():
+        return db.session.query(*BOOK_COLUMNS)
+
+    # library_id narrows a sharded listing down to the shard holding that library
+    def book_listing(query_filters, library_id=None):
+        if sharded():
+            shards = [shard_of(library_id)] if library_id is not None else range(shard_count())
+            return sharded_book_listing(shards, query_filters)
+        try:
+            fields = requested_fields(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        columns, to_json = book_projection(fields, "limit" in request.args or "cursor" in request.args)
+        query, rank = query_filters(db.session.query(*columns))
+        return listing(query, list(BOOK_KEYS), to_json, streamable=True, order=rank)
+
+    # plain JSON array by default; {"items", "next_cursor"} once ?limit= or ?cursor= is given
+    # order (e.g. search rank) applies to full listings; pages always follow the keyset order
+    def listing(query, keys, to_json, streamable=False, order=None):
+        try:
+            page = page_request(request.args, keys, current_app.config["DEFAULT_PAGE_SIZE"], current_app.config["MAX_PAGE_SIZE"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        mode = wants_stream(request) if streamable else None
+        if page is None and order is not None:
+            query = query.order_by(order)
+        if page is None and mode:
+            return stream_listing(query, to_json, mode)
+        if page is None:
+            return jsonify([to_json(x) for x in query.all()]), 200
+        items, next_cursor = seek(query, keys, page)
+        return jsonify({"items": [to_json(x) for x in items], "next_cursor": next_cursor}), 200
+
+    # every shard answers the same keyset-ordered statement and the rows are merged on (created_at, id);
+    # search results (?q=) therefore come back in that order rather than by rank
+    def sharded_book_listing(shards, query_filters):
+        try:
+            columns, to_json = book_projection(requested_fields(request.args), True)
+            page = page_request(request.args, list(BOOK_KEYS), current_app.config["DEFAULT_PAGE_SIZE"], current_app.config["MAX_PAGE_SIZE"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query, _ = query_filters(db.session.query(*columns))
+        query = seek_statement(query, list(BOOK_KEYS), page) if page else query.order_by(*BOOK_KEYS)
+        key = lambda r: (r.created_at, r.id)
+        mode = wants_stream(request)
+        if page is None and mode:
+            results = []
+            for shard in shards:
+                with on_shard(shard):
+                    results.append(db.session.execute(query.statement.execution_options(yield_per=current_app.config["STREAM_BATCH_SIZE"])))
+            return stream_listing(heapq.merge(*results, key=key), to_json, mode)
+        rows = list(heapq.merge(*fan_out(query.statement, shards), key=key))
+        if page is None:
+            return jsonify([to_json(x) for x in rows]), 200
+        items, next_cursor = split_page(rows[:page.limit + 1], list(BOOK_KEYS), page)
+        return jsonify({"items": [to_json(x) for x in items], "next_cursor": next_cursor}), 200
+
+    # constant-memory export: rows are read with yield_per and encoded as they arrive
+    def stream_listing(query, to_json, mode):
+        rows = ndjson_rows if mode == "ndjson" else json_array_rows
+        body = rows(query, to_json, app.json.dumps, current_app.config["STREAM_BATCH_SIZE"])
+        mimetype = NDJSON if mode == "ndjson" else "application/json"
+        return Response(stream_with_context(body), status=200, mimetype=mimetype)
+
+    # ?ids=: every id in one IN query; other filters and paging do not apply
+    def batch_read(fetch, name, to_json):
+        try:
+            ids = requested_ids(request.args, current_app.config["BATCH_MAX_IDS"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(batch_results(ids, fetch(sorted(set(ids))), name, to_json)), 200
+
+    # rows for these book ids; every shard is asked at once when books are sharded
+    def books_by_id(columns, ids):
+        stmt = select(*columns).where(Book.id.in_(ids))
+        if sharded():
+            return [r for rows in fan_out(stmt) for r in rows]
+        return db.session.execute(stmt).all()
+
+    # runs a /books/<book_id> view on the shard holding the book
+    def on_book_shard(view):
+        @wraps(view)
+        def wrapper(book_id, **kwargs):
+            if not sharded():
+                return view(book_id=book_id, **kwargs)
+            found = library_ids_of([book_id])
+            if book_id not in found:
+                return jsonify({"error": "book not found"}), 404
+            with on_shard(shard_of(found[book_id])):
+                return view(book_id=book_id, **kwargs)
+        return wrapper
+
+    def not_when_sharded():
+        return jsonify({"error": "not available while books are sharded (BOOK_SHARDS)"}), 501
+
+    # user + library in a single statement (or two with selectin, never one per user)
+    def users_with_library():
+        loader = selectinload if current_app.config["USER_LIBRARY_LOADING"] == "selectin" else joinedload
+        return User.query.options(loader(User.library))
+
     # ---------------- Users CRUD ----------------
 
     @app.post("/users")
+    @idempotent
     def create_user():
         d = request.get_json() or {}
         if not d.get("username") or not d.get("library_name"):
             return jsonify({"error": "username and library_name are required"}), 400
 
-        u = User(username=d["username"])
+        u = User(username=d["username"], library=Library(name=d["library_name"]))
         db.session.add(u)
-        db.session.flush()  # get u.id
-
-        db.session.add(Library(name=d["library_name"], user_id=u.id))
 
         try:
+            db.session.flush()  # get u.id
+            user_id = u.id
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
             return jsonify({"error": "username already exists"}), 409
+        cache.invalidate(f"user:{user_id}", "libraries")
 
-        lib = Library.query.filter_by(user_id=u.id).first()
-        return jsonify({
-            "id": u.id,
-            "username": u.username,
-            "library": {"id": lib.id, "name": lib.name}
-        }), 201
+        u = users_with_library().filter(User.id == user_id).first()
+        return tagged(jsonify(user_json(u)), u, u.library), 201
 
     @app.get("/users")
+    @scans
     def list_users():
-        users = User.query.all()
-        out = []
-        for u in users:
-            lib = Library.query.filter_by(user_id=u.id).first()
-            out.append({
-                "id": u.id,
-                "username": u.username,
-                "library": {"id": lib.id, "name": lib.name} if lib else None
-            })
-        return jsonify(out), 200
+        if "ids" in request.args:
+            return batch_read(lambda ids: users_with_library().filter(User.id.in_(ids)).all(), "user", user_json)
+        return listing(users_with_library(), [User.id], user_json)
 
     @app.get("/users/<int:user_id>")
+    @cache.cached("user:{user_id}")
     def get_user(user_id):
-        u = db.session.get(User, user_id)
-        if not u:
+        r = user_with_library(user_id)
+        if not r:
             return jsonify({"error": "user not found"}), 404
-        lib = Library.query.filter_by(user_id=user_id).first()
-        return jsonify({
-            "id": u.id,
-            "username": u.username,
-            "library": {"id": lib.id, "name": lib.name} if lib else None
-        }), 200
+        resp = jsonify(user_row_json(r))
+        resp.set_etag(etag_of(r.version_id, r.library_version_id))
+        return resp, 200
 
     @app.put("/users/<int:user_id>")
     def update_user(user_id):
-        u = db.session.get(User, user_id)
+        u = users_with_library().filter(User.id == user_id).first()
         if not u:
             return jsonify({"error": "user not found"}), 404
+        failed = precondition_failed(etag(u, u.library))
+        if failed:
+            return failed
 
         d = request.get_json() or {}
 
@@ -83,132 +292,456 @@ def register_routes(app):
         if "library_name" in d:
             if not d["library_name"]:
                 return jsonify({"error": "library_name is required"}), 400
-            lib = Library.query.filter_by(user_id=user_id).first()
-            if lib:
-                lib.name = d["library_name"]
+            if u.library:
+                u.library.name = d["library_name"]
 
         try:
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
             return jsonify({"error": "username already exists"}), 409
+        except StaleDataError:
+            return stale_write()
+        cache.invalidate(f"user:{user_id}", "libraries")
 
-        lib = Library.query.filter_by(user_id=user_id).first()
-        return jsonify({
-            "id": u.id,
-            "username": u.username,
-            "library": {"id": lib.id, "name": lib.name} if lib else None
-        }), 200
+        u = users_with_library().filter(User.id == user_id).first()
+        return tagged(jsonify(user_json(u)), u, u.library), 200
 
     @app.delete("/users/<int:user_id>")
     def delete_user(user_id):
-        u = db.session.get(User, user_id)
+        u = users_with_library().filter(User.id == user_id).first()
         if not u:
             return jsonify({"error": "user not found"}), 404
+        failed = precondition_failed(etag(u, u.library))
+        if failed:
+            return failed
+
+        lib = u.library
+        book_count = book_count_of(lib) if lib else 0
+        if wants_async(request, book_count):
+            job = jobs.enqueue("delete_user", total=book_count, user_id=user_id, library_id=lib.id if lib else None)
+            return accepted(job)
 
-        lib = Library.query.filter_by(user_id=user_id).first()
+        tags = [f"user:{user_id}", "libraries"]
         if lib:
-            Book.query.filter_by(library_id=lib.id).delete()
+            tags.append(f"library:{lib.id}")
+            with library_shard(lib.id):
+                Book.query.filter_by(library_id=lib.id).delete()
+                forget_book_count(lib.id)
             db.session.delete(lib)
 
         db.session.delete(u)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return stale_write()
+        cache.invalidate(*tags)
         return jsonify({"message": "deleted"}), 200
 
     # count books in user's own library
     @app.get("/users/<int:user_id>/books/count")
+    @cache.cached("user:{user_id}")
     def user_books_count(user_id):
-        lib = Library.query.filter_by(user_id=user_id).first()
+        lib = library_of_user(user_id)
         if not lib:
             return jsonify({"error": "user or library not found"}), 404
+        cache.tag(f"library:{lib.id}")
 
-        count = Book.query.filter_by(library_id=lib.id).count()
-        return jsonify({"user_id": user_id, "library_id": lib.id, "count": count}), 200
+        return jsonify({"user_id": user_id, "library_id": lib.id, "count": book_count_of(lib)}), 200
 
     # ---------------- Libraries ----------------
 
     @app.get("/libraries")
+    @scans
+    @cache.cached("libraries")
     def list_libraries():
-        libs = Library.query.all()
-        return jsonify([{"id": l.id, "name": l.name, "user_id": l.user_id} for l in libs]), 200
+        return listing(Library.query, [Library.id], library_json)
 
     @app.get("/libraries/<int:library_id>/books")
+    @scans
+    @cache.cached("library:{library_id}", "books")
     def books_under_library(library_id):
         if not db.session.get(Library, library_id):
             return jsonify({"error": "library not found"}), 404
-        books = Book.query.filter_by(library_id=library_id).all()
-        return jsonify([book_json(b) for b in books]), 200
+        return book_listing(lambda query: (query.filter_by(library_id=library_id), None), library_id)
+
+    # move many books into this library: {"book_ids": [...]} or a filter
+    # ({"from_library_id", "author", "created_after", "created_before"} or {"all": true})
+    @app.post("/libraries/<int:library_id>/transfer")
+    @idempotent
+    def transfer_to_library(library_id):
+        if sharded():
+            return not_when_sharded()
+        d = request.get_json(silent=True)
+        if not isinstance(d, dict):
+            return jsonify({"error": "book_ids or a filter is required"}), 400
+        try:
+            ids, where = parse_transfer(d)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not db.session.get(Library, library_id):
+            return jsonify({"error": "destination library not found"}), 404
+        # a filter's size is counted only up to the point where it would become a job
+        size = len(ids) if ids is not None else db.session.scalar(select(func.count()).select_from(
+            select(Book.id).where(*where, Book.library_id != library_id).limit(current_app.config["JOB_INLINE_LIMIT"] + 1).subquery()))
+        if wants_async(request, size):
+            job = jobs.enqueue("transfer_books", total=size, to_library_id=library_id, filter=d)
+            return accepted(job)
+
+        moved, sources = transfer_books(library_id, ids, where, current_app.config["TRANSFER_CHUNK_SIZE"])
+        # the libraries' tags also cover their owners' cached book counts
+        cache.invalidate("books", f"library:{library_id}", *(f"library:{lib}" for lib in sources))
+        return jsonify({"message": "transferred", "to_library_id": library_id, "moved": moved}), 200
 
     # ---------------- Books CRUD + transfer ----------------
 
     @app.post("/books")
+    @idempotent
     def create_book():
         d = request.get_json() or {}
         if not d.get("title") or not d.get("author") or d.get("library_id") is None:
             return jsonify({"error": "title, author, library_id are required"}), 400
-        if not db.session.get(Library, d["library_id"]):
+        if not library_exists(d["library_id"]):
             return jsonify({"error": "library not found"}), 404
 
-        b = Book(title=d["title"], author=d["author"], library_id=d["library_id"])
-        db.session.add(b)
-        db.session.commit()
-        return jsonify(book_json(b)), 201
+        with library_shard(d["library_id"]):
+            b = Book(title=d["title"], author=d["author"], library_id=d["library_id"], id=next_book_ids(1)[0] if sharded() else None)
+            db.session.add(b)
+            adjust_book_counts({d["library_id"]: 1})
+            db.session.commit()
+            cache.invalidate(f"library:{d['library_id']}")
+            return tagged(jsonify(book_json(b)), b), 201
 
     @app.get("/books")
+    @scans
     def list_books():
+        if "ids" in request.args:
+            try:
+                columns, to_json = batch_projection(requested_fields(request.args))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return batch_read(lambda ids: books_by_id(columns, ids), "book", to_json)
+
         library_id = request.args.get("library_id", type=int)
         q = request.args.get("q", type=str)
 
-        query = Book.query
-        if library_id is not None:
-            query = query.filter_by(library_id=library_id)
-        if q:
-            like = f"%{q}%"
-            query = query.filter((Book.title.ilike(like)) | (Book.author.ilike(like)))
+        def filters(query):
+            if library_id is not None:
+                query = query.filter_by(library_id=library_id)
+            if q:
+                return current_app.extensions["book_search"].apply(query, q)
+            return query, None
 
-        return jsonify([book_json(b) for b in query.all()]), 200
+        return book_listing(filters, library_id)
 
     @app.put("/books/<int:book_id>")
+    @on_book_shard
     def update_book(book_id):
         b = db.session.get(Book, book_id)
         if not b:
             return jsonify({"error": "book not found"}), 404
+        failed = precondition_failed(etag(b))
+        if failed:
+            return failed
 
+        old_library_id = b.library_id
         d = request.get_json() or {}
         if "title" in d:
             b.title = d["title"]
         if "author" in d:
             b.author = d["author"]
         if "library_id" in d:
-            if not db.session.get(Library, d["library_id"]):
+            if not library_exists(d["library_id"]):
                 return jsonify({"error": "library not found"}), 404
+            if sharded() and shard_of(d["library_id"]) != shard_of(old_library_id):
+                try:
+                    b = move_book(b, d["library_id"])
+                except StaleDataError:
+                    return stale_write()
+                cache.invalidate(f"library:{old_library_id}", f"library:{b.library_id}")
+                return tagged(jsonify(book_json(b)), b), 200
             b.library_id = d["library_id"]
+            if d["library_id"] != old_library_id:
+                adjust_book_counts({old_library_id: -1, d["library_id"]: 1})
 
-        db.session.commit()
-        return jsonify(book_json(b)), 200
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return stale_write()
+        cache.invalidate(f"library:{old_library_id}", f"library:{b.library_id}")
+        return tagged(jsonify(book_json(b)), b), 200
 
     @app.delete("/books/<int:book_id>")
+    @on_book_shard
     def delete_book(book_id):
         b = db.session.get(Book, book_id)
         if not b:
             return jsonify({"error": "book not found"}), 404
+        failed = precondition_failed(etag(b))
+        if failed:
+            return failed
+        library_id = b.library_id
         db.session.delete(b)
-        db.session.commit()
+        adjust_book_counts({library_id: -1})
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return stale_write()
+        cache.invalidate(f"library:{library_id}")
         return jsonify({"message": "deleted"}), 200
 
     @app.post("/books/<int:book_id>/transfer")
+    @idempotent
+    @on_book_shard
     def transfer_book(book_id):
         b = db.session.get(Book, book_id)
         if not b:
             return jsonify({"error": "book not found"}), 404
+        failed = precondition_failed(etag(b))
+        if failed:
+            return failed
 
         d = request.get_json() or {}
         to_id = d.get("to_library_id")
         if to_id is None:
             return jsonify({"error": "to_library_id is required"}), 400
-        if not db.session.get(Library, to_id):
+        if not library_exists(to_id):
             return jsonify({"error": "destination library not found"}), 404
 
+        from_id = b.library_id
+        if sharded() and shard_of(to_id) != shard_of(from_id):
+            try:
+                b = move_book(b, to_id)
+            except StaleDataError:
+                return stale_write()
+            cache.invalidate(f"library:{from_id}", f"library:{to_id}")
+            return tagged(jsonify({"message": "transferred", "book": book_json(b)}), b), 200
         b.library_id = to_id
+        if from_id != to_id:
+            adjust_book_counts({from_id: -1, to_id: 1})
+        try:
+            db.session.commit()
+        except StaleDataError:
+            return stale_write()
+        cache.invalidate(f"library:{from_id}", f"library:{to_id}")
+        return tagged(jsonify({"message": "transferred", "book": book_json(b)}), b), 200
+
+    # ---------------- Books bulk ----------------
+    # valid items are written in BULK_BATCH_SIZE statements inside one transaction;
+    # the response carries one result per input item, in input order
+
+    def bulk_response(results, ok_status):
+        failed = sum(1 for r in results if r["status"] >= 400)
+        return jsonify({"ok": len(results) - failed, "failed": failed, "results": results}), ok_status if not failed else 207
+
+    def bulk_items():
+        return parse_items(request, current_app.config["BULK_MAX_ITEMS"])
+
+    @app.post("/books/bulk")
+    @idempotent
+    def bulk_create_books():
+        try:
+            items = bulk_items()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if wants_async(request, len(items)):
+            job = jobs.enqueue("import_books", total=len(items), items=[None if isinstance(d, BadItem) else d for d in items])
+            return accepted(job)
+
+        results, libs = create_books(items, current_app.config["BULK_BATCH_SIZE"])
+        db.session.commit()
+        cache.invalidate(*(f"library:{lib}" for lib in libs))
+        return bulk_response(results, 201)
+
+    @app.patch("/books/bulk")
+    def bulk_update_books():
+        try:
+            items = bulk_items()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        results = [None] * len(items)
+        pending = []
+        for i, d in enumerate(items):
+            if isinstance(d, BadItem) or not isinstance(d, dict) or not is_id(d.get("id")):
+                results[i] = {"status": 400, "error": "item must be an object with an integer id"}
+            elif any(k in d and not (isinstance(d[k], str) and d[k]) for k in ("title", "author")) or ("library_id" in d and not is_id(d["library_id"])):
+                results[i] = {"status": 400, "error": "title and author must be non-empty strings and library_id an integer"}
+            else:
+                pending.append(i)
+
+        books = library_ids_of([items[i]["id"] for i in pending])
+        libs = existing_ids(Library.id, [items[i]["library_id"] for i in pending if "library_id" in items[i]])
+        changes = []
+        for i in pending:
+            d = items[i]
+            if d["id"] not in books:
+                results[i] = {"status": 404, "error": "book not found"}
+            elif "library_id" in d and d["library_id"] not in libs:
+                results[i] = {"status": 404, "error": "library not found"}
+            elif "library_id" in d and sharded() and shard_of(d["library_id"]) != shard_of(books[d["id"]]):
+                results[i] = {"status": 409, "error": "library is on another shard; move the book with POST /books/<id>/transfer"}
+            else:
+                values = {k: d[k] for k in ("title", "author", "library_id") if k in d}
+                if values:
+                    changes.append({"id": d["id"], **values})
+
+        for shard, shard_changes in by_shard(changes, lambda c: books[c["id"]]):
+            with shard:
+                update_books(shard_changes, current_app.config["BULK_BATCH_SIZE"])
+                # a book listed twice only counts its final move
+                moves = {c["id"]: c["library_id"] for c in shard_changes if "library_id" in c}
+                deltas = Counter()
+                for book_id, to_id in moves.items():
+                    deltas[books[book_id]] -= 1
+                    deltas[to_id] += 1
+                adjust_book_counts(deltas)
+        db.session.commit()
+        touched = {books[c["id"]] for c in changes} | {c["library_id"] for c in changes if "library_id" in c}
+        cache.invalidate(*(f"library:{lib}" for lib in touched))
+
+        updated = {}
+        ids = sorted({items[i]["id"] for i in pending if results[i] is None})
+        for batch in chunks(ids, current_app.config["BULK_BATCH_SIZE"]):
+            updated.update((r.id, book_row_json(r)) for r in books_by_id(BOOK_COLUMNS, batch))
+        for i in pending:
+            if results[i] is None:
+                results[i] = {"status": 200, "book": updated[items[i]["id"]]}
+        return bulk_response(results, 200)
+
+    @app.delete("/books/bulk")
+    def bulk_delete_books():
+        d = request.get_json(silent=True)
+        ids = d.get("ids") if isinstance(d, dict) else d
+        if not isinstance(ids, list) or not ids:
+            return jsonify({"error": "ids are required"}), 400
+        if len(ids) > current_app.config["BULK_MAX_ITEMS"]:
+            return jsonify({"error": f"at most {current_app.config['BULK_MAX_ITEMS']} items per request"}), 400
+
+        found = library_ids_of([i for i in ids if is_id(i)])
+        for shard, shard_ids in by_shard(sorted(found), found.get):
+            with shard:
+                for batch in chunks(shard_ids, current_app.config["BULK_BATCH_SIZE"]):
+                    db.session.execute(delete(Book).where(Book.id.in_(batch)))
+                adjust_book_counts({lib: -n for lib, n in Counter(found[i] for i in shard_ids).items()})
         db.session.commit()
-        return jsonify({"message": "transferred", "book": book_json(b)}), 200
+        cache.invalidate(*{f"library:{lib}" for lib in found.values()})
+
+        results = []
+        for i in ids:
+            if not is_id(i):
+                results.append({"id": i, "status": 400, "error": "id must be an integer"})
+            elif i in found:
+                results.append({"id": i, "status": 200})
+            else:
+                results.append({"id": i, "status": 404, "error": "book not found"})
+        return bulk_response(results, 200)
+
+    # ---------------- Jobs ----------------
+    # big deletes, imports and transfers answer 202 with one of these; maintenance jobs can be queued directly
+
+    MAINTENANCE_JOBS = ("reindex", "reconcile_book_counts")
+
+    @app.post("/jobs")
+    def create_job():
+        d = request.get_json(silent=True) or {}
+        if d.get("kind") not in MAINTENANCE_JOBS:
+            return jsonify({"error": f"kind must be one of {list(MAINTENANCE_JOBS)}"}), 400
+        if d["kind"] == "reconcile_book_counts" and sharded():
+            return not_when_sharded()
+        return accepted(jobs.enqueue(d["kind"]))
+
+    @app.get("/jobs/<int:job_id>")
+    def get_job(job_id):
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({"error": "job not found"}), 404
+        return jsonify(job_json(job)), 200
+
+    # ---------------- Change feed ----------------
+    # ?since=<token> returns what changed after it, oldest first, one entry per row with its current state
+    # (data is null once the row is gone); keep polling with next_since. since=now starts from the
+    # current head: take it, then a full snapshot, then follow the feed from there
+
+    @app.get("/changes")
+    def list_changes():
+        # the log is filled by triggers on the primary, which no longer sees book writes
+        if sharded():
+            return not_when_sharded()
+        if request.args.get("since") == "now":
+            return jsonify({"changes": [], "next_since": head_token(), "has_more": False}), 200
+        try:
+            since = parse_since(request.args)
+            limit = requested_limit(request.args, current_app.config["DEFAULT_PAGE_SIZE"], current_app.config["MAX_PAGE_SIZE"])
+            changes, next_since, has_more = read_changes(since, limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except ChangesExpired:
+            return jsonify({"error": "since is older than the kept change history; take a new snapshot"}), 410
+
+        # current state of every changed row, one IN query per table
+        loaders = {
+            "user": (lambda ids: users_with_library().filter(User.id.in_(ids)).all(), user_json),
+            "library": (lambda ids: Library.query.filter(Library.id.in_(ids)).all(), library_json),
+            "book": (lambda ids: book_rows().filter(Book.id.in_(ids)).all(), book_row_json),
+        }
+        current = {}
+        for table, (load, to_json) in loaders.items():
+            ids = [row_id for t, row_id, _, _ in changes if t == table]
+            for batch in chunks(ids, current_app.config["BULK_BATCH_SIZE"]):
+                current.update(((table, x.id), to_json(x)) for x in load(batch))
+        items = []
+        for table, row_id, op, changed_at in changes:
+            data = None if op == "delete" else current.get((table, row_id))
+            items.append({"type": table, "id": row_id, "op": op if data is not None else "delete",
+                          "changed_at": changed_at, "data": data})
+        return jsonify({"changes": items, "next_since": next_since, "has_more": has_more}), 200
+
+    # ---------------- Stats ----------------
+    # dashboard numbers from the rollups in app/stats.py and Library.book_count; none of these read book
+
+    # the authors with the most books, ?limit= of them
+    @app.get("/stats/authors")
+    def author_stats():
+        try:
+            limit = requested_limit(request.args, current_app.config["DEFAULT_PAGE_SIZE"], current_app.config["MAX_PAGE_SIZE"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"authors": [{"author": a, "book_count": n} for a, n in top_authors(limit)]}), 200
+
+    # books per library, in library id order; paged like GET /libraries
+    @app.get("/stats/libraries")
+    @scans
+    def library_stats():
+        if not sharded():
+            return listing(db.session.query(Library.id, Library.name, Library.book_count), [Library.id],
+                           lambda r: {"library_id": r.id, "name": r.name, "book_count": r.book_count})
+        # the counters live on the shards: each one's first limit+1 counters past the cursor cover this page
+        try:
+            page = page_request(request.args, [Library.id], current_app.config["DEFAULT_PAGE_SIZE"], current_app.config["MAX_PAGE_SIZE"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        stmt = select(library_book_count.c.library_id, library_book_count.c.book_count)
+        if page:
+            if page.after is not None:
+                stmt = stmt.where(library_book_count.c.library_id > page.after[0])
+            stmt = stmt.order_by(library_book_count.c.library_id).limit(page.limit + 1)
+        counts = {}
+        for rows in fan_out(stmt):
+            counts.update(rows)
+        return listing(db.session.query(Library.id, Library.name), [Library.id],
+                       lambda r: {"library_id": r.id, "name": r.name, "book_count": counts.get(r.id, 0)})
+
+    # books added per UTC day from ?from= to ?to= (YYYY-MM-DD, both included; the last 30 days by default)
+    @app.get("/stats/daily")
+    def daily_stats():
+        try:
+            end = date.fromisoformat(request.args["to"]) if "to" in request.args else datetime.utcnow().date()
+            start = date.fromisoformat(request.args["from"]) if "from" in request.args else end - timedelta(days=29)
+        except ValueError:
+            return jsonify({"error": "from and to must be dates (YYYY-MM-DD)"}), 400
+        days = (end - start).days + 1
+        if not 1 <= days <= current_app.config["MAX_PAGE_SIZE"]:
+            return jsonify({"error": f"from..to must span 1 to {current_app.config['MAX_PAGE_SIZE']} days"}), 400
+        return jsonify({"days": [{"day": d.isoformat(), "book_count": n} for d, n in daily_counts(start, end)]}), 200
@@ -0,0 +1,97 @@
+import re
+from sqlalchemy import DDL, column, event, func, literal_column, table, text
+from sqlalchemy.engine import make_url
+from .extensions import db
+from .models import Book
+
+# ---------------- schema ----------------
+
+# external-content FTS5 index over book(title, author); triggers keep it in sync with every
+# write path, ORM or Core, including bulk statements
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+    "title, author, content='book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF title, author ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+]
+
+# expression GIN index; PostgresSearch must use the exact same expression to hit it
+PG_TSVECTOR = "to_tsvector('simple', title || ' ' || author)"
+PG_SEARCH_DDL = [f"CREATE INDEX IF NOT EXISTS ix_book_search ON book USING GIN ({PG_TSVECTOR})"]
+
+for stmt in SQLITE_FTS_DDL:
+    event.listen(Book.__table__, "after_create", DDL(stmt).execute_if(dialect="sqlite"))
+event.listen(Book.__table__, "after_drop", DDL("DROP TABLE IF EXISTS book_fts").execute_if(dialect="sqlite"))
+for stmt in PG_SEARCH_DDL:
+    event.listen(Book.__table__, "after_create", DDL(stmt).execute_if(dialect="postgresql"))
+
+# ---------------- backends ----------------
+
+# textual statements name no table the session could route by; this sends them where book lives
+BOOK_BIND = {"mapper": Book.__mapper__}
+
+def terms(q):
+    return re.findall(r"\w+", q)
+
+
+class LikeSearch:
+    """Substring match; cannot use an index, kept as the portable fallback."""
+
+    def apply(self, query, q):
+        like = f"%{q}%"
+        return query.filter((Book.title.ilike(like)) | (Book.author.ilike(like))), None
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteFTSSearch:
+    fts = table("book_fts", column("rowid"), column("rank"), column("book_fts"))
+
+    def apply(self, query, q):
+        words = terms(q)
+        if not words:
+            return LikeSearch().apply(query, q)
+        # every term must match, each one as a prefix: "har pot" -> "har"* "pot"*
+        match = " ".join('"%s"*' % w.replace('"', '""') for w in words)
+        query = query.join(self.fts, self.fts.c.rowid == Book.id).filter(self.fts.c.book_fts.op("MATCH")(match))
+        return query, self.fts.c.rank
+
+    # re-reads every row of the content table; for an index that drifted (e.g. rows written with the
+    # triggers missing)
+    def rebuild(self):
+        db.session.execute(text("INSERT INTO book_fts(book_fts) VALUES ('rebuild')"), bind_arguments=BOOK_BIND)
+
+
+class PostgresSearch:
+    def apply(self, query, q):
+        words = terms(q)
+        if not words:
+            return LikeSearch().apply(query, q)
+        tsquery = func.to_tsquery("simple", " & ".join(f"{w}:*" for w in words))
+        vector = literal_column(PG_TSVECTOR)
+        return query.filter(vector.op("@@")(tsquery)), func.ts_rank(vector, tsquery).desc()
+
+    def rebuild(self):
+        db.session.execute(text("REINDEX INDEX ix_book_search"), bind_arguments=BOOK_BIND)
+
+
+FTS_BACKENDS = {"sqlite": SQLiteFTSSearch, "postgresql": PostgresSearch}
+
+
+def init_search(app):
+    """Picks the book search backend from SEARCH_BACKEND ("auto", "fts" or "like") and the database dialect."""
+    choice = app.config["SEARCH_BACKEND"]
+    dialect = make_url(app.config["SQLALCHEMY_DATABASE_URI"]).get_backend_name()
+    if choice == "like" or dialect not in FTS_BACKENDS:
+        if choice == "fts":
+            raise RuntimeError(f"no full-text search backend for {dialect}")
+        backend = LikeSearch()
+    else:
+        backend = FTS_BACKENDS[dialect]()
+    app.extensions["book_search"] = backend
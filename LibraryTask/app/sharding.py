@@ -0,0 +1,129 @@
+"""Horizontal sharding of books by library_id (BOOK_SHARDS).
+
+Each URL in BOOK_SHARDS becomes a bind (shard0, shard1, ...) holding the book table with its search
+index, the book counters of the libraries placed on it (library_book_count) and an id sequence
+(book_seq). Users, libraries and everything else stay on the primary. A library's books live on shard
+library_id % N, so a book write touches that one shard and never the primary, and writers on
+different shards never wait for each other's locks. N cannot change once books are written, and all
+shards are expected to use the primary's database engine (the search backend is chosen from it).
+
+RoutingSession (engine.py) sends statements on those tables to the shard picked with on_shard() and
+refuses them outside of one. Routes that know the library go straight to its shard; lookups by book id
+ask every shard at once, because a book keeps its id when a transfer moves it to another shard. Ids
+stay unique because shard i only hands out ids congruent to i modulo N.
+
+Moving many books into a library (POST /libraries/<id>/transfer), the change feed and counter
+reconciliation need every book in one database and answer 501 while sharded.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import DDL, delete, event, insert, select, update
+from sqlalchemy.orm.exc import StaleDataError
+from .counters import adjust_book_counts
+from .engine import SHARD, current_shard, on_shard, shard_of, sharded
+from .extensions import db
+from .models import Book, book_seq, shard_metadata
+from .search import PG_SEARCH_DDL, SQLITE_FTS_DDL
+
+# book as created on a shard; library lives on the primary, so there is no foreign key to it
+shard_book = Book.__table__.to_metadata(shard_metadata)
+for fk in list(shard_book.foreign_keys):
+    shard_book.foreign_keys.discard(fk)
+    fk.parent.foreign_keys.discard(fk)
+    shard_book.constraints.discard(fk.constraint)
+for stmt in SQLITE_FTS_DDL:
+    event.listen(shard_book, "after_create", DDL(stmt).execute_if(dialect="sqlite"))
+for stmt in PG_SEARCH_DDL:
+    event.listen(shard_book, "after_create", DDL(stmt).execute_if(dialect="postgresql"))
+
+
+def init_sharding(app):
+    if app.config["BOOK_SHARDS"]:
+        app.extensions["book_shards"] = ThreadPoolExecutor(len(app.config["BOOK_SHARDS"]), thread_name_prefix="shard")
+
+
+def shard_count():
+    return len(current_app.config["BOOK_SHARDS"])
+
+
+def every_shard():
+    """One context per shard to run book statements in, or a single no-op one when unsharded."""
+    return [on_shard(i) for i in range(shard_count())] if sharded() else [nullcontext()]
+
+
+def by_shard(items, library_id):
+    """Splits items into (context, items) pairs, one per shard holding their libraries, keeping input
+    order within each; a single no-op context with every item when unsharded."""
+    if not sharded():
+        return [(nullcontext(), list(items))]
+    groups = defaultdict(list)
+    for item in items:
+        groups[shard_of(library_id(item))].append(item)
+    return [(on_shard(shard), group) for shard, group in sorted(groups.items())]
+
+
+def create_shard_tables():
+    """Creates the shard tables on every shard (existing ones are left alone) and seeds the id sequence."""
+    for i in range(shard_count()):
+        engine = db.engines[SHARD.format(i)]
+        shard_metadata.create_all(engine)
+        with engine.begin() as conn:
+            if conn.scalar(select(book_seq.c.id)) is None:
+                conn.execute(insert(book_seq).values(id=1, next_value=1))
+
+
+def next_book_ids(n):
+    """n unused book ids from the current shard's sequence, inside the caller's transaction."""
+    end = db.session.execute(
+        update(book_seq).where(book_seq.c.id == 1)
+        .values(next_value=book_seq.c.next_value + n).returning(book_seq.c.next_value)
+    ).scalar_one()
+    shard, count = current_shard.get(), shard_count()
+    return [v * count + shard for v in range(end - n, end)]
+
+
+def fan_out(stmt, shards=None):
+    """Runs a read on every shard (or the given ones) at once, each on a connection of its own, so it
+    does not see the request's uncommitted writes. Returns one list of rows per shard, in shard order."""
+    engines = [db.engines[SHARD.format(i)] for i in (range(shard_count()) if shards is None else shards)]
+
+    def run(engine):
+        with engine.connect() as conn:
+            return conn.execute(stmt).all()
+    if len(engines) == 1:
+        return [run(engines[0])]
+    return list(current_app.extensions["book_shards"].map(run, engines))
+
+
+def move_book(book, to_library_id):
+    """Moves a book loaded on the current shard into a library on another shard, keeping its id, and
+    returns it as a detached Book.
+
+    Two transactions: the copy commits on the destination, then the source row is deleted if it still
+    has the version that was copied. If it changed in between, the copy is deleted again and
+    StaleDataError raised. A crash between the two commits leaves the book on both shards."""
+    table = Book.__table__
+    values = {c.key: getattr(book, c.key) for c in table.columns}
+    from_id, version = values["library_id"], values["version_id"]
+    # the copy carries any pending changes; the source row must not be flushed, only deleted
+    db.session.expunge(book)
+    values.update(library_id=to_library_id, version_id=version + 1, updated_at=datetime.utcnow())
+    with on_shard(shard_of(to_library_id)):
+        db.session.execute(insert(table).values(values))
+        adjust_book_counts({to_library_id: 1})
+    db.session.commit()
+
+    gone = db.session.execute(delete(table).where(table.c.id == values["id"], table.c.version_id == version))
+    if gone.rowcount != 1:
+        db.session.rollback()
+        with on_shard(shard_of(to_library_id)):
+            db.session.execute(delete(table).where(table.c.id == values["id"]))
+            adjust_book_counts({to_library_id: -1})
+        db.session.commit()
+        raise StaleDataError(f"book {values['id']} changed while it was being moved")
+    adjust_book_counts({from_id: -1})
+    db.session.commit()
+    return Book(**values)
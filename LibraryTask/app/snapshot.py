@@ -0,0 +1,311 @@
+"""Whole-catalog snapshots: `flask snapshot export DIR` and `flask snapshot restore DIR`.
+
+A snapshot is a directory holding one gzipped CSV file per table (user, library, book) and
+manifest.json with their columns and row counts. Each file has a header row and quoted strings, and an
+empty field in a nullable column is NULL. It is a logical copy, so a snapshot taken from SQLite can be
+restored into Postgres and the other way round.
+
+Export streams each table to disk. Postgres writes it with COPY ... TO STDOUT, all tables in one
+REPEATABLE READ transaction. SQLite is first copied with the online backup API, and the rows are then
+read from the copy. The live database is locked only for the page copy, not while the CSV is encoded:
+a reader held open that long would keep WAL checkpoints from finishing.
+
+Restore replaces the three tables and everything derived from them, with bounded memory:
+- Postgres, in one transaction: the foreign keys and secondary indexes are dropped and the tables'
+  triggers disabled. The files are COPYed in, then the indexes and foreign keys are rebuilt, which
+  checks every row.
+- SQLite: the database is copied (backup API) into a scratch file. That file is loaded with journaling
+  off, its indexes and triggers dropped and recreated afterwards, and checked with PRAGMA
+  foreign_key_check. It is then copied back over the live database in one step, so readers see
+  either the old catalog or the new one.
+- Any other database gets batched INSERTs in one transaction.
+After that, the search index, the GET /stats rollups and the id sequences are rebuilt. The change feed
+is reset (changes.RESET_SQL), so its consumers take a new snapshot.
+
+Writes made while a restore runs are lost, so stop the writers first. Cached responses expire within
+CACHE_TTL.
+"""
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import text
+from .changes import PG_RESET_SQL, RESET_SQL
+from .extensions import db
+from .models import Book, Library, User
+from .stats import REBUILD_SQL
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+# in load order, parents first
+TABLES = (User.__table__, Library.__table__, Book.__table__)
+# bytes moved per read/write of a COPY
+COPY_BUFFER = 1 << 20
+
+
+class SnapshotError(Exception):
+    """The snapshot is unreadable, of another format, or does not match what was loaded from it."""
+
+
+def file_name(table):
+    return f"{table.name}.csv.gz"
+
+
+def _columns(dialect, names):
+    return ", ".join(dialect.identifier_preparer.quote(n) for n in names)
+
+
+def _copy(cursor, sql, f, out):
+    """COPY between the connection and a binary file, with psycopg2 or psycopg 3."""
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(sql, f, COPY_BUFFER)
+        return
+    with cursor.copy(sql) as copy:
+        if out:
+            for data in copy:
+                f.write(data)
+        else:
+            while data := f.read(COPY_BUFFER):
+                copy.write(data)
+
+
+@contextmanager
+def _live_sqlite(engine):
+    """The sqlite3 connection under one of the engine's pooled connections."""
+    raw = engine.raw_connection()
+    try:
+        yield raw.driver_connection
+    finally:
+        raw.close()
+
+
+# ---------------- export ----------------
+
+def _write_rows(directory, table, rows):
+    count = 0
+    with gzip.open(os.path.join(directory, file_name(table)), "wt", compresslevel=1, encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+        writer.writerow(table.columns.keys())
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+    return count
+
+
+def _select_all(dialect, table):
+    return f"SELECT {_columns(dialect, table.columns.keys())} FROM {dialect.identifier_preparer.quote(table.name)}"
+
+
+def _pg_export(engine, directory):
+    counts = {}
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        cursor = conn.connection.driver_connection.cursor()
+        for table in TABLES:
+            name = conn.dialect.identifier_preparer.quote(table.name)
+            counts[table.name] = conn.exec_driver_sql(f"SELECT count(*) FROM {name}").scalar()
+            with gzip.open(os.path.join(directory, file_name(table)), "wb", compresslevel=1) as f:
+                _copy(cursor, f"COPY {name} ({_columns(conn.dialect, table.columns.keys())}) "
+                              "TO STDOUT WITH (FORMAT csv, HEADER)", f, out=True)
+        conn.rollback()
+    return counts
+
+
+def _sqlite_export(engine, directory):
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = sqlite3.connect(os.path.join(tmp, "export.db"))
+        try:
+            with _live_sqlite(engine) as live:
+                live.backup(copy)
+            return {t.name: _write_rows(directory, t, copy.execute(_select_all(engine.dialect, t))) for t in TABLES}
+        finally:
+            copy.close()
+
+
+def export_snapshot(directory, chunk_size=10000):
+    """Writes every user, library and book into directory (created if missing). Returns {table: rows}."""
+    os.makedirs(directory, exist_ok=True)
+    engine = db.engine
+    if engine.dialect.name == "postgresql":
+        counts = _pg_export(engine, directory)
+    elif engine.dialect.name == "sqlite":
+        counts = _sqlite_export(engine, directory)
+    else:
+        with engine.connect().execution_options(yield_per=chunk_size) as conn:
+            counts = {t.name: _write_rows(directory, t, conn.exec_driver_sql(_select_all(conn.dialect, t))) for t in TABLES}
+    manifest = {
+        "format": FORMAT,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "dialect": engine.dialect.name,
+        "tables": {t.name: {"file": file_name(t), "columns": t.columns.keys(), "rows": counts[t.name]} for t in TABLES},
+    }
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return counts
+
+
+# ---------------- restore ----------------
+
+def read_manifest(directory):
+    """The snapshot's manifest, once every table's file is there with the columns it lists."""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"cannot read {MANIFEST} in {directory}: {e}")
+    if manifest.get("format") != FORMAT:
+        raise SnapshotError(f"snapshot format {manifest.get('format')!r}, expected {FORMAT}")
+    for table in TABLES:
+        entry = manifest.get("tables", {}).get(table.name)
+        if entry is None:
+            raise SnapshotError(f"the snapshot has no {table.name} table")
+        unknown = [c for c in entry["columns"] if c not in table.columns]
+        if unknown:
+            raise SnapshotError(f"{table.name} has no columns {unknown}")
+        try:
+            with gzip.open(os.path.join(directory, file_name(table)), "rt", encoding="utf-8", newline="") as f:
+                header = next(csv.reader(f), None)
+        except OSError as e:
+            raise SnapshotError(f"cannot read {file_name(table)}: {e}")
+        if header != entry["columns"]:
+            raise SnapshotError(f"the header of {file_name(table)} does not match the manifest")
+    return manifest
+
+
+def _read_rows(directory, table, columns):
+    """A snapshot file's rows as lists of strings, with None for empty fields of nullable columns."""
+    nullable = [i for i, name in enumerate(columns) if table.c[name].nullable]
+    with gzip.open(os.path.join(directory, file_name(table)), "rt", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            for i in nullable:
+                if row[i] == "":
+                    row[i] = None
+            yield row
+
+
+def _check_counts(counts, manifest):
+    for name, count in counts.items():
+        if count != manifest["tables"][name]["rows"]:
+            raise SnapshotError(f"{count} {name} rows loaded, the manifest says {manifest['tables'][name]['rows']}")
+
+
+def _pg_restore(engine, directory, manifest, chunk_size):
+    with engine.begin() as conn:
+        quote = conn.dialect.identifier_preparer.quote
+        names = {t.name: quote(t.name) for t in TABLES}
+        tables = {"tables": list(names.values())}
+        foreign_keys = conn.execute(text(
+            "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE contype = 'f' "
+            "AND (conrelid = ANY(CAST(:tables AS regclass[])) OR confrelid = ANY(CAST(:tables AS regclass[])))"), tables).all()
+        indexes = conn.execute(text(
+            "SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = ANY(CAST(:tables AS regclass[])) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = indexrelid)"), tables).all()
+        for table, constraint, _ in foreign_keys:
+            conn.exec_driver_sql(f"ALTER TABLE {table} DROP CONSTRAINT {quote(constraint)}")
+        for index, _ in indexes:
+            conn.exec_driver_sql(f"DROP INDEX {index}")
+        for name in names.values():
+            conn.exec_driver_sql(f"ALTER TABLE {name} DISABLE TRIGGER USER")
+        conn.exec_driver_sql(f"TRUNCATE {', '.join(names.values())}")
+
+        cursor = conn.connection.driver_connection.cursor()
+        counts = {}
+        for table in TABLES:
+            columns = manifest["tables"][table.name]["columns"]
+            nullable = [c for c in columns if table.c[c].nullable]
+            force_null = f", FORCE_NULL ({_columns(conn.dialect, nullable)})" if nullable else ""
+            with gzip.open(os.path.join(directory, file_name(table)), "rb") as f:
+                _copy(cursor, f"COPY {names[table.name]} ({_columns(conn.dialect, columns)}) "
+                              f"FROM STDIN WITH (FORMAT csv, HEADER{force_null})", f, out=False)
+            counts[table.name] = conn.exec_driver_sql(f"SELECT count(*) FROM {names[table.name]}").scalar()
+        _check_counts(counts, manifest)
+
+        for _, definition in indexes:
+            conn.exec_driver_sql(definition)
+        for table, constraint, definition in foreign_keys:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD CONSTRAINT {quote(constraint)} {definition}")
+        for name in names.values():
+            conn.exec_driver_sql(f"ALTER TABLE {name} ENABLE TRIGGER USER")
+            conn.execute(text(f"SELECT setval(pg_get_serial_sequence(:table, 'id'), max(id)) FROM {name}"), {"table": name})
+        for sql in REBUILD_SQL + PG_RESET_SQL:
+            conn.exec_driver_sql(sql)
+        conn.exec_driver_sql(f"ANALYZE {', '.join(names.values())}")
+    return counts
+
+
+def _sqlite_restore(engine, directory, manifest, chunk_size):
+    names = [t.name for t in TABLES]
+    with tempfile.TemporaryDirectory() as tmp, _live_sqlite(engine) as live:
+        stage = sqlite3.connect(os.path.join(tmp, "restore.db"), isolation_level=None)
+        try:
+            live.backup(stage)
+            stage.execute("PRAGMA synchronous=OFF")
+            # their SQL is kept by sqlite_master; indexes behind UNIQUE constraints have none and stay
+            deferred = stage.execute(
+                "SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL "
+                f"AND tbl_name IN ({', '.join('?' * len(names))})", names).fetchall()
+            stage.execute("BEGIN")
+            for kind, name, _ in deferred:
+                stage.execute(f'DROP {kind.upper()} "{name}"')
+            for table in reversed(TABLES):
+                stage.execute(f'DELETE FROM "{table.name}"')
+
+            counts = {}
+            for table in TABLES:
+                columns = manifest["tables"][table.name]["columns"]
+                insert = (f'INSERT INTO "{table.name}" ({_columns(engine.dialect, columns)}) '
+                          f"VALUES ({', '.join('?' * len(columns))})")
+                # executemany pulls the rows one at a time
+                counts[table.name] = stage.executemany(insert, _read_rows(directory, table, columns)).rowcount
+            _check_counts(counts, manifest)
+
+            for _, _, sql in deferred:
+                stage.execute(sql)
+            orphans = [row for name in names for row in stage.execute(f'PRAGMA foreign_key_check("{name}")')]
+            if orphans:
+                raise SnapshotError(f"{len(orphans)} rows point to missing parents, e.g. {orphans[0][0]} {orphans[0][1]}")
+            if stage.execute("SELECT 1 FROM sqlite_master WHERE name = 'book_fts'").fetchone():
+                stage.execute("INSERT INTO book_fts(book_fts) VALUES ('rebuild')")
+            for sql in REBUILD_SQL + RESET_SQL:
+                stage.execute(sql)
+            stage.execute("COMMIT")
+            stage.backup(live)
+        finally:
+            stage.close()
+    return counts
+
+
+def _batched_restore(engine, directory, manifest, chunk_size):
+    # no triggers or derived tables are kept on other databases
+    with engine.begin() as conn:
+        for table in reversed(TABLES):
+            conn.execute(table.delete())
+        counts = {}
+        for table in TABLES:
+            columns = manifest["tables"][table.name]["columns"]
+            keys = [f"c{i}" for i in range(len(columns))]
+            insert = text(f"INSERT INTO {conn.dialect.identifier_preparer.quote(table.name)} "
+                          f"({_columns(conn.dialect, columns)}) VALUES ({', '.join(':' + k for k in keys)})")
+            rows, counts[table.name] = _read_rows(directory, table, columns), 0
+            while chunk := list(islice(rows, chunk_size)):
+                conn.execute(insert, [dict(zip(keys, row)) for row in chunk])
+                counts[table.name] += len(chunk)
+        _check_counts(counts, manifest)
+    return counts
+
+
+RESTORERS = {"postgresql": _pg_restore, "sqlite": _sqlite_restore}
+
+
+def restore_snapshot(directory, chunk_size=10000):
+    """Replaces every user, library and book with the snapshot in directory. Returns {table: rows}.
+    Raises SnapshotError, leaving the database as it was, when the snapshot does not check out."""
+    manifest = read_manifest(directory)
+    engine = db.engine
+    return RESTORERS.get(engine.dialect.name, _batched_restore)(engine, directory, manifest, chunk_size)
@@ -0,0 +1,176 @@
+"""Rollups behind GET /stats: books per author (author_stats) and per day they were added
+(daily_book_stats, by created_at in UTC). Books per library is Library.book_count (counters.py).
+
+Triggers on book keep both in step with every write path, ORM or Core, the same way search.py and
+changes.py keep their tables, so a dashboard reads a handful of rollup rows instead of the book
+table. Rows that drop to zero are removed. `flask rebuild-stats` recomputes them from book.
+
+With BOOK_SHARDS every shard keeps its own rollups next to its books and the reads add them up.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import DDL, delete, event, func, insert, select
+from .engine import sharded
+from .extensions import db
+from .models import AuthorStats, Book, DailyBookStats, shard_metadata
+from .sharding import every_shard, fan_out
+
+
+def _sqlite_add(table, key, value):
+    return (f"INSERT INTO {table}({key}, book_count) VALUES ({value}, 1) "
+            f"ON CONFLICT({key}) DO UPDATE SET book_count = book_count + 1")
+
+
+def _sqlite_remove(table, key, value):
+    return (f"UPDATE {table} SET book_count = book_count - 1 WHERE {key} = {value}; "
+            f"DELETE FROM {table} WHERE {key} = {value} AND book_count <= 0")
+
+
+SQLITE_STATS_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS book_stats_ai AFTER INSERT ON book BEGIN "
+    f"{_sqlite_add('author_stats', 'author', 'new.author')}; "
+    f"{_sqlite_add('daily_book_stats', 'day', 'date(new.created_at)')}; END",
+    "CREATE TRIGGER IF NOT EXISTS book_stats_ad AFTER DELETE ON book BEGIN "
+    f"{_sqlite_remove('author_stats', 'author', 'old.author')}; "
+    f"{_sqlite_remove('daily_book_stats', 'day', 'date(old.created_at)')}; END",
+    "CREATE TRIGGER IF NOT EXISTS book_stats_au AFTER UPDATE OF author ON book WHEN old.author IS NOT new.author BEGIN "
+    f"{_sqlite_remove('author_stats', 'author', 'old.author')}; "
+    f"{_sqlite_add('author_stats', 'author', 'new.author')}; END",
+]
+
+PG_STATS_DDL = [
+    "CREATE OR REPLACE FUNCTION book_stats() RETURNS trigger AS $$ BEGIN "
+    "IF TG_OP <> 'INSERT' THEN "
+    "UPDATE author_stats SET book_count = book_count - 1 WHERE author = OLD.author; "
+    "DELETE FROM author_stats WHERE author = OLD.author AND book_count <= 0; "
+    "END IF; "
+    "IF TG_OP = 'DELETE' THEN "
+    "UPDATE daily_book_stats SET book_count = book_count - 1 WHERE day = OLD.created_at::date; "
+    "DELETE FROM daily_book_stats WHERE day = OLD.created_at::date AND book_count <= 0; "
+    "END IF; "
+    "IF TG_OP <> 'DELETE' THEN "
+    "INSERT INTO author_stats(author, book_count) VALUES (NEW.author, 1) "
+    "ON CONFLICT (author) DO UPDATE SET book_count = author_stats.book_count + 1; "
+    "END IF; "
+    "IF TG_OP = 'INSERT' THEN "
+    "INSERT INTO daily_book_stats(day, book_count) VALUES (NEW.created_at::date, 1) "
+    "ON CONFLICT (day) DO UPDATE SET book_count = daily_book_stats.book_count + 1; "
+    "END IF; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "CREATE TRIGGER book_stats AFTER INSERT OR DELETE ON book FOR EACH ROW EXECUTE FUNCTION book_stats()",
+    "CREATE TRIGGER book_stats_author AFTER UPDATE OF author ON book FOR EACH ROW "
+    "WHEN (OLD.author IS DISTINCT FROM NEW.author) EXECUTE FUNCTION book_stats()",
+]
+
+# the shards keep their own copies (app/sharding.py creates shard_metadata)
+for table in (AuthorStats.__table__, DailyBookStats.__table__):
+    table.to_metadata(shard_metadata)
+
+# on the metadata: the triggers need book and both rollup tables in place
+for metadata in (db.metadata, shard_metadata):
+    for stmt in SQLITE_STATS_DDL:
+        event.listen(metadata, "after_create", DDL(stmt).execute_if(dialect="sqlite"))
+    for stmt in PG_STATS_DDL:
+        event.listen(metadata, "after_create", DDL(stmt).execute_if(dialect="postgresql"))
+event.listen(db.metadata, "after_drop", DDL("DROP FUNCTION IF EXISTS book_stats() CASCADE").execute_if(dialect="postgresql"))
+
+# both rollups in one pass each, for a book table loaded with the triggers off (`flask snapshot restore`)
+REBUILD_SQL = [
+    "DELETE FROM author_stats",
+    "INSERT INTO author_stats(author, book_count) SELECT author, count(*) FROM book GROUP BY author",
+    "DELETE FROM daily_book_stats",
+    "INSERT INTO daily_book_stats(day, book_count) SELECT date(created_at), count(*) FROM book GROUP BY date(created_at)",
+]
+
+
+def _read(stmt):
+    """Rows of stmt from the rollups: the session's, or every shard's one after the other."""
+    if sharded():
+        return [r for rows in fan_out(stmt) for r in rows]
+    return db.session.execute(stmt).all()
+
+
+def top_authors(limit):
+    """[(author, books)] for the limit authors with the most books, ties by name.
+    Sharded, each shard's own top list is summed, so an author spread thinly over many shards can
+    be missed or undercounted."""
+    stmt = (select(AuthorStats.author, AuthorStats.book_count)
+            .order_by(AuthorStats.book_count.desc(), AuthorStats.author).limit(limit))
+    if not sharded():
+        return db.session.execute(stmt).all()
+    totals = Counter()
+    for author, count in _read(stmt):
+        totals[author] += count
+    return sorted(totals.items(), key=lambda x: (-x[1], x[0]))[:limit]
+
+
+def daily_counts(start, end):
+    """[(day, books added)] for every day from start to end inclusive, zeros included."""
+    totals = Counter()
+    for day, count in _read(select(DailyBookStats.day, DailyBookStats.book_count).where(DailyBookStats.day.between(start, end))):
+        totals[day] += count
+    return [(start + timedelta(days=i), totals[start + timedelta(days=i)]) for i in range((end - start).days + 1)]
+
+
+def _rebuild_authors(chunk_size):
+    # one transaction per run of chunk_size authors: that range's rows are replaced by a GROUP BY,
+    # which walks ix_book_author_id; the last pass also clears rows past the last author
+    last, rebuilt = None, 0
+    while True:
+        stmt = select(Book.author).distinct().order_by(Book.author).limit(chunk_size)
+        authors = db.session.scalars(stmt.where(Book.author > last) if last is not None else stmt).all()
+        db.session.rollback()  # the rewrite starts its own (write) transaction
+        final = len(authors) < chunk_size
+        rollups, books = [], []
+        if last is not None:
+            rollups.append(AuthorStats.author > last)
+            books.append(Book.author > last)
+        if not final:
+            rollups.append(AuthorStats.author <= authors[-1])
+            books.append(Book.author <= authors[-1])
+        db.session.execute(delete(AuthorStats).where(*rollups))
+        db.session.execute(insert(AuthorStats).from_select(
+            ["author", "book_count"], select(Book.author, func.count()).where(*books).group_by(Book.author)))
+        db.session.commit()
+        rebuilt += len(authors)
+        if final:
+            return rebuilt
+        last = authors[-1]
+
+
+def _rebuild_days(chunk_size):
+    # the same, chunk_size days of created_at (read through ix_book_created_at_id) at a time
+    first, last = db.session.execute(select(func.min(Book.created_at), func.max(Book.created_at))).one()
+    db.session.rollback()
+    if first is None:
+        db.session.execute(delete(DailyBookStats))
+        db.session.commit()
+        return 0
+    start, end, rebuilt = first.date(), last.date(), 0
+    while start <= end:
+        stop = start + timedelta(days=chunk_size)
+        rollups, books = [], [Book.created_at >= datetime.combine(start, datetime.min.time())]
+        if start > first.date():
+            rollups.append(DailyBookStats.day >= start)
+        if stop <= end:
+            rollups.append(DailyBookStats.day < stop)
+            books.append(Book.created_at < datetime.combine(stop, datetime.min.time()))
+        day = func.date(Book.created_at)
+        db.session.execute(delete(DailyBookStats).where(*rollups))
+        result = db.session.execute(insert(DailyBookStats).from_select(
+            ["day", "book_count"], select(day, func.count()).where(*books).group_by(day)))
+        db.session.commit()
+        rebuilt += max(result.rowcount, 0)
+        start = stop
+    return rebuilt
+
+
+def rebuild_stats(chunk_size=1000):
+    """Recomputes author_stats and daily_book_stats from book (on every shard), chunk by chunk.
+    Returns how many authors and days were written."""
+    authors = days = 0
+    for shard in every_shard():
+        with shard:
+            authors += _rebuild_authors(chunk_size)
+            days += _rebuild_days(chunk_size)
+    return authors, days
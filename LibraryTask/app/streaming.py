@@ -0,0 +1,39 @@
+NDJSON = "application/x-ndjson"
+
+
+def wants_stream(req):
+    """Returns "ndjson", "json" or None for the streaming mode the client asked for."""
+    if req.accept_mimetypes.best == NDJSON:
+        return "ndjson"
+    if req.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return "ndjson" if req.args.get("format") == "ndjson" else "json"
+    return None
+
+
+def _batches(query, batch_size, to_json, dumps):
+    # yield_per streams rows from a server-side cursor and only keeps one batch of ORM objects alive;
+    # a plain iterator of rows (listings merged from several shards) is taken as it is
+    batch = []
+    rows = query.yield_per(batch_size) if hasattr(query, "yield_per") else query
+    for row in rows:
+        batch.append(dumps(to_json(row)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ndjson_rows(query, to_json, dumps, batch_size):
+    for batch in _batches(query, batch_size, to_json, dumps):
+        yield "\n".join(batch) + "\n"
+
+
+def json_array_rows(query, to_json, dumps, batch_size):
+    """Same body as jsonify(list) but produced chunk by chunk."""
+    yield "["
+    first = True
+    for batch in _batches(query, batch_size, to_json, dumps):
+        yield ("" if first else ",") + ",".join(batch)
+        first = False
+    yield "]\n"
@@ -0,0 +1,98 @@
+"""Handlers for the background jobs in jobs.py. Each one commits chunk by chunk and checkpoints before
+every commit, so a resumed job skips what already committed."""
+from flask import current_app
+from sqlalchemy import delete, select
+from .bulk import BadItem, create_books, parse_transfer, transfer_books
+from .counters import adjust_book_counts, forget_book_count, reconcile_book_counts
+from .engine import library_shard
+from .extensions import cache, db
+from .jobs import handler
+from .models import Book, Library, User
+from .sharding import every_shard
+
+
+@handler("delete_user")
+def delete_user(ctx):
+    user_id, library_id = ctx.params["user_id"], ctx.params.get("library_id")
+    deleted = ctx.state.get("books_deleted", 0)
+    if library_id is not None:
+        with library_shard(library_id):
+            while True:
+                ids = db.session.scalars(select(Book.id).where(Book.library_id == library_id).limit(ctx.chunk_size)).all()
+                if not ids:
+                    break
+                db.session.execute(delete(Book).where(Book.id.in_(ids)))
+                adjust_book_counts({library_id: -len(ids)})
+                deleted += len(ids)
+                ctx.checkpoint(deleted, state={"books_deleted": deleted})
+                db.session.commit()
+                cache.invalidate(f"library:{library_id}")
+            forget_book_count(library_id)
+        lib = db.session.get(Library, library_id)
+        if lib is not None:
+            db.session.delete(lib)
+    u = db.session.get(User, user_id)
+    if u is not None:
+        db.session.delete(u)
+    db.session.commit()
+    cache.invalidate(f"user:{user_id}", "libraries", *([f"library:{library_id}"] if library_id is not None else []))
+    return {"user_id": user_id, "books_deleted": deleted}
+
+
+@handler("import_books")
+def import_books(ctx):
+    # BadItem lines were stored as null; they still get their 400 in the summary
+    items = [BadItem() if d is None else d for d in ctx.params["items"]]
+    summary = ctx.state or {"ok": 0, "failed": 0, "errors": []}
+    batch_size = current_app.config["BULK_BATCH_SIZE"]
+    for start in range(ctx.progress, len(items), ctx.chunk_size):
+        chunk = items[start:start + ctx.chunk_size]
+        results, libs = create_books(chunk, batch_size)
+        for i, r in enumerate(results, start):
+            if r["status"] >= 400:
+                summary["failed"] += 1
+                summary["errors"].append({"index": i, **r})
+            else:
+                summary["ok"] += 1
+        ctx.checkpoint(start + len(chunk), total=len(items), state=summary)
+        db.session.commit()
+        cache.invalidate(*(f"library:{lib}" for lib in libs))
+    return summary
+
+
+@handler("transfer_books")
+def transfer(ctx):
+    ids, where = parse_transfer(ctx.params["filter"])
+    to_id = ctx.params["to_library_id"]
+    # books already moved no longer match library_id != to_id, so a rerun only continues the move
+    moved = ctx.state.get("moved", 0)
+    # kept with the checkpoint: libraries emptied before a restart are not seen again by the rerun
+    sources = set(ctx.state.get("sources", []))
+
+    def on_chunk(count, left):
+        nonlocal moved
+        moved += count
+        sources.update(left)
+        ctx.checkpoint(moved, state={"moved": moved, "to_library_id": to_id, "sources": sorted(sources)})
+
+    transfer_books(to_id, ids, where, current_app.config["TRANSFER_CHUNK_SIZE"], on_chunk)
+    # the libraries' tags also cover their owners' cached book counts
+    cache.invalidate("books", f"library:{to_id}", *(f"library:{lib}" for lib in sources))
+    return {"message": "transferred", "to_library_id": to_id, "moved": moved}
+
+
+@handler("reindex")
+def reindex(ctx):
+    for shard in every_shard():
+        with shard:
+            current_app.extensions["book_search"].rebuild()
+            db.session.commit()
+    cache.invalidate("books")
+    return {"message": "reindexed"}
+
+
+@handler("reconcile_book_counts")
+def reconcile(ctx):
+    drifted = reconcile_book_counts(fix=True)
+    cache.invalidate(*(f"library:{lib}" for lib, _, _ in drifted))
+    return {"repaired": [{"library_id": lib, "stored": stored, "actual": actual} for lib, stored, actual in drifted]}
@@ -0,0 +1,40 @@
+"""ETags and If-Match on top of the version_id columns.
+
+A resource's ETag is the version_id of each row it is made of ("3" for a book, "3.2" for a user and
+their library). If-Match is compared with the versions just loaded, and because the ORM repeats those
+versions in the WHERE clause of its UPDATE/DELETE, a writer that slips in between still makes the
+statement match nothing; that surfaces as StaleDataError on flush and becomes a 412 here.
+"""
+from flask import jsonify, request
+from .extensions import db
+
+
+def etag(*rows):
+    return etag_of(*(r.version_id if r is not None else None for r in rows))
+
+
+# the same from bare version numbers, for routes that read plain rows (app/lookups.py)
+def etag_of(*versions):
+    return ".".join(str(v) if v is not None else "0" for v in versions)
+
+
+def precondition_failed(current):
+    """412 response when If-Match is sent and names neither * nor the current ETag, else None."""
+    if request.if_match and not request.if_match.contains(current):
+        resp = jsonify({"error": "precondition failed: the resource has changed"})
+        resp.set_etag(current)
+        return resp, 412
+    return None
+
+
+def stale_write():
+    """Response for a StaleDataError raised by commit: someone else updated or deleted the row first."""
+    db.session.rollback()
+    if request.if_match:
+        return jsonify({"error": "precondition failed: the resource has changed"}), 412
+    return jsonify({"error": "the resource was modified concurrently; read it again and retry"}), 409
+
+
+def tagged(resp, *rows):
+    resp.set_etag(etag(*rows))
+    return resp
@@ -0,0 +1,8 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+from app import create_app
+from app.aio import AsyncApp
+
+# async mode: pip install -r requirements-async.txt, then uvicorn asgi:app
+app = AsyncApp(create_app())
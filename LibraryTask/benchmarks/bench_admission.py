@@ -0,0 +1,193 @@
+"""Goodput and tail latency under overload, with admission control (app/admission.py) off and on.
+
+    python benchmarks/bench_admission.py run --rate 150 --duration 10 --db-latency-ms 50 --pool-size 4 --out admission.json
+
+One seeded database; for every mode a threaded server is started and sent an open-loop stream of
+--rate requests per second (a --mix of point reads, searches and writes) for --duration seconds, more
+than it can serve. Requests are sent on schedule whether or not earlier ones have answered, and
+latency is measured from the scheduled send time, so time spent queued anywhere counts.
+
+--db-latency-ms makes every statement wait that long on its connection, and the pool is capped at
+--pool-size connections: the database, not Python, is what saturates. Without admission control every
+request queues for a connection, latency grows for as long as the overload lasts and requests start
+failing once they wait longer than the pool timeout. With it, requests over each class's budget get
+a 503 in a few milliseconds and the admitted ones keep their latency. The limits only protect the
+pool when they add up to no more than its size (--limits against --pool-size here; ADMISSION_LIMITS
+against DB_POOL_SIZE + DB_MAX_OVERFLOW in production).
+
+goodput_rps counts successful responses that arrived within --slo-ms per second of the run.
+"""
+import argparse
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+
+from common import make_app, percentile, seed, temp_database_url
+from bench_routes import SCENARIOS, free_port, http_caller, spawn_server
+
+MODES = {
+    "off": {"ADMISSION_CONTROL": False},
+    "on": {"ADMISSION_CONTROL": True},
+    "adaptive": {"ADMISSION_CONTROL": True, "ADMISSION_ADAPTIVE": True},
+}
+
+
+def weights(text):
+    """ "a=1,b=2" -> {"a": 1, "b": 2}"""
+    return {name: int(n) for name, n in (item.split("=") for item in text.split(","))}
+
+
+def add_statement_latency(engine, seconds):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def delay(*args):
+        time.sleep(seconds)
+
+
+def drive(call, data, mix, rate, duration, clients, slo, rng_seed):
+    """Sends rate requests per second for duration seconds from up to `clients` threads."""
+    rng = random.Random(rng_seed)
+    names, weights = zip(*mix.items())
+    todo = queue.Queue()
+    lock = threading.Lock()
+    results = []  # (scenario, status, latency)
+
+    def worker():
+        while True:
+            item = todo.get()
+            if item is None:
+                return
+            name, scheduled, (method, path, body) = item
+            status, _, _ = call(method, path, body)
+            with lock:
+                results.append((name, status, time.perf_counter() - scheduled))
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    for i in range(int(rate * duration)):
+        scheduled = start + i / rate
+        time.sleep(max(0.0, scheduled - time.perf_counter()))
+        name = rng.choices(names, weights)[0]
+        todo.put((name, scheduled, SCENARIOS[name](rng, data)))
+    for _ in threads:
+        todo.put(None)
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    def summary(rows):
+        ok = sorted(latency for _, status, latency in rows if status < 400)
+        return {
+            "requests": len(rows),
+            "ok": len(ok),
+            "shed": sum(1 for _, status, _ in rows if status == 503),
+            "errors": sum(1 for _, status, _ in rows if status >= 400 and status != 503),
+            "goodput_rps": round(sum(1 for latency in ok if latency <= slo) / elapsed, 1),
+            "p50_ms": round(percentile(ok, 50) * 1000, 1),
+            "p99_ms": round(percentile(ok, 99) * 1000, 1),
+            "max_ms": round(ok[-1] * 1000, 1) if ok else 0.0,
+        }
+    report = {"all": summary(results)}
+    for name in names:
+        report[name] = summary([r for r in results if r[0] == name])
+    return report
+
+
+def cmd_serve(args):
+    from werkzeug.serving import make_server
+    from app.extensions import db
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    # set directly: the DB_POOL_* settings only apply to server databases
+    pool = {"pool_size": args.pool_size, "max_overflow": 0, "pool_timeout": args.pool_timeout}
+    app = make_app(args.database_url, SQLALCHEMY_ENGINE_OPTIONS=pool, ADMISSION_LIMITS=weights(args.limits),
+                   ADMISSION_QUEUES=weights(args.queues), **MODES[args.mode])
+    if args.db_latency_ms:
+        with app.app_context():
+            for engine in db.engines.values():
+                add_statement_latency(engine, args.db_latency_ms / 1000)
+    make_server("127.0.0.1", args.port, app, threaded=True).serve_forever()
+    return 0
+
+
+def cmd_run(args):
+    database_url = args.database_url or temp_database_url()
+    data = seed(make_app(database_url), args.users, args.books)
+    mix = weights(args.mix)
+    results = {}
+    for mode in args.modes.split(","):
+        port = free_port()
+        server, port = spawn_server([__file__, "serve", "--mode", mode, "--database-url", database_url,
+                                     "--port", str(port), "--pool-size", str(args.pool_size),
+                                     "--pool-timeout", str(args.pool_timeout), "--db-latency-ms", str(args.db_latency_ms),
+                                     "--limits", args.limits, "--queues", args.queues], port)
+        try:
+            call = http_caller(port)
+            drive(call, data, mix, args.rate, min(args.warmup, args.duration), args.clients, args.slo_ms / 1000, 0)
+            r = results[mode] = drive(call, data, mix, args.rate, args.duration, args.clients, args.slo_ms / 1000, 1)
+        finally:
+            server.terminate()
+            server.wait()
+        a = r["all"]
+        print(f"{mode:9} goodput {a['goodput_rps']:7.1f} req/s  ok {a['ok']:6}  shed {a['shed']:6}  errors {a['errors']:5}  "
+              f"p50 {a['p50_ms']:8.1f}ms  p99 {a['p99_ms']:8.1f}ms")
+
+    report = {
+        "meta": {"users": args.users, "books": args.books, "rate": args.rate, "duration": args.duration, "mix": mix,
+                 "clients": args.clients, "slo_ms": args.slo_ms, "db_latency_ms": args.db_latency_ms,
+                 "pool_size": args.pool_size, "pool_timeout": args.pool_timeout,
+                 "limits": weights(args.limits), "queues": weights(args.queues)},
+        "modes": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run")
+    run.add_argument("--database-url")
+    run.add_argument("--users", type=int, default=1000)
+    run.add_argument("--books", type=int, default=100000)
+    run.add_argument("--modes", default="off,on,adaptive")
+    run.add_argument("--mix", default="get_user=70,search_books=20,update_book=10", help="scenario=weight,...")
+    run.add_argument("--rate", type=float, default=150, help="requests sent per second")
+    run.add_argument("--duration", type=float, default=10, help="seconds measured per mode")
+    run.add_argument("--warmup", type=float, default=2, help="seconds of load before measuring")
+    run.add_argument("--clients", type=int, default=256, help="client threads, i.e. most requests open at once")
+    run.add_argument("--slo-ms", type=float, default=500)
+    run.add_argument("--db-latency-ms", type=float, default=50.0)
+    run.add_argument("--pool-size", type=int, default=4)
+    run.add_argument("--pool-timeout", type=int, default=5)
+    run.add_argument("--limits", default="read=2,scan=1,write=1", help="ADMISSION_LIMITS; keep the sum at the pool size")
+    run.add_argument("--queues", default="read=16,scan=4,write=8", help="ADMISSION_QUEUES")
+    run.add_argument("--out")
+    run.set_defaults(func=cmd_run)
+
+    serve = sub.add_parser("serve", help="internal: one server process for `run`")
+    serve.add_argument("--mode", choices=MODES, required=True)
+    serve.add_argument("--database-url", required=True)
+    serve.add_argument("--port", type=int, required=True)
+    serve.add_argument("--pool-size", type=int, required=True)
+    serve.add_argument("--pool-timeout", type=int, required=True)
+    serve.add_argument("--db-latency-ms", type=float, default=0.0)
+    serve.add_argument("--limits", required=True)
+    serve.add_argument("--queues", required=True)
+    serve.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
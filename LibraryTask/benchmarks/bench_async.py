@@ -0,0 +1,151 @@
+"""Requests/s at rising client counts: the sync Flask app vs async mode (asgi.py), one process each.
+
+    python benchmarks/bench_async.py run --clients 1,16,64,256 --db-latency-ms 20 --out async.json
+
+sync runs the WSGI app on a fixed pool of --threads request threads (like a gthread worker);
+async runs AsyncApp under uvicorn with a single event loop. --db-latency-ms delays every SQL statement
+to stand in for a database across the network; with 0 a local SQLite file is so fast that both
+modes are bound by Python CPU instead.
+Needs uvicorn and aiosqlite.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import make_app, peak_rss_mb, seed, temp_database_url
+from bench_routes import free_port, http_caller, run_scenario, server_rss_mb, spawn_server
+
+ROUTES = "get_user,user_books_count,list_books_page,books_under_library_page,create_book"
+
+
+def add_latency(sync_engine, seconds, is_async):
+    """Every statement waits `seconds` before it runs: a blocking sleep on a sync engine, an awaited one
+    (yielding to the event loop, as a network round trip would) on an async engine."""
+    from sqlalchemy import event
+    from sqlalchemy.util import await_only
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def delay(*args):
+        if is_async:
+            await_only(asyncio.sleep(seconds))
+        else:
+            time.sleep(seconds)
+
+
+def cmd_serve(args):
+    from app.extensions import db
+    app = make_app(args.database_url, ASYNC_WSGI_THREADS=args.threads)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    latency = args.db_latency_ms / 1000
+    if latency:
+        # the Flask app's engines serve every route in sync mode and the writes in async mode
+        with app.app_context():
+            for engine in db.engines.values():
+                add_latency(engine, latency, is_async=False)
+    if args.mode == "async":
+        import uvicorn
+        from app.aio import AsyncApp
+        aio = AsyncApp(app)
+        if latency:
+            add_latency(aio.engine.sync_engine, latency, is_async=True)
+        uvicorn.run(aio, host="127.0.0.1", port=args.port, log_level="warning", lifespan="on")
+        return 0
+
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        # HTTP/1.0 like any non-threaded werkzeug server: a thread is held for one request, not a connection
+        def __init__(self, *a, **kw):
+            super().__init__(*a, **kw)
+            self.pool = ThreadPoolExecutor(args.threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.handle_one, request, client_address)
+
+        def handle_one(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer("127.0.0.1", args.port, app)
+    server.socket.listen(1024)
+    server.serve_forever()
+    return 0
+
+
+def cmd_run(args):
+    database_url = args.database_url or temp_database_url()
+    data = seed(make_app(database_url), args.users, args.books, reset=not args.reuse)
+    clients = [int(c) for c in args.clients.split(",")]
+    names = args.routes.split(",")
+    results = {}
+    for mode in args.modes.split(","):
+        port = free_port()
+        server, port = spawn_server([__file__, "serve", "--mode", mode, "--database-url", database_url, "--port", str(port),
+                                     "--threads", str(args.threads), "--db-latency-ms", str(args.db_latency_ms)], port)
+        try:
+            call = http_caller(port)
+            results[mode] = {}
+            for n in clients:
+                requests = max(args.requests, n * 4)
+                for name in names:
+                    run_scenario(name, call, data, min(args.warmup, requests), n, 0)
+                    r = results[mode].setdefault(name, {})[str(n)] = run_scenario(name, call, data, requests, n, 1)
+                    print(f"{mode:6} {name:26} {n:4} clients  {r['rps']:8.1f} req/s  p50 {r['p50_ms']:8.2f}ms  "
+                          f"p99 {r['p99_ms']:8.2f}ms  {r['errors']} errors")
+            results[mode]["peak_rss_mb"] = server_rss_mb(server.pid) or peak_rss_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {"users": args.users, "books": args.books, "threads": args.threads,
+                 "db_latency_ms": args.db_latency_ms, "clients": clients},
+        "modes": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run")
+    run.add_argument("--database-url")
+    run.add_argument("--reuse", action="store_true", help="keep an already seeded database")
+    run.add_argument("--users", type=int, default=1000)
+    run.add_argument("--books", type=int, default=100000)
+    run.add_argument("--requests", type=int, default=500, help="measured requests per route and client count (at least 4 per client)")
+    run.add_argument("--warmup", type=int, default=50)
+    run.add_argument("--clients", default="1,16,64,256")
+    run.add_argument("--modes", default="sync,async")
+    run.add_argument("--threads", type=int, default=8, help="request threads of the sync server")
+    run.add_argument("--db-latency-ms", type=float, default=20.0)
+    run.add_argument("--routes", default=ROUTES)
+    run.add_argument("--out")
+    run.set_defaults(func=cmd_run)
+
+    serve = sub.add_parser("serve", help="internal: one server process for `run`")
+    serve.add_argument("--mode", choices=("sync", "async"), required=True)
+    serve.add_argument("--database-url", required=True)
+    serve.add_argument("--port", type=int, required=True)
+    serve.add_argument("--threads", type=int, default=8)
+    serve.add_argument("--db-latency-ms", type=float, default=0.0)
+    serve.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Concurrent load against a file-backed SQLite database, with and without the engine tuning.
+
+    python benchmarks/bench_engine.py --threads 16 --seconds 5
+
+Each thread mixes point reads (GET /users/<id>) with writes (POST /books); the run reports
+successful requests/s and failures (mostly "database is locked") for each mode.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+
+MODES = {
+    # what the app ran with before the tuning surface existed
+    "untuned": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL"},
+    "tuned": {},
+}
+
+
+def run(mode, threads, seconds, write_ratio):
+    tmp = tempfile.mkdtemp()
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp}/bench.db", **MODES[mode]})
+    app.logger.setLevel(logging.CRITICAL)
+    with app.app_context():
+        db.create_all(bind_key=None)
+    client = app.test_client()
+    users = [client.post("/users", json={"username": f"u{i}", "library_name": "l"}).get_json() for i in range(50)]
+
+    ok, failed = [0] * threads, [0] * threads
+    stop = time.monotonic() + seconds
+
+    def worker(n):
+        c = app.test_client()
+        rnd = random.Random(n)
+        while time.monotonic() < stop:
+            u = rnd.choice(users)
+            if rnd.random() < write_ratio:
+                r = c.post("/books", json={"title": "t", "author": "a", "library_id": u["library"]["id"]})
+            else:
+                r = c.get(f"/users/{u['id']}")
+            if r.status_code < 400:
+                ok[n] += 1
+            else:
+                failed[n] += 1
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    with app.app_context():
+        db.engine.dispose()
+    return sum(ok) / seconds, sum(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    args = parser.parse_args()
+    for mode in MODES:
+        rps, failed = run(mode, args.threads, args.seconds, args.write_ratio)
+        print(f"{mode:8} {rps:9.1f} req/s  {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
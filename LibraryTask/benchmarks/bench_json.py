@@ -0,0 +1,71 @@
+"""Microbenchmark: the old listing path (hydrated Book objects, isoformat() + "Z", Flask's default
+provider) against the current one (column rows, native datetimes, orjson or the stdlib provider).
+
+    python benchmarks/bench_json.py --books 100000 --repeat 5
+"""
+import argparse
+import time
+
+from flask.json.provider import DefaultJSONProvider
+from common import make_app, seed, temp_database_url
+from app.extensions import db
+from app.jsonprovider import OrjsonProvider, StdlibJSONProvider, orjson
+from app.models import Book
+from app.routes import BOOK_COLUMNS, BOOK_FIELDS
+
+
+def old_book_json(b):
+    return {"id": b.id, "title": b.title, "author": b.author, "library_id": b.library_id,
+            "created_at": b.created_at.isoformat() + "Z"}
+
+
+def new_book_json(r):
+    return dict(zip(BOOK_FIELDS, r))
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = make_app(temp_database_url())
+    seed(app, 100, args.books)
+    providers = {"flask default": DefaultJSONProvider(app), "stdlib": StdlibJSONProvider(app)}
+    if orjson is not None:
+        providers["orjson"] = OrjsonProvider(app)
+
+    with app.test_request_context():
+        orm = Book.query.all()
+        rows = db.session.query(*BOOK_COLUMNS).all()
+        cases = {
+            "load: ORM objects": lambda: Book.query.all(),
+            "load: column rows": lambda: db.session.query(*BOOK_COLUMNS).all(),
+            "dicts: ORM + isoformat": lambda: [old_book_json(b) for b in orm],
+            "dicts: rows + native datetime": lambda: [new_book_json(r) for r in rows],
+        }
+        old_dicts = [old_book_json(b) for b in orm]
+        new_dicts = [new_book_json(r) for r in rows]
+        for name, provider in providers.items():
+            dicts = old_dicts if name == "flask default" else new_dicts
+            cases[f"encode: {name}"] = lambda p=provider, d=dicts: p.response(d).get_data()
+        cases["end to end: old"] = lambda: providers["flask default"].response([old_book_json(b) for b in Book.query.all()]).get_data()
+        fastest = providers.get("orjson", providers["stdlib"])
+        cases["end to end: new"] = lambda: fastest.response([new_book_json(r) for r in db.session.query(*BOOK_COLUMNS)]).get_data()
+
+        for name, fn in cases.items():
+            print(f"{name:32} {timed(fn, args.repeat):9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""Latency / throughput benchmark for every route in app/routes.py.
+
+Seed a database and drive each route through the Flask test client:
+
+    python benchmarks/bench_routes.py run --users 1000 --books 1000000 --requests 200 --out results.json
+
+Same, through a real WSGI server with several worker processes and concurrent clients:
+
+    python benchmarks/bench_routes.py run --mode server --workers 4 --concurrency 16 --out results.json
+
+Fail (exit 1) when any route regressed by more than the threshold against a saved baseline:
+
+    python benchmarks/bench_routes.py compare baseline.json results.json --threshold 0.2
+
+--database-url defaults to a fresh SQLite file; point it at a scratch Postgres database to
+benchmark that instead (its tables are dropped and recreated unless --reuse is given).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+from common import make_app, peak_rss_mb, queries_from, seed, summarize, temp_database_url
+
+
+# ---------------- scenarios ----------------
+# each one maps (rng, data) to (method, path, json body); data holds the seeded ids plus
+# "spare" users and books created up front for the destructive routes
+
+def _book(rng, data):
+    lo, hi = data["book_id_range"]
+    return rng.randint(lo, hi)
+
+
+SCENARIOS = {
+    "list_users_page": lambda r, d: ("GET", "/users?limit=100", None),
+    "get_user": lambda r, d: ("GET", f"/users/{r.choice(d['user_ids'])}", None),
+    "create_user": lambda r, d: ("POST", "/users", {"username": f"bench-{r.getrandbits(64)}", "library_name": "bench"}),
+    "update_user": lambda r, d: ("PUT", f"/users/{r.choice(d['user_ids'])}", {"library_name": f"renamed {r.random()}"}),
+    "delete_user": lambda r, d: ("DELETE", f"/users/{d['spare_users'].popleft()}", None),
+    "user_books_count": lambda r, d: ("GET", f"/users/{r.choice(d['user_ids'])}/books/count", None),
+    "list_libraries_page": lambda r, d: ("GET", "/libraries?limit=100", None),
+    "books_under_library": lambda r, d: ("GET", f"/libraries/{r.choice(d['library_ids'])}/books", None),
+    "books_under_library_page": lambda r, d: ("GET", f"/libraries/{r.choice(d['library_ids'])}/books?limit=50", None),
+    "transfer_to_library": lambda r, d: ("POST", f"/libraries/{r.choice(d['library_ids'])}/transfer",
+                                         {"book_ids": [_book(r, d) for _ in range(20)]}),
+    "create_book": lambda r, d: ("POST", "/books", {"title": "bench", "author": "bench", "library_id": r.choice(d["library_ids"])}),
+    "list_books_page": lambda r, d: ("GET", "/books?limit=100", None),
+    "list_books_by_library": lambda r, d: ("GET", f"/books?library_id={r.choice(d['library_ids'])}&limit=100", None),
+    "search_books": lambda r, d: ("GET", f"/books?q={r.choice(['riv', 'glass%20stone', 'okafor', 'winter'])}&limit=50", None),
+    "update_book": lambda r, d: ("PUT", f"/books/{_book(r, d)}", {"title": f"retitled {r.random()}"}),
+    "delete_book": lambda r, d: ("DELETE", f"/books/{d['spare_books'].popleft()}", None),
+    "transfer_book": lambda r, d: ("POST", f"/books/{_book(r, d)}/transfer", {"to_library_id": r.choice(d["library_ids"])}),
+    "bulk_create_books": lambda r, d: ("POST", "/books/bulk", [
+        {"title": "bulk", "author": "bench", "library_id": r.choice(d["library_ids"])} for _ in range(100)]),
+    "bulk_update_books": lambda r, d: ("PATCH", "/books/bulk", [{"id": _book(r, d), "title": "bulk"} for _ in range(100)]),
+    "bulk_delete_books": lambda r, d: ("DELETE", "/books/bulk", {"ids": [d["spare_books"].popleft() for _ in range(100)]}),
+}
+
+
+def prepare_spares(client_call, data, requests):
+    """Creates the rows the delete scenarios consume, so they never hit a 404."""
+    data["spare_users"] = deque()
+    for i in range(requests + 10):
+        status, body, _ = client_call("POST", "/users", {"username": f"spare-{i}-{random.getrandbits(32)}", "library_name": "spare"})
+        data["spare_users"].append(json.loads(body)["id"])
+    items = [{"title": "spare", "author": "spare", "library_id": data["library_ids"][0]} for _ in range(requests * 101 + 10)]
+    data["spare_books"] = deque()
+    for start in range(0, len(items), 10000):
+        status, body, _ = client_call("POST", "/books/bulk", items[start:start + 10000])
+        data["spare_books"].extend(r["book"]["id"] for r in json.loads(body)["results"])
+
+
+def run_scenario(name, call, data, requests, concurrency, rng_seed):
+    make = SCENARIOS[name]
+    lock = threading.Lock()
+    latencies, queries, errors = [], [], [0]
+
+    def worker(n, count):
+        rng = random.Random(rng_seed * 1000 + n)
+        for _ in range(count):
+            with lock:
+                method, path, body = make(rng, data)
+            start = time.perf_counter()
+            status, _, headers = call(method, path, body)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                q = queries_from(headers)
+                if q is not None:
+                    queries.append(q)
+                if status >= 400:
+                    errors[0] += 1
+
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(per_thread)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, time.perf_counter() - start, queries, errors[0])
+
+
+# ---------------- transports ----------------
+
+def test_client_caller(app):
+    client = app.test_client()
+
+    def call(method, path, body):
+        r = client.open(path, method=method, json=body)
+        return r.status_code, r.get_data(), r.headers
+    return call
+
+
+def http_caller(port):
+    local = threading.local()
+
+    def call(method, path, body):
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            local.conn.request(method, path, body=payload, headers=headers)
+            r = local.conn.getresponse()
+            return r.status, r.read(), r.headers
+        except (ConnectionError, http.client.HTTPException):
+            local.conn.close()
+            del local.conn
+            return 599, b"", {}
+    return call
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database_url, workers):
+    port = free_port()
+    return spawn_server([__file__, "serve", "--database-url", database_url, "--port", str(port),
+                         "--workers", str(workers)], port)
+
+
+def spawn_server(argv, port):
+    """Runs `python argv...` and waits until it accepts connections on port."""
+    proc = subprocess.Popen([sys.executable, *argv])
+    for _ in range(200):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("benchmark server did not start")
+
+
+# ---------------- commands ----------------
+
+def cmd_serve(args):
+    """Pre-forked server: --workers processes, each a threaded WSGI server on one shared socket."""
+    import logging
+    import signal
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            # each worker builds its own app so no engine or connection crosses the fork
+            app = make_app(args.database_url)
+            make_server("127.0.0.1", args.port, app, threaded=True, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        for pid in children:
+            os.waitpid(pid, 0)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.pause()
+
+
+def server_rss_mb(pid):
+    """Peak RSS summed over the server's worker processes."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids = [int(p) for p in f.read().split()]
+    except OSError:
+        pids = [pid]
+    sizes = [peak_rss_mb(p) for p in pids]
+    return round(sum(s for s in sizes if s), 1) or None
+
+
+def cmd_run(args):
+    database_url = args.database_url or temp_database_url()
+    app = make_app(database_url)
+    started = time.perf_counter()
+    data = seed(app, args.users, args.books, reset=not args.reuse)
+    seed_seconds = round(time.perf_counter() - started, 1)
+
+    server = None
+    if args.mode == "server":
+        server, port = start_server(database_url, args.workers)
+        call = http_caller(port)
+    else:
+        call = test_client_caller(app)
+        args.concurrency = 1  # the test client runs requests inline; concurrency needs --mode server
+
+    names = args.routes.split(",") if args.routes else list(SCENARIOS)
+    try:
+        prepare_spares(call, data, args.requests + args.warmup)
+        results = {}
+        for name in names:
+            run_scenario(name, call, data, min(args.warmup, args.requests), args.concurrency, 0)  # warm caches and pools
+            results[name] = run_scenario(name, call, data, args.requests, args.concurrency, 1)
+            print(f"{name:26} p50 {results[name]['p50_ms']:8.2f}ms  p95 {results[name]['p95_ms']:8.2f}ms  "
+                  f"p99 {results[name]['p99_ms']:8.2f}ms  {results[name]['rps']:8.1f} req/s  "
+                  f"{results[name]['queries_per_request']} q/req  {results[name]['errors']} errors")
+        server_rss = server_rss_mb(server.pid) if server else None
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {
+            "mode": args.mode, "workers": args.workers, "concurrency": args.concurrency,
+            "users": args.users, "books": args.books, "requests": args.requests,
+            "database": database_url.split(":", 1)[0], "seed_seconds": seed_seconds,
+        },
+        "peak_rss_mb": {"client": peak_rss_mb(), "server": server_rss},
+        "routes": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            return report_regressions(compare(json.load(f), report, args.threshold))
+    return 0
+
+
+def compare(baseline, current, threshold):
+    """Routes whose p95 grew, throughput fell, or query count rose beyond the threshold."""
+    regressions = []
+    for name, base in baseline["routes"].items():
+        cur = current["routes"].get(name)
+        if cur is None:
+            continue
+        if base["p95_ms"] and cur["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {cur['p95_ms']}ms")
+        if base["rps"] and cur["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: {base['rps']} -> {cur['rps']} req/s")
+        if base["queries_per_request"] is not None and (cur["queries_per_request"] or 0) > base["queries_per_request"]:
+            regressions.append(f"{name}: {base['queries_per_request']} -> {cur['queries_per_request']} queries/request")
+        if cur["errors"] > base["errors"]:
+            regressions.append(f"{name}: {base['errors']} -> {cur['errors']} errors")
+    return regressions
+
+
+def report_regressions(regressions):
+    for line in regressions:
+        print("REGRESSION", line)
+    return 1 if regressions else 0
+
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        current = json.load(f)
+    return report_regressions(compare(baseline, current, args.threshold))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run")
+    run.add_argument("--database-url")
+    run.add_argument("--reuse", action="store_true", help="keep an already seeded database")
+    run.add_argument("--users", type=int, default=1000)
+    run.add_argument("--books", type=int, default=1000000)
+    run.add_argument("--requests", type=int, default=200, help="measured requests per route")
+    run.add_argument("--warmup", type=int, default=20)
+    run.add_argument("--mode", choices=("client", "server"), default="client")
+    run.add_argument("--workers", type=int, default=4, help="server processes for --mode server")
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--routes", help="comma separated subset of: " + ", ".join(SCENARIOS))
+    run.add_argument("--out")
+    run.add_argument("--baseline", help="compare against this results file and exit 1 on regression")
+    run.add_argument("--threshold", type=float, default=0.2)
+    run.set_defaults(func=cmd_run)
+
+    serve = sub.add_parser("serve", help="internal: the WSGI server used by --mode server")
+    serve.add_argument("--database-url", required=True)
+    serve.add_argument("--port", type=int, required=True)
+    serve.add_argument("--workers", type=int, default=4)
+    serve.set_defaults(func=cmd_serve)
+
+    cmp_ = sub.add_parser("compare")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("results")
+    cmp_.add_argument("--threshold", type=float, default=0.2)
+    cmp_.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Book write throughput against the number of book shards (BOOK_SHARDS, app/sharding.py).
+
+    python benchmarks/bench_shards.py run --shards 0,1,2,4 --concurrency 32 --commit-latency-ms 10 --out shards.json
+
+For every shard count a fresh primary and that many shard databases (SQLite files) get the same users
+and libraries, then a threaded server is driven with concurrent book writes; 0 is the unsharded app.
+--commit-latency-ms makes every commit that wrote something wait that long before it completes, with
+the write lock still held, standing in for a durable commit on networked storage. A database commits
+one writer at a time, so unsharded every book write queues behind the others, while N shards commit
+up to N at once. With 0 a local SQLite commit is so cheap that the run is bound by Python CPU and
+sharding only adds its own overhead.
+
+bulk_import_library posts 100 books into one library, so it lands on one shard. bulk_create_books
+spreads its items over every library and so over every shard; such a request keeps the first shard's
+write lock until it has committed on all of them, and gets slower as shards are added.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common import make_app, seed
+from bench_routes import SCENARIOS, free_port, http_caller, run_scenario, server_rss_mb, spawn_server
+
+SCENARIOS["bulk_import_library"] = lambda r, d: ("POST", "/books/bulk", [
+    {"title": "bulk", "author": "bench", "library_id": lib} for lib in [r.choice(d["library_ids"])] * 100])
+
+ROUTES = "create_book,bulk_import_library"
+
+
+def add_commit_latency(engine, seconds):
+    """Commits of transactions that wrote wait `seconds` first, holding their locks."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def note_write(conn, cursor, statement, *args):
+        if statement.lstrip().startswith(("INSERT", "UPDATE", "DELETE")):
+            conn.info["wrote"] = True
+
+    @event.listens_for(engine, "commit")
+    def delay(conn):
+        if conn.info.pop("wrote", False):
+            time.sleep(seconds)
+
+
+def create_databases(directory, users, shards):
+    """Seeds primary.db with users and libraries and creates shard0.db.. with empty book tables.
+    Returns the primary URL, the shard URLs and the seeded ids."""
+    from app.extensions import db
+    from app.sharding import create_shard_tables
+    primary = f"sqlite:///{os.path.join(directory, 'primary.db')}"
+    urls = [f"sqlite:///{os.path.join(directory, f'shard{i}.db')}" for i in range(shards)]
+    data = seed(make_app(primary), users, 0)
+    if urls:
+        app = make_app(primary, BOOK_SHARDS=urls)
+        with app.app_context():
+            create_shard_tables()
+            for engine in db.engines.values():
+                engine.dispose()
+    return primary, urls, data
+
+
+def cmd_serve(args):
+    from werkzeug.serving import make_server
+    from app.extensions import db
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    app = make_app(args.database_url, BOOK_SHARDS=args.shard_urls.split(",") if args.shard_urls else [])
+    if args.commit_latency_ms:
+        with app.app_context():
+            for engine in db.engines.values():
+                add_commit_latency(engine, args.commit_latency_ms / 1000)
+    make_server("127.0.0.1", args.port, app, threaded=True).serve_forever()
+    return 0
+
+
+def cmd_run(args):
+    counts = [int(n) for n in args.shards.split(",")]
+    names = args.routes.split(",")
+    results = {}
+    for count in counts:
+        directory = tempfile.mkdtemp(prefix="librarytask-shards-")
+        server = None
+        try:
+            primary, urls, data = create_databases(directory, args.users, count)
+            port = free_port()
+            server, port = spawn_server([__file__, "serve", "--database-url", primary, "--shard-urls", ",".join(urls),
+                                         "--port", str(port), "--commit-latency-ms", str(args.commit_latency_ms)], port)
+            call = http_caller(port)
+            results[str(count)] = {}
+            for name in names:
+                run_scenario(name, call, data, min(args.warmup, args.requests), args.concurrency, 0)
+                r = results[str(count)][name] = run_scenario(name, call, data, args.requests, args.concurrency, 1)
+                print(f"{count:2} shards  {name:20} {r['rps']:8.1f} req/s  p50 {r['p50_ms']:8.2f}ms  "
+                      f"p99 {r['p99_ms']:8.2f}ms  {r['errors']} errors")
+            results[str(count)]["peak_rss_mb"] = server_rss_mb(server.pid)
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    # throughput relative to the first shard count given
+    base = results[str(counts[0])]
+    for count in counts:
+        for name in names:
+            r = results[str(count)][name]
+            r["speedup"] = round(r["rps"] / base[name]["rps"], 2) if base[name]["rps"] else None
+
+    report = {
+        "meta": {"users": args.users, "concurrency": args.concurrency, "requests": args.requests,
+                 "commit_latency_ms": args.commit_latency_ms, "shards": counts},
+        "shards": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run")
+    run.add_argument("--shards", default="0,1,2,4", help="shard counts to compare; 0 is the unsharded app")
+    run.add_argument("--users", type=int, default=1000)
+    run.add_argument("--requests", type=int, default=500, help="measured requests per route and shard count")
+    run.add_argument("--warmup", type=int, default=50)
+    run.add_argument("--concurrency", type=int, default=32)
+    run.add_argument("--commit-latency-ms", type=float, default=10.0)
+    run.add_argument("--routes", default=ROUTES)
+    run.add_argument("--out")
+    run.set_defaults(func=cmd_run)
+
+    serve = sub.add_parser("serve", help="internal: one server process for `run`")
+    serve.add_argument("--database-url", required=True)
+    serve.add_argument("--shard-urls", default="")
+    serve.add_argument("--port", type=int, required=True)
+    serve.add_argument("--commit-latency-ms", type=float, default=0.0)
+    serve.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""Wall time and peak memory of `flask snapshot export` / `restore` (app/snapshot.py), against replaying
+books through POST /books the way staging used to be seeded.
+
+    python benchmarks/bench_snapshot.py --users 10000 --books 1000000 --replay 2000
+
+The replay rate is measured on --replay books and extrapolated to --books. Peak memory is the process's
+max RSS after seeding and after each step. It should not grow with --books.
+"""
+import argparse
+import random
+import resource
+import tempfile
+import time
+
+from common import make_app, seed, temp_database_url
+from app.snapshot import export_snapshot, restore_snapshot
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--books", type=int, default=1000000)
+    parser.add_argument("--replay", type=int, default=2000, help="books sent through POST /books for the baseline")
+    args = parser.parse_args(argv)
+
+    app = make_app(args.database_url or temp_database_url(), METRICS_ENABLED=False)
+    data = seed(app, args.users, args.books)
+    print(f"seeded {args.users} users and {args.books} books, max RSS {max_rss_mb():.0f} MB")
+
+    with tempfile.TemporaryDirectory() as directory, app.app_context():
+        for name, step in (("export", export_snapshot), ("restore", restore_snapshot)):
+            start = time.perf_counter()
+            counts = step(directory)
+            elapsed = time.perf_counter() - start
+            print(f"{name:8} {elapsed:8.1f}s  {counts['book'] / elapsed:9.0f} books/s  max RSS {max_rss_mb():.0f} MB")
+
+    client, rng = app.test_client(), random.Random(0)
+    start = time.perf_counter()
+    for i in range(args.replay):
+        client.post("/books", json={"title": f"replayed {i}", "author": "replay", "library_id": rng.choice(data["library_ids"])})
+    rate = args.replay / (time.perf_counter() - start)
+    print(f"replay   {rate:9.0f} books/s through POST /books, {args.books / rate / 60:.1f} min for {args.books} books")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Helpers shared by the scripts in benchmarks/: app setup, seeding and latency statistics."""
+import logging
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import Book, Library, User  # noqa: E402
+
+WORDS = ("river", "night", "glass", "stone", "winter", "garden", "silver", "shadow", "empire", "ocean",
+         "letter", "forest", "mirror", "harbor", "crown", "storm", "island", "signal", "paper", "engine")
+AUTHORS = [f"{first} {last}" for first in ("Ada", "Ben", "Cleo", "Dev", "Eli", "Fay", "Gus", "Hana")
+           for last in ("Moreau", "Okafor", "Lindqvist", "Tanaka", "Reyes", "Novak", "Haddad", "Quinn")]
+
+
+def temp_database_url():
+    return f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='librarytask-bench-'), 'bench.db')}"
+
+
+def make_app(database_url, **config):
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database_url, **config})
+    app.logger.setLevel(logging.CRITICAL)
+    logging.getLogger("app.slow_query").setLevel(logging.CRITICAL)
+    return app
+
+
+def seed(app, users, books, batch_size=10000, rng_seed=0, reset=True):
+    """Fills the database with `users` users (one library each) and `books` books spread over them,
+    using multi-row inserts. Returns the id ranges the scenarios draw from."""
+    rng = random.Random(rng_seed)
+    with app.app_context():
+        if reset:
+            db.drop_all(bind_key=None)
+            db.create_all(bind_key=None)
+        if not db.session.scalar(select(func.count()).select_from(User)):
+            for start in range(0, users, batch_size):
+                n = min(batch_size, users - start)
+                db.session.execute(insert(User), [{"username": f"user{start + i}"} for i in range(n)])
+            user_ids = db.session.scalars(select(User.id).order_by(User.id)).all()
+            for start in range(0, len(user_ids), batch_size):
+                db.session.execute(insert(Library), [{"name": f"library {u}", "user_id": u} for u in user_ids[start:start + batch_size]])
+            library_ids = db.session.scalars(select(Library.id)).all()
+            epoch = datetime(2020, 1, 1)
+            for start in range(0, books, batch_size):
+                n = min(batch_size, books - start)
+                db.session.execute(insert(Book), [{
+                    "title": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {start + i}",
+                    "author": rng.choice(AUTHORS),
+                    "library_id": rng.choice(library_ids),
+                    "created_at": epoch + timedelta(minutes=start + i),
+                } for i in range(n)])
+                db.session.commit()
+            db.session.execute(text(
+                "UPDATE library SET book_count = (SELECT COUNT(*) FROM book WHERE book.library_id = library.id)"
+            ))
+            db.session.commit()
+        data = {
+            "user_ids": db.session.scalars(select(User.id)).all(),
+            "library_ids": db.session.scalars(select(Library.id)).all(),
+            "book_id_range": db.session.execute(select(func.min(Book.id), func.max(Book.id))).one(),
+        }
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    return data
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, elapsed, queries, errors):
+    """latencies in seconds; queries per request as reported by the Server-Timing header."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def queries_from(headers):
+    m = _QUERIES.search(headers.get("Server-Timing", ""))
+    return int(m.group(1)) if m else None
+
+
+def peak_rss_mb(pid=None):
+    """Peak resident set size of this process, or of pid (Linux /proc) when given."""
+    if pid is None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(kb / 1024 if sys.platform != "darwin" else kb / 1024 / 1024, 1)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
@@ -0,0 +1,53 @@
+"""book full-text search
+
+Revision ID: 062a03ccc4ce
+Revises: 91b70e97a1e8
+Create Date: 2026-10-17 11:02:19.774310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '062a03ccc4ce'
+down_revision = '91b70e97a1e8'
+branch_labels = None
+depends_on = None
+
+
+# kept in sync with app/search.py by hand; migrations must not import the app
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+    "title, author, content='book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF title, author ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    # index the rows that already exist
+    "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS book_fts_au",
+    "DROP TRIGGER IF EXISTS book_fts_ad",
+    "DROP TRIGGER IF EXISTS book_fts_ai",
+    "DROP TABLE IF EXISTS book_fts",
+]
+PG_UPGRADE = ["CREATE INDEX IF NOT EXISTS ix_book_search ON book USING GIN (to_tsvector('simple', title || ' ' || author))"]
+PG_DOWNGRADE = ["DROP INDEX IF EXISTS ix_book_search"]
+
+
+def _run(statements):
+    for stmt in statements.get(op.get_bind().dialect.name, []):
+        op.execute(stmt)
+
+
+def upgrade():
+    _run({"sqlite": SQLITE_UPGRADE, "postgresql": PG_UPGRADE})
+
+
+def downgrade():
+    _run({"sqlite": SQLITE_DOWNGRADE, "postgresql": PG_DOWNGRADE})
@@ -0,0 +1,105 @@
+"""catalog stats rollups
+
+Revision ID: 5c1e9a7f03bd
+Revises: 184fc16c2168
+Create Date: 2026-10-17 23:41:09.274310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e9a7f03bd'
+down_revision = '184fc16c2168'
+branch_labels = None
+depends_on = None
+
+
+# kept in sync with app/stats.py by hand; migrations must not import the app
+def _sqlite_add(table, key, value):
+    return (f"INSERT INTO {table}({key}, book_count) VALUES ({value}, 1) "
+            f"ON CONFLICT({key}) DO UPDATE SET book_count = book_count + 1")
+
+
+def _sqlite_remove(table, key, value):
+    return (f"UPDATE {table} SET book_count = book_count - 1 WHERE {key} = {value}; "
+            f"DELETE FROM {table} WHERE {key} = {value} AND book_count <= 0")
+
+
+SQLITE_UPGRADE = [
+    "CREATE TRIGGER IF NOT EXISTS book_stats_ai AFTER INSERT ON book BEGIN "
+    f"{_sqlite_add('author_stats', 'author', 'new.author')}; "
+    f"{_sqlite_add('daily_book_stats', 'day', 'date(new.created_at)')}; END",
+    "CREATE TRIGGER IF NOT EXISTS book_stats_ad AFTER DELETE ON book BEGIN "
+    f"{_sqlite_remove('author_stats', 'author', 'old.author')}; "
+    f"{_sqlite_remove('daily_book_stats', 'day', 'date(old.created_at)')}; END",
+    "CREATE TRIGGER IF NOT EXISTS book_stats_au AFTER UPDATE OF author ON book WHEN old.author IS NOT new.author BEGIN "
+    f"{_sqlite_remove('author_stats', 'author', 'old.author')}; "
+    f"{_sqlite_add('author_stats', 'author', 'new.author')}; END",
+]
+SQLITE_DOWNGRADE = [f"DROP TRIGGER IF EXISTS book_stats_{suffix}" for suffix in ("ai", "ad", "au")]
+PG_UPGRADE = [
+    "CREATE OR REPLACE FUNCTION book_stats() RETURNS trigger AS $$ BEGIN "
+    "IF TG_OP <> 'INSERT' THEN "
+    "UPDATE author_stats SET book_count = book_count - 1 WHERE author = OLD.author; "
+    "DELETE FROM author_stats WHERE author = OLD.author AND book_count <= 0; "
+    "END IF; "
+    "IF TG_OP = 'DELETE' THEN "
+    "UPDATE daily_book_stats SET book_count = book_count - 1 WHERE day = OLD.created_at::date; "
+    "DELETE FROM daily_book_stats WHERE day = OLD.created_at::date AND book_count <= 0; "
+    "END IF; "
+    "IF TG_OP <> 'DELETE' THEN "
+    "INSERT INTO author_stats(author, book_count) VALUES (NEW.author, 1) "
+    "ON CONFLICT (author) DO UPDATE SET book_count = author_stats.book_count + 1; "
+    "END IF; "
+    "IF TG_OP = 'INSERT' THEN "
+    "INSERT INTO daily_book_stats(day, book_count) VALUES (NEW.created_at::date, 1) "
+    "ON CONFLICT (day) DO UPDATE SET book_count = daily_book_stats.book_count + 1; "
+    "END IF; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "CREATE TRIGGER book_stats AFTER INSERT OR DELETE ON book FOR EACH ROW EXECUTE FUNCTION book_stats()",
+    "CREATE TRIGGER book_stats_author AFTER UPDATE OF author ON book FOR EACH ROW "
+    "WHEN (OLD.author IS DISTINCT FROM NEW.author) EXECUTE FUNCTION book_stats()",
+]
+PG_DOWNGRADE = ["DROP TRIGGER IF EXISTS book_stats ON book", "DROP TRIGGER IF EXISTS book_stats_author ON book",
+                "DROP FUNCTION IF EXISTS book_stats()"]
+BACKFILL_DAY = {"sqlite": "date(created_at)", "postgresql": "created_at::date"}
+
+
+def _run(statements):
+    for stmt in statements.get(op.get_bind().dialect.name, []):
+        op.execute(stmt)
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('author_stats',
+    sa.Column('author', sa.String(length=255), nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('author')
+    )
+    with op.batch_alter_table('author_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_author_stats_top', [sa.text('book_count DESC'), 'author'], unique=False)
+
+    op.create_table('daily_book_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    # ### end Alembic commands ###
+    op.execute("INSERT INTO author_stats(author, book_count) SELECT author, count(*) FROM book GROUP BY author")
+    day = BACKFILL_DAY[op.get_bind().dialect.name]
+    op.execute(f"INSERT INTO daily_book_stats(day, book_count) SELECT {day}, count(*) FROM book GROUP BY {day}")
+    _run({"sqlite": SQLITE_UPGRADE, "postgresql": PG_UPGRADE})
+
+
+def downgrade():
+    _run({"sqlite": SQLITE_DOWNGRADE, "postgresql": PG_DOWNGRADE})
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('daily_book_stats')
+    with op.batch_alter_table('author_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_author_stats_top')
+
+    op.drop_table('author_stats')
+    # ### end Alembic commands ###
@@ -0,0 +1,58 @@
+import unittest
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import create_app
+from app.extensions import db
+
+
+class QueryCounter:
+    """Records every statement the engine sends to the database while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class DBTestCase(unittest.TestCase):
+    """Runs the real app against an in-memory SQLite database."""
+
+    config = {}
+
+    def setUp(self):
+        # JOB_WORKERS=0 runs jobs inline: the in-memory database is a single shared connection
+        self.app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite://", "JOB_WORKERS": 0, **self.config})
+        self.client = self.app.test_client()
+        # bind_key=None: other apps in this process may have registered extra binds on db
+        with self.app.app_context():
+            db.create_all(bind_key=None)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all(bind_key=None)
+
+    @contextmanager
+    def assertQueries(self, expected):
+        with self.app.app_context():
+            engine = db.engine
+        with QueryCounter(engine) as counter:
+            yield counter
+        self.assertEqual(counter.count, expected, "\n\n".join(counter.statements))
+
+    def make_user(self, username, library_name=None):
+        r = self.client.post("/users", json={"username": username, "library_name": library_name or f"{username}-lib"})
+        self.assertEqual(r.status_code, 201)
+        return r.get_json()
@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+from support import DBTestCase
+from app.admission import Budget
+
+
+class BudgetTests(unittest.TestCase):
+    def test_queue_then_shed(self):
+        budget = Budget("read", limit=1, queue=1, timeout=5)
+        self.assertTrue(budget.acquire())
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(budget.acquire()))
+        waiter.start()
+        while not budget.waiting:
+            time.sleep(0.001)
+        self.assertFalse(budget.acquire())  # the queue is full
+        budget.release()
+        waiter.join()
+        self.assertEqual((results, budget.active, budget.admitted, budget.shed), ([True], 1, 2, 1))
+
+    def test_wait_times_out(self):
+        budget = Budget("scan", limit=1, queue=4, timeout=0.01)
+        budget.acquire()
+        self.assertFalse(budget.acquire())
+        self.assertEqual(budget.waiting, 0)
+
+    def test_adaptive_limit_follows_latency(self):
+        budget = Budget("write", limit=8, queue=0, timeout=0, adaptive=True)
+        for _ in range(8):
+            budget.acquire()
+        for _ in range(8):
+            budget.release(0.01)
+        self.assertEqual(budget.limit, 8)  # already at the ceiling
+        for _ in range(8):
+            budget.acquire()
+            budget.release(0.1)  # ten times the baseline
+        self.assertEqual(budget.limit, 1)
+        for _ in range(10):
+            budget.acquire()
+            budget.release(0.01)
+        self.assertGreater(budget.limit, 1)
+
+
+class AdmissionControlTests(DBTestCase):
+    config = {"ADMISSION_CONTROL": True, "ADMISSION_LIMITS": {"read": 1, "scan": 1, "write": 1},
+              "ADMISSION_QUEUES": {"read": 0, "scan": 0, "write": 0}, "ADMISSION_RETRY_AFTER": 2}
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("a")
+        self.budgets = self.app.extensions["admission"]
+
+    def test_exhausted_class_is_shed_with_retry_after(self):
+        uid = self.user["id"]
+        self.budgets["read"].acquire()
+        r = self.client.get(f"/users/{uid}")
+        self.assertEqual((r.status_code, r.headers["Retry-After"], r.get_json()["class"]), (503, "2", "read"))
+        # other classes still get through
+        self.assertEqual(self.client.get("/books?q=x").status_code, 200)
+        self.assertEqual(self.client.put(f"/users/{uid}", json={"username": "b"}).status_code, 200)
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        self.budgets["read"].release()
+        self.assertEqual(self.client.get(f"/users/{uid}").status_code, 200)
+        self.assertEqual({name: b.active for name, b in self.budgets.items()}, {"read": 0, "scan": 0, "write": 0})
+
+    def test_request_classes(self):
+        self.budgets["scan"].acquire()
+        for path in ("/users", "/books", "/books?limit=5&q=x", f"/libraries/{self.user['library']['id']}/books"):
+            self.assertEqual(self.client.get(path).status_code, 503, path)
+        # a cursor alone is a page at DEFAULT_PAGE_SIZE
+        self.make_user("b")
+        cursor = self.client.get("/users?limit=1").get_json()["next_cursor"]
+        for path in ("/users?limit=5", f"/users?cursor={cursor}", "/books?limit=5", f"/books?ids=1", "/stats/daily"):
+            self.assertEqual(self.client.get(path).status_code, 200, path)
+        body = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('admission_shed_total{class="scan"} 4', body)
+        self.assertIn('admission_in_flight{class="scan"} 1', body)
+
+
+class AdmissionDisabledTests(DBTestCase):
+    def test_off_by_default(self):
+        self.assertNotIn("admission", self.app.extensions)
+
+
+if __name__ == "__main__":
+    unittest.main()
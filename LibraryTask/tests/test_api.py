@@ -1,90 +1,98 @@
 import unittest
+from datetime import datetime
 from unittest.mock import MagicMock, patch
 from app import create_app
 
 class APIMainTests(unittest.TestCase):
     def setUp(self):
-        self.client = create_app({"TESTING": True}).test_client()
+        # every query is mocked; keep the job runner from looking in the real database
+        self.client = create_app({"TESTING": True, "JOB_RESUME": False}).test_client()
 
+    @patch("app.routes.joinedload")
     @patch("app.routes.Library")
     @patch("app.routes.User")
     @patch("app.routes.db")
-    def test_user_add(self, db, User, Library):
-        u = MagicMock(id=1, username="u1"); User.return_value = u
-        lib = MagicMock(id=10, name="L1"); Library.return_value = lib
-        Library.query.filter_by.return_value.first.return_value = lib
+    def test_user_add(self, db, User, Library, joinedload):
+        lib = MagicMock(id=10); lib.name = "L1"
+        u = MagicMock(id=1, username="u1", library=lib); User.return_value = u
+        User.query.options.return_value.filter.return_value.first.return_value = u
         r = self.client.post("/users", json={"username": "u1", "library_name": "L1"})
         self.assertEqual(r.status_code, 201)
         d = r.get_json()
         self.assertEqual((d["id"], d["username"], d["library"]["id"], d["library"]["name"]), (1, "u1", 10, "L1"))
         db.session.commit.assert_called_once()
+        joinedload.assert_called_once_with(User.library)
 
-    @patch("app.routes.Library")
-    @patch("app.routes.db")
-    def test_user_get(self, db, Library):
-        db.session.get.return_value = MagicMock(id=1, username="u1")
-        Library.query.filter_by.return_value.first.return_value = MagicMock(id=10, name="L1")
+    @patch("app.routes.user_with_library")
+    def test_user_get(self, user_with_library):
+        user_with_library.return_value = MagicMock(id=1, username="u1", version_id=3, library_id=10, library_name="L1",
+                                                   library_version_id=2)
         r = self.client.get("/users/1")
         self.assertEqual(r.status_code, 200)
         d = r.get_json()
         self.assertEqual((d["id"], d["username"], d["library"]["id"]), (1, "u1", 10))
+        self.assertEqual(r.headers["ETag"], '"3.2"')
+        user_with_library.assert_called_once_with(1)
 
-    @patch("app.routes.Library")
+    @patch("app.routes.joinedload")
+    @patch("app.routes.User")
     @patch("app.routes.Book")
     @patch("app.routes.db")
-    def test_user_delete(self, db, Book, Library):
-        db.session.get.return_value = MagicMock(id=1)
-        Library.query.filter_by.return_value.first.return_value = MagicMock(id=10)
+    def test_user_delete(self, db, Book, User, joinedload):
+        User.query.options.return_value.filter.return_value.first.return_value = MagicMock(id=1, library=MagicMock(id=10, book_count=3))
         r = self.client.delete("/users/1")
         self.assertEqual(r.status_code, 200)
         db.session.commit.assert_called_once()
 
+    @patch("app.routes.library_exists", return_value=True)
+    @patch("app.routes.adjust_book_counts")
     @patch("app.routes.Book")
     @patch("app.routes.db")
-    def test_book_add(self, db, Book):
-        db.session.get.return_value = MagicMock(id=10)
-        b = MagicMock(id=5, title="t", author="a", library_id=10, created_at=MagicMock())
-        b.created_at.isoformat.return_value = "2026-01-01T00:00:00"
+    def test_book_add(self, db, Book, adjust_book_counts, library_exists):
+        b = MagicMock(id=5, title="t", author="a", library_id=10, created_at=datetime(2026, 1, 1))
         Book.return_value = b
         r = self.client.post("/books", json={"title": "t", "author": "a", "library_id": 10})
         self.assertEqual(r.status_code, 201)
         self.assertEqual(r.get_json()["id"], 5)
         db.session.commit.assert_called_once()
+        adjust_book_counts.assert_called_once_with({10: 1})
 
-    @patch("app.routes.Book")
-    def test_book_list(self, Book):
-        b = MagicMock(id=5, title="t", author="a", library_id=10, created_at=MagicMock())
-        b.created_at.isoformat.return_value = "2026-01-01T00:00:00"
-        Book.query.all.return_value = [b]
+    @patch("app.routes.db")
+    def test_book_list(self, db):
+        db.session.query.return_value.all.return_value = [(5, "t", "a", 10, datetime(2026, 1, 1))]
         r = self.client.get("/books")
         self.assertEqual(r.status_code, 200)
         self.assertEqual(len(r.get_json()), 1)
+        self.assertEqual(r.get_json()[0]["created_at"], "2026-01-01T00:00:00Z")
 
+    @patch("app.routes.adjust_book_counts")
     @patch("app.routes.db")
-    def test_book_delete(self, db):
-        db.session.get.return_value = MagicMock(id=5)
+    def test_book_delete(self, db, adjust_book_counts):
+        db.session.get.return_value = MagicMock(id=5, library_id=10)
         r = self.client.delete("/books/5")
         self.assertEqual(r.status_code, 200)
         db.session.commit.assert_called_once()
+        adjust_book_counts.assert_called_once_with({10: -1})
 
-    @patch("app.routes.Book")
-    @patch("app.routes.Library")
-    def test_user_books_count(self, Library, Book):
-        Library.query.filter_by.return_value.first.return_value = MagicMock(id=10)
-        Book.query.filter_by.return_value.count.return_value = 2
+    @patch("app.routes.library_of_user")
+    def test_user_books_count(self, library_of_user):
+        library_of_user.return_value = MagicMock(id=10, book_count=2)
         r = self.client.get("/users/1/books/count")
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.get_json()["count"], 2)
 
+    @patch("app.routes.library_exists", return_value=True)
+    @patch("app.routes.adjust_book_counts")
     @patch("app.routes.db")
-    def test_transfer_book(self, db):
-        book = MagicMock(id=5, title="t", author="a", library_id=10, created_at=MagicMock())
-        book.created_at.isoformat.return_value = "2026-01-01T00:00:00"
-        db.session.get.side_effect = [book, MagicMock(id=20)]
+    def test_transfer_book(self, db, adjust_book_counts, library_exists):
+        book = MagicMock(id=5, title="t", author="a", library_id=10, created_at=datetime(2026, 1, 1))
+        db.session.get.return_value = book
         r = self.client.post("/books/5/transfer", json={"to_library_id": 20})
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.get_json()["book"]["library_id"], 20)
         db.session.commit.assert_called_once()
+        adjust_book_counts.assert_called_once_with({10: -1, 20: 1})
+        library_exists.assert_called_once_with(20)
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from support import DBTestCase
+
+try:
+    import aiosqlite  # noqa: F401
+    from app.aio import AsyncApp
+except ImportError:
+    AsyncApp = None
+
+
+@unittest.skipIf(AsyncApp is None, "async mode needs aiosqlite")
+class AsyncTestCase(DBTestCase):
+    extra = {}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # aiosqlite cannot share an in-memory database with the sync engine
+        self.config = {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(self.tmp.name, 'async.db')}", **self.extra}
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self.aio = AsyncApp(self.app)
+        self.lib = self.make_user("owner")["library"]["id"]
+        self.make_user("other")
+        for i in range(5):
+            self.client.post("/books", json={"title": f"harry {i}", "author": "rowling", "library_id": self.lib})
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.aio.engine.dispose())
+        self.loop.close()
+        super().tearDown()
+        self.tmp.cleanup()
+
+    def call(self, method, path, body=None, headers=None):
+        path, _, query = path.partition("?")
+        payload = json.dumps(body).encode() if body is not None else b""
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+                 "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+                 "root_path": "", "headers": [(b"host", b"localhost"), (b"content-type", b"application/json"),
+                             (b"content-length", str(len(payload)).encode())]
+                            + [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+                 "server": ("localhost", 80), "client": ("127.0.0.1", 1)}
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": payload, "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        self.loop.run_until_complete(self.aio(scope, receive, send))
+        body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+        self.headers = {k.decode(): v.decode() for k, v in sent[0]["headers"]}
+        return sent[0]["status"], body
+
+
+class AsyncModeTests(AsyncTestCase):
+    """The ASGI app must answer exactly like the Flask app, whichever side serves the route."""
+
+    def assertSameAsFlask(self, path):
+        status, body = self.call("GET", path)
+        r = self.client.get(path)
+        self.assertEqual((status, json.loads(body)), (r.status_code, r.get_json()), path)
+
+    def test_read_routes_match_flask(self):
+        for path in ["/users", "/users/1", "/users/99", "/users/1/books/count", "/libraries?limit=1",
+                     f"/libraries/{self.lib}/books", "/libraries/99/books", "/books",
+                     f"/books?library_id={self.lib}&q=harry 2", "/books?fields=title&limit=2", "/books?limit=0",
+                     "/users?ids=1,99,1", "/books?ids=3,1,99&fields=title", "/books?ids=x"]:
+            self.assertSameAsFlask(path)
+        self.call("GET", "/users/1")
+        self.assertEqual(self.headers["etag"], self.client.get("/users/1").headers["ETag"])
+
+    def test_if_none_match(self):
+        etag = self.client.get("/users/1").headers["ETag"]
+        self.assertEqual(self.call("GET", "/users/1", headers={"If-None-Match": etag}), (304, b""))
+        self.assertEqual(self.headers["etag"], etag)
+        self.client.put("/users/1", json={"username": "renamed"})
+        self.assertEqual(self.call("GET", "/users/1", headers={"If-None-Match": etag})[0], 200)
+
+    def test_metrics_and_server_timing(self):
+        self.call("GET", "/users/1")
+        self.assertIn('desc="1 queries"', self.headers["server-timing"])
+        body = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('http_request_queries_count{endpoint="get_user"} 1', body)
+
+    def test_cursor_pages_through_async_path(self):
+        status, body = self.call("GET", "/books?limit=3")
+        first = json.loads(body)
+        status, body = self.call("GET", f"/books?limit=3&cursor={first['next_cursor']}")
+        titles = [b["title"] for b in first["items"] + json.loads(body)["items"]]
+        self.assertEqual(titles, [f"harry {i}" for i in range(5)])
+
+    def test_writes_and_streams_go_to_flask(self):
+        status, body = self.call("POST", "/books", {"title": "dune", "author": "herbert", "library_id": self.lib})
+        self.assertEqual(status, 201)
+        self.assertEqual(self.call("GET", "/users/1/books/count")[1], b'{"user_id":1,"library_id":1,"count":6}\n')
+        status, body = self.call("GET", "/books?stream=1&format=ndjson")
+        self.assertEqual(len(body.splitlines()), 6)
+        self.assertEqual(self.call("GET", "/nope")[0], 404)
+
+
+class AsyncAdmissionTests(AsyncTestCase):
+    extra = {"ADMISSION_CONTROL": True, "ADMISSION_LIMITS": {"read": 1, "scan": 1, "write": 1},
+             "ADMISSION_QUEUES": {"read": 1, "scan": 0, "write": 0}, "ADMISSION_QUEUE_TIMEOUT_MS": 10}
+
+    def test_async_views_share_the_budgets(self):
+        budgets = self.app.extensions["admission"]
+        budgets["read"].acquire()
+        # queued on a thread for ADMISSION_QUEUE_TIMEOUT_MS, then shed
+        status, body = self.call("GET", "/users/1")
+        self.assertEqual((status, json.loads(body)["class"], self.headers["retry-after"]), (503, "read", "1"))
+        self.assertEqual(self.call("GET", "/books?q=harry")[0], 200)
+        budgets["read"].release()
+        self.assertEqual(self.call("GET", "/users/1")[0], 200)
+        self.assertEqual({name: b.active for name, b in budgets.items()}, {"read": 0, "scan": 0, "write": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
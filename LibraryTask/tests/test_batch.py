@@ -0,0 +1,42 @@
+import unittest
+from support import DBTestCase
+
+
+class BatchReadTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [self.make_user(f"u{i}") for i in range(3)]
+        lib = self.users[0]["library"]["id"]
+        items = [{"title": f"t{i}", "author": "a", "library_id": lib} for i in range(4)]
+        self.books = [x["book"]["id"] for x in self.client.post("/books/bulk", json=items).get_json()["results"]]
+
+    def test_users_in_request_order_with_missing_markers(self):
+        a, b, c = (u["id"] for u in self.users)
+        with self.assertQueries(1):
+            r = self.client.get(f"/users?ids={c},999,{a},{c}")
+        results = r.get_json()["results"]
+        self.assertEqual([x["id"] for x in results], [c, 999, a, c])
+        self.assertEqual(results[0], {"id": c, "status": 200, "user": self.users[2]})
+        self.assertEqual(results[1], {"id": 999, "status": 404, "error": "user not found"})
+
+    def test_books_with_fields(self):
+        first, second = self.books[:2]
+        with self.assertQueries(1):
+            r = self.client.get(f"/books?ids={second},0,{first}&fields=title")
+        self.assertEqual(r.get_json()["results"], [
+            {"id": second, "status": 200, "book": {"title": "t1"}},
+            {"id": 0, "status": 404, "error": "book not found"},
+            {"id": first, "status": 200, "book": {"title": "t0"}},
+        ])
+        full = self.client.get(f"/books?ids={first}").get_json()["results"][0]["book"]
+        self.assertEqual(set(full), {"id", "title", "author", "library_id", "created_at"})
+
+    def test_bad_ids(self):
+        for query in ["ids=", "ids=1,x", "ids=1&fields=nope"]:
+            self.assertEqual(self.client.get(f"/books?{query}").status_code, 400, query)
+        self.app.config["BATCH_MAX_IDS"] = 2
+        self.assertEqual(self.client.get("/users?ids=1,2,3").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
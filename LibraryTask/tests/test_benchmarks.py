@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import bench_admission  # noqa: E402
+import bench_routes  # noqa: E402
+import bench_shards  # noqa: E402
+
+try:
+    import aiosqlite  # noqa: F401
+    import uvicorn  # noqa: F401
+    import bench_async
+except ImportError:
+    bench_async = None
+
+
+class BenchmarkSmokeTests(unittest.TestCase):
+    """Keeps benchmarks/bench_routes.py runnable; sizes are tiny, numbers are not checked."""
+
+    def test_run_and_compare(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "results.json")
+            code = bench_routes.main(["run", "--users", "5", "--books", "50", "--requests", "3", "--warmup", "1",
+                                      "--routes", "get_user,list_books_page,delete_user,bulk_delete_books", "--out", out])
+            self.assertEqual(code, 0)
+            with open(out) as f:
+                results = json.load(f)
+            self.assertEqual(results["routes"]["get_user"]["queries_per_request"], 1)
+            self.assertEqual(sum(r["errors"] for r in results["routes"].values()), 0)
+
+            # a baseline that used fewer queries makes the comparison fail
+            results["routes"]["get_user"]["queries_per_request"] = 0
+            baseline = os.path.join(tmp, "baseline.json")
+            with open(baseline, "w") as f:
+                json.dump(results, f)
+            self.assertEqual(bench_routes.main(["compare", baseline, out]), 1)
+
+    @unittest.skipIf(bench_async is None, "bench_async needs uvicorn and aiosqlite")
+    def test_async_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "async.json")
+            code = bench_async.main(["run", "--users", "5", "--books", "50", "--requests", "4", "--warmup", "1",
+                                     "--clients", "1,2", "--db-latency-ms", "1", "--routes", "get_user,create_book", "--out", out])
+            self.assertEqual(code, 0)
+            with open(out) as f:
+                modes = json.load(f)["modes"]
+            for mode in ("sync", "async"):
+                self.assertEqual(modes[mode]["get_user"]["2"]["errors"], 0)
+
+    def test_shard_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "shards.json")
+            code = bench_shards.main(["run", "--shards", "0,2", "--users", "5", "--requests", "4", "--warmup", "1",
+                                      "--concurrency", "2", "--commit-latency-ms", "1", "--out", out])
+            self.assertEqual(code, 0)
+            with open(out) as f:
+                shards = json.load(f)["shards"]
+            for count in ("0", "2"):
+                self.assertEqual([shards[count][name]["errors"] for name in bench_shards.ROUTES.split(",")], [0, 0])
+
+    def test_admission_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "admission.json")
+            code = bench_admission.main(["run", "--users", "5", "--books", "50", "--modes", "off,on", "--rate", "20",
+                                         "--duration", "0.5", "--warmup", "0.1", "--clients", "4", "--db-latency-ms", "1",
+                                         "--out", out])
+            self.assertEqual(code, 0)
+            with open(out) as f:
+                modes = json.load(f)["modes"]
+            for mode in ("off", "on"):
+                self.assertEqual((modes[mode]["all"]["requests"], modes[mode]["all"]["errors"]), (10, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
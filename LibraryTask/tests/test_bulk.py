@@ -0,0 +1,84 @@
+import json
+import unittest
+from support import DBTestCase
+
+
+class BulkBookTests(DBTestCase):
+    config = {"BULK_BATCH_SIZE": 2}
+
+    def setUp(self):
+        super().setUp()
+        self.lib = self.make_user("owner")["library"]["id"]
+        self.other = self.make_user("other")["library"]["id"]
+
+    def create(self, items):
+        return self.client.post("/books/bulk", json=items)
+
+    def test_create_array(self):
+        r = self.create([{"title": f"t{i}", "author": "a", "library_id": self.lib} for i in range(5)])
+        self.assertEqual(r.status_code, 201)
+        d = r.get_json()
+        self.assertEqual((d["ok"], d["failed"]), (5, 0))
+        self.assertEqual([x["book"]["title"] for x in d["results"]], [f"t{i}" for i in range(5)])
+        self.assertEqual(len(self.client.get(f"/libraries/{self.lib}/books").get_json()), 5)
+
+    def test_create_reports_per_item_errors(self):
+        r = self.create([
+            {"title": "ok", "author": "a", "library_id": self.lib},
+            {"title": "no library", "author": "a", "library_id": 999},
+            {"author": "a", "library_id": self.lib},
+            "nope",
+        ])
+        self.assertEqual(r.status_code, 207)
+        self.assertEqual([x["status"] for x in r.get_json()["results"]], [201, 404, 400, 400])
+        self.assertEqual(len(self.client.get("/books").get_json()), 1)
+
+    def test_create_ndjson(self):
+        body = "\n".join(json.dumps({"title": f"t{i}", "author": "a", "library_id": self.lib}) for i in range(3))
+        r = self.client.post("/books/bulk", data=body + "\n{broken\n", content_type="application/x-ndjson")
+        self.assertEqual([x["status"] for x in r.get_json()["results"]], [201, 201, 201, 400])
+
+    def test_create_validates_libraries_in_one_query(self):
+        items = [{"title": f"t{i}", "author": "a", "library_id": (self.lib, self.other)[i % 2]} for i in range(6)]
+        # one IN lookup for libraries, one INSERT per batch of 2, one counter update
+        with self.assertQueries(5):
+            self.create(items)
+
+    def test_update(self):
+        ids = [x["book"]["id"] for x in self.create([{"title": f"t{i}", "author": "a", "library_id": self.lib} for i in range(3)]).get_json()["results"]]
+        r = self.client.patch("/books/bulk", json=[
+            {"id": ids[0], "title": "new"},
+            {"id": ids[1], "library_id": self.other},
+            {"id": ids[2], "library_id": 999},
+            {"id": 12345, "title": "x"},
+        ])
+        self.assertEqual(r.status_code, 207)
+        res = r.get_json()["results"]
+        self.assertEqual([x["status"] for x in res], [200, 200, 404, 404])
+        self.assertEqual((res[0]["book"]["title"], res[1]["book"]["library_id"]), ("new", self.other))
+
+    def test_update_rejects_non_string_fields(self):
+        book = self.create([{"title": "t", "author": "a", "library_id": self.lib}]).get_json()["results"][0]["book"]
+        r = self.client.patch("/books/bulk", json=[
+            {"id": book["id"], "title": 5},
+            {"id": book["id"], "author": ["x"]},
+            {"id": book["id"], "library_id": "1"},
+            {"id": book["id"], "author": "b"},
+        ])
+        self.assertEqual([x["status"] for x in r.get_json()["results"]], [400, 400, 400, 200])
+        self.assertEqual(r.get_json()["results"][3]["book"]["title"], "t")
+
+    def test_delete(self):
+        ids = [x["book"]["id"] for x in self.create([{"title": f"t{i}", "author": "a", "library_id": self.lib} for i in range(3)]).get_json()["results"]]
+        r = self.client.delete("/books/bulk", json={"ids": ids[:2] + [999]})
+        self.assertEqual([x["status"] for x in r.get_json()["results"]], [200, 200, 404])
+        self.assertEqual([b["id"] for b in self.client.get("/books").get_json()], ids[2:])
+
+    def test_bad_body(self):
+        self.assertEqual(self.client.post("/books/bulk", json={"title": "x"}).status_code, 400)
+        self.assertEqual(self.client.post("/books/bulk", json=[]).status_code, 400)
+        self.assertEqual(self.client.delete("/books/bulk", json={}).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
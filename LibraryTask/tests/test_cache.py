@@ -0,0 +1,130 @@
+import time
+import unittest
+from app.cache import LRUCache, RedisCache
+from support import DBTestCase
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires < time.monotonic():
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value.encode(), time.monotonic() + ex if ex else None)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        c = LRUCache(max_entries=2, ttl=60)
+        c.set("a", 1); c.set("b", 2)
+        c.get("a")
+        c.set("c", 3)
+        self.assertEqual((c.get("a"), c.get("b"), c.get("c")), (1, None, 3))
+
+    def test_ttl(self):
+        c = LRUCache(ttl=0)
+        c.set("a", 1)
+        self.assertIsNone(c.get("a"))
+
+
+class ResponseCacheTests(DBTestCase):
+    config = {"CACHE_BACKEND": "lru"}
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("owner")
+        self.lib = self.user["library"]["id"]
+        self.other_user = self.make_user("other")
+        self.other = self.other_user["library"]["id"]
+
+    def add_book(self, lib=None):
+        return self.client.post("/books", json={"title": "t", "author": "a", "library_id": lib or self.lib}).get_json()
+
+    def test_get_user_served_from_cache_until_updated(self):
+        url = f"/users/{self.user['id']}"
+        self.client.get(url)
+        with self.assertQueries(0):
+            self.assertEqual(self.client.get(url).get_json()["username"], "owner")
+        self.client.put(url, json={"username": "renamed"})
+        self.assertEqual(self.client.get(url).get_json()["username"], "renamed")
+
+    def test_library_books_invalidated_by_book_writes(self):
+        url = f"/libraries/{self.lib}/books"
+        self.assertEqual(self.client.get(url).get_json(), [])
+        b = self.add_book()
+        self.assertEqual(len(self.client.get(url).get_json()), 1)
+        self.client.post(f"/books/{b['id']}/transfer", json={"to_library_id": self.other})
+        self.assertEqual(self.client.get(url).get_json(), [])
+        self.assertEqual(len(self.client.get(f"/libraries/{self.other}/books").get_json()), 1)
+        self.client.delete(f"/books/{b['id']}")
+        self.assertEqual(self.client.get(f"/libraries/{self.other}/books").get_json(), [])
+
+    def test_count_invalidated_through_library_tag(self):
+        url = f"/users/{self.user['id']}/books/count"
+        self.assertEqual(self.client.get(url).get_json()["count"], 0)
+        self.client.post("/books/bulk", json=[{"title": "t", "author": "a", "library_id": self.lib}] * 3)
+        self.assertEqual(self.client.get(url).get_json()["count"], 3)
+
+    def test_counts_invalidated_by_transfers(self):
+        ids = [self.add_book()["id"] for _ in range(4)]
+        counts = [f"/users/{u['id']}/books/count" for u in (self.user, self.other_user)]
+        self.assertEqual([self.client.get(url).get_json()["count"] for url in counts], [4, 0])
+        self.client.post(f"/libraries/{self.other}/transfer", json={"book_ids": ids[:3]})
+        self.assertEqual([self.client.get(url).get_json()["count"] for url in counts], [1, 3])
+        # the same move run as a job
+        self.client.post(f"/libraries/{self.lib}/transfer", json={"from_library_id": self.other},
+                         headers={"Prefer": "respond-async"})
+        self.assertEqual([self.client.get(url).get_json()["count"] for url in counts], [4, 0])
+
+    def test_libraries_listing_invalidated_by_user_writes(self):
+        self.assertEqual(len(self.client.get("/libraries").get_json()), 2)
+        self.make_user("third")
+        self.assertEqual(len(self.client.get("/libraries").get_json()), 3)
+        self.client.delete(f"/users/{self.user['id']}")
+        self.assertEqual(len(self.client.get("/libraries").get_json()), 2)
+
+    def test_etag_round_trip(self):
+        url = f"/users/{self.user['id']}"
+        etag = self.client.get(url).headers["ETag"]
+        r = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(r.status_code, 304)
+        self.client.put(url, json={"username": "renamed"})
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_stream_requests_bypass_the_cache(self):
+        self.add_book()
+        url = f"/libraries/{self.lib}/books"
+        etag = self.client.get(url).headers["ETag"]
+        r = self.client.get(url, headers={"Accept": "application/x-ndjson", "If-None-Match": etag})
+        self.assertEqual((r.status_code, r.mimetype), (200, "application/x-ndjson"))
+        self.assertEqual(len(r.get_data(as_text=True).splitlines()), 1)
+        self.assertEqual(self.client.get(url).mimetype, "application/json")
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.get("/users/999").status_code, 404)
+        self.assertEqual(self.client.get("/users/999").status_code, 404)
+
+
+class RedisResponseCacheTests(ResponseCacheTests):
+    def setUp(self):
+        self.config = {"CACHE_BACKEND": RedisCache(FakeRedis())}
+        super().setUp()
+
+
+class NoCacheTests(DBTestCase):
+    def test_etag_without_backend(self):
+        uid = self.make_user("owner")["id"]
+        etag = self.client.get(f"/users/{uid}").headers["ETag"]
+        self.assertEqual(self.client.get(f"/users/{uid}", headers={"If-None-Match": etag}).status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import base64
+import json
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from support import DBTestCase
+from app.extensions import db
+from app.models import Book, Change, Library
+
+
+class ChangeFeedTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("owner")
+        self.lib = self.user["library"]["id"]
+        self.other = self.make_user("other")["library"]["id"]
+        self.since = self.client.get("/changes?since=now").get_json()["next_since"]
+
+    def changes(self, since=None, **args):
+        args["since"] = since or self.since
+        r = self.client.get("/changes", query_string=args)
+        self.assertEqual(r.status_code, 200)
+        return r.get_json()
+
+    def summary(self, feed):
+        return [(c["type"], c["id"], c["op"]) for c in feed["changes"]]
+
+    def test_every_write_path_is_logged_once_per_row(self):
+        books = [x["book"]["id"] for x in self.client.post("/books/bulk", json=[
+            {"title": f"t{i}", "author": "a", "library_id": self.lib} for i in range(4)]).get_json()["results"]]
+        self.client.put(f"/books/{books[0]}", json={"title": "renamed"})
+        self.client.post(f"/libraries/{self.other}/transfer", json={"book_ids": books[1:3]})
+        self.client.delete("/books/bulk", json=[books[3]])
+        self.client.put(f"/users/{self.user['id']}", json={"library_name": "renamed"})
+
+        feed = self.changes()
+        # creates were folded into the later update/delete of the same row; counter moves are not changes
+        self.assertEqual(self.summary(feed), [
+            ("book", books[0], "update"), ("book", books[1], "update"), ("book", books[2], "update"),
+            ("book", books[3], "delete"), ("library", self.lib, "update"),
+        ])
+        self.assertEqual(feed["changes"][0]["data"]["title"], "renamed")
+        self.assertEqual(feed["changes"][1]["data"]["library_id"], self.other)
+        self.assertIsNone(feed["changes"][3]["data"])
+        self.assertFalse(feed["has_more"])
+        self.assertEqual(self.changes(feed["next_since"])["changes"], [])
+
+    def test_pages_resume_from_the_token(self):
+        for i in range(5):
+            self.client.post("/books", json={"title": f"t{i}", "author": "a", "library_id": self.lib})
+        seen, since = [], self.since
+        while True:
+            feed = self.changes(since, limit=2)
+            seen += [c["data"]["title"] for c in feed["changes"]]
+            since = feed["next_since"]
+            if not feed["has_more"]:
+                break
+        self.assertEqual(seen, [f"t{i}" for i in range(5)])
+
+    def test_updated_at_follows_edits_but_not_counters(self):
+        with self.app.app_context():
+            before = db.session.get(Library, self.lib).updated_at
+        self.client.post("/books", json={"title": "t", "author": "a", "library_id": self.lib})
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Library, self.lib).updated_at, before)
+            book = db.session.query(Book).one()
+            stamp = book.updated_at
+        self.client.patch("/books/bulk", json=[{"id": book.id, "title": "u"}])
+        with self.app.app_context():
+            self.assertGreater(db.session.get(Book, book.id).updated_at, stamp)
+
+    def test_expired_and_bad_tokens(self):
+        self.assertEqual(self.client.get("/changes?since=nope").status_code, 400)
+        for values in (["x"], [-1], [True], [{"a": 1}]):
+            token = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.assertEqual(self.client.get("/changes", query_string={"since": token}).status_code, 400, values)
+        self.client.post("/books", json={"title": "t", "author": "a", "library_id": self.lib})
+        self.client.post("/books", json={"title": "u", "author": "a", "library_id": self.lib})
+        with self.app.app_context():
+            db.session.execute(update(Change).values(changed_at=datetime.utcnow() - timedelta(days=30)))
+            db.session.commit()
+        out = self.app.test_cli_runner().invoke(args=["prune-changes"]).output
+        self.assertIn("5 changes deleted", out)  # two users, two libraries and the first book
+        self.assertEqual(self.client.get("/changes", query_string={"since": self.since}).status_code, 410)
+        self.assertEqual(self.summary(self.changes(self.client.get("/changes?since=now").get_json()["next_since"])), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
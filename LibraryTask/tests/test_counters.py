@@ -0,0 +1,56 @@
+import unittest
+from sqlalchemy import text
+from app.extensions import db
+from support import DBTestCase
+
+
+class BookCountTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a = self.make_user("a")
+        self.b = self.make_user("b")
+        self.la, self.lb = self.a["library"]["id"], self.b["library"]["id"]
+
+    def counts(self):
+        return tuple(self.client.get(f"/users/{u['id']}/books/count").get_json()["count"] for u in (self.a, self.b))
+
+    def add(self, lib, n=1):
+        items = [{"title": f"t{i}", "author": "x", "library_id": lib} for i in range(n)]
+        return [r["book"]["id"] for r in self.client.post("/books/bulk", json=items).get_json()["results"]]
+
+    def test_every_write_path_keeps_counts(self):
+        ids = self.add(self.la, 4)
+        b = self.client.post("/books", json={"title": "t", "author": "x", "library_id": self.lb}).get_json()
+        self.assertEqual(self.counts(), (4, 1))
+        self.client.post(f"/books/{ids[0]}/transfer", json={"to_library_id": self.lb})
+        self.client.put(f"/books/{ids[1]}", json={"library_id": self.lb})
+        self.assertEqual(self.counts(), (2, 3))
+        self.client.patch("/books/bulk", json=[{"id": ids[2], "library_id": self.lb}, {"id": ids[2], "library_id": self.lb}])
+        self.assertEqual(self.counts(), (1, 4))
+        self.client.delete(f"/books/{b['id']}")
+        self.client.delete("/books/bulk", json=[ids[0], ids[3]])
+        self.assertEqual(self.counts(), (0, 2))
+        self.client.post(f"/libraries/{self.la}/transfer", json={"from_library_id": self.lb})
+        self.assertEqual(self.counts(), (2, 0))
+
+    def test_count_is_one_row_read(self):
+        self.add(self.la, 3)
+        with self.assertQueries(1):
+            self.client.get(f"/users/{self.a['id']}/books/count")
+
+    def test_reconcile_command(self):
+        self.add(self.la, 3)
+        with self.app.app_context():
+            db.session.execute(text("UPDATE library SET book_count = 7 WHERE id = :id"), {"id": self.la})
+            db.session.commit()
+        runner = self.app.test_cli_runner()
+        out = runner.invoke(args=["reconcile-book-counts"]).output
+        self.assertIn(f"library {self.la}: book_count=7 actual=3", out)
+        self.assertEqual(self.counts(), (7, 0))
+        runner.invoke(args=["reconcile-book-counts", "--fix"])
+        self.assertEqual(self.counts(), (3, 0))
+        self.assertIn("0 drifted", runner.invoke(args=["reconcile-book-counts"]).output)
+
+
+if __name__ == "__main__":
+    unittest.main()
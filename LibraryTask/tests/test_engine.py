@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from sqlalchemy import text
+from app import create_app
+from app.config import Config
+from app.engine import engine_options
+from app.extensions import db
+
+
+def settings(**overrides):
+    return {k: getattr(Config, k) for k in dir(Config) if k.isupper()} | overrides
+
+
+class EngineOptionsTests(unittest.TestCase):
+    def test_postgres_gets_pool_and_statement_timeout(self):
+        opts = engine_options(settings(DB_POOL_SIZE=5, DB_STATEMENT_TIMEOUT_MS=2000), "postgresql://h/db")
+        self.assertEqual((opts["pool_size"], opts["pool_pre_ping"]), (5, True))
+        self.assertEqual(opts["connect_args"], {"options": "-c statement_timeout=2000"})
+
+    def test_sqlite_skips_queue_sizing(self):
+        opts = engine_options(settings(DB_STATEMENT_TIMEOUT_MS=2000), "sqlite:///x.db")
+        self.assertNotIn("pool_size", opts)
+        self.assertNotIn("connect_args", opts)
+
+    def test_explicit_engine_options_win(self):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://", "SQLALCHEMY_ENGINE_OPTIONS": {"pool_recycle": 5}})
+        self.assertEqual(app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_recycle"], 5)
+
+
+class SQLiteFileTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def app(self, name, **config):
+        return create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(self.dir.name, name)}", **config})
+
+    def test_pragmas_on_connect(self):
+        app = self.app("p.db", SQLITE_BUSY_TIMEOUT_MS=1234)
+        with app.app_context():
+            pragma = lambda p: db.session.execute(text(f"PRAGMA {p}")).scalar()
+            self.assertEqual((pragma("journal_mode"), pragma("synchronous"), pragma("busy_timeout")), ("wal", 1, 1234))
+            db.session.remove()
+            db.engine.dispose()
+
+    def test_reads_go_to_replica(self):
+        replica = os.path.join(self.dir.name, "replica.db")
+        app = self.app("primary.db", DATABASE_REPLICA_URL=f"sqlite:///{replica}")
+        with app.app_context():
+            db.create_all(bind_key=None)
+            db.metadata.create_all(db.engines["replica"])
+        client = app.test_client()
+        uid = client.post("/users", json={"username": "u", "library_name": "l"}).get_json()["id"]
+        # the (empty) replica answers reads until it catches up
+        self.assertEqual(client.get("/users").get_json(), [])
+        self.assertEqual(client.get(f"/users/{uid}").status_code, 404)
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import unittest
+from support import DBTestCase
+
+
+class SparseFieldsetTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lib = self.make_user("owner")["library"]["id"]
+        other = self.make_user("other")["library"]["id"]
+        for i in range(5):
+            self.client.post("/books", json={"title": f"harry {i}", "author": "rowling", "library_id": self.lib})
+        self.client.post("/books", json={"title": "dune", "author": "herbert", "library_id": other})
+
+    def test_only_requested_fields_in_requested_order(self):
+        r = self.client.get("/books?fields=title,id")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(list(r.get_json()[0]), ["title", "id"])
+        self.assertEqual(len(r.get_json()), 6)
+
+    def test_projection_is_pushed_into_the_select(self):
+        with self.assertQueries(1) as qc:
+            self.client.get("/books?fields=title")
+        select = qc.statements[0]
+        self.assertNotIn("book.author", select)
+        self.assertNotIn("book.created_at", select)
+
+    def test_works_with_library_and_search_filters(self):
+        r = self.client.get(f"/books?fields=title&library_id={self.lib}&q=harry 3")
+        self.assertEqual(r.get_json(), [{"title": "harry 3"}])
+        r = self.client.get(f"/libraries/{self.lib}/books?fields=author")
+        self.assertEqual(r.get_json(), [{"author": "rowling"}] * 5)
+
+    def test_pagination_keeps_working_without_key_fields(self):
+        first = self.client.get("/books?fields=title&limit=4").get_json()
+        self.assertEqual(list(first["items"][0]), ["title"])
+        rest = self.client.get(f"/books?fields=title&limit=4&cursor={first['next_cursor']}").get_json()
+        titles = [b["title"] for b in first["items"] + rest["items"]]
+        self.assertEqual(titles, [b["title"] for b in self.client.get("/books").get_json()])
+        self.assertIsNone(rest["next_cursor"])
+
+    def test_streamed_listing_is_projected(self):
+        r = self.client.get(f"/libraries/{self.lib}/books?fields=id&stream=1&format=ndjson")
+        self.assertEqual([list(json.loads(l)) for l in r.get_data(as_text=True).splitlines()], [["id"]] * 5)
+
+    def test_unknown_field_is_rejected(self):
+        r = self.client.get("/books?fields=title,isbn")
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("isbn", r.get_json()["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
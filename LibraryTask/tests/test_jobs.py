@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from support import DBTestCase
+from app import create_app
+from app.extensions import db
+from app.models import Book, Job
+
+ASYNC = {"Prefer": "respond-async"}
+
+
+class JobRouteTests(DBTestCase):
+    config = {"JOB_CHUNK_SIZE": 2, "JOB_INLINE_LIMIT": 4}
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("owner")
+        self.lib = self.user["library"]["id"]
+        self.other = self.make_user("other")["library"]["id"]
+
+    def add_books(self, n, lib=None):
+        items = [{"title": f"t{i}", "author": "a", "library_id": lib or self.lib} for i in range(n)]
+        self.assertEqual(self.client.post("/books/bulk", json=items).status_code, 201)
+
+    def job(self, r):
+        self.assertEqual(r.status_code, 202)
+        return self.client.get(r.headers["Location"]).get_json()
+
+    def test_delete_user_with_a_big_library_becomes_a_job(self):
+        self.add_books(3)
+        # at or under the limit it stays inline
+        self.assertEqual(self.client.delete(f"/users/{self.make_user('small')['id']}").status_code, 200)
+        self.add_books(2)
+        job = self.job(self.client.delete(f"/users/{self.user['id']}"))
+        self.assertEqual((job["kind"], job["status"], job["progress"], job["total"]), ("delete_user", "done", 5, 5))
+        self.assertEqual(job["result"], {"user_id": self.user["id"], "books_deleted": 5})
+        self.assertEqual(self.client.get(f"/users/{self.user['id']}").status_code, 404)
+        self.assertEqual(self.client.get("/books").get_json(), [])
+
+    def test_prefer_respond_async(self):
+        r = self.client.delete(f"/users/{self.user['id']}", headers=ASYNC)
+        self.assertEqual(r.headers["Preference-Applied"], "respond-async")
+        self.assertEqual(self.job(r)["status"], "done")
+
+    def test_import_job_reports_a_summary(self):
+        items = [{"title": "t", "author": "a", "library_id": self.lib}, {"title": "t"},
+                 {"title": "t", "author": "a", "library_id": 999}, {"title": "u", "author": "a", "library_id": self.lib}]
+        job = self.job(self.client.post("/books/bulk", json=items, headers=ASYNC))
+        self.assertEqual((job["status"], job["progress"], job["total"]), ("done", 4, 4))
+        self.assertEqual((job["result"]["ok"], job["result"]["failed"]), (2, 2))
+        self.assertEqual([(e["index"], e["status"]) for e in job["result"]["errors"]], [(1, 400), (2, 404)])
+        self.assertEqual(self.client.get(f"/users/{self.user['id']}/books/count").get_json()["count"], 2)
+
+    def test_filtered_transfer_job(self):
+        self.add_books(3)
+        self.add_books(2)
+        job = self.job(self.client.post(f"/libraries/{self.other}/transfer", json={"from_library_id": self.lib}))
+        self.assertEqual((job["status"], job["total"], job["result"]["moved"]), ("done", 5, 5))
+        self.assertEqual(len(self.client.get(f"/libraries/{self.other}/books").get_json()), 5)
+
+    def test_maintenance_jobs(self):
+        self.add_books(2)
+        with self.app.app_context():
+            db.session.execute(Book.__table__.delete())  # counters drift
+            db.session.commit()
+        job = self.job(self.client.post("/jobs", json={"kind": "reconcile_book_counts"}))
+        self.assertEqual(job["result"]["repaired"], [{"library_id": self.lib, "stored": 2, "actual": 0}])
+        self.assertEqual(self.job(self.client.post("/jobs", json={"kind": "reindex"}))["status"], "done")
+        self.assertEqual(self.client.post("/jobs", json={"kind": "delete_user"}).status_code, 400)
+        self.assertEqual(self.client.get("/jobs/999").status_code, 404)
+
+
+class ResumeTests(DBTestCase):
+    config = {"JOB_CHUNK_SIZE": 2, "JOB_LEASE_SECONDS": 60}
+
+    def insert_job(self, kind, params, **values):
+        with self.app.app_context():
+            job = Job(kind=kind, params=json.dumps(params), **values)
+            db.session.add(job)
+            db.session.commit()
+            return job.id
+
+    def get(self, job_id):
+        return self.client.get(f"/jobs/{job_id}").get_json()
+
+    def test_abandoned_job_continues_after_its_last_checkpoint(self):
+        lib = self.make_user("owner")["library"]["id"]
+        items = [{"title": f"t{i}", "author": "a", "library_id": lib} for i in range(5)]
+        # a worker died after committing the first chunk (its two books are left out here, so the
+        # table ends up with only what the resumed run inserted)
+        stale = datetime.utcnow() - timedelta(minutes=5)
+        job_id = self.insert_job("import_books", {"items": items}, status="running", progress=2, attempts=1,
+                                 heartbeat_at=stale, result=json.dumps({"ok": 2, "failed": 0, "errors": []}))
+        fresh = self.insert_job("import_books", {"items": items}, status="running", heartbeat_at=datetime.utcnow())
+        self.assertIn("no jobs left", self.app.test_cli_runner().invoke(args=["run-jobs"]).output)
+        job = self.get(job_id)
+        self.assertEqual((job["status"], job["attempts"], job["result"]["ok"]), ("done", 2, 5))
+        self.assertEqual(len(self.client.get("/books").get_json()), 3)
+        # still within its lease: somebody else is running it
+        self.assertEqual(self.get(fresh)["status"], "running")
+
+    def test_failures_are_recorded(self):
+        job_id = self.insert_job("no_such_kind", {})
+        self.app.test_cli_runner().invoke(args=["run-jobs"])
+        job = self.get(job_id)
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("no handler", job["error"])
+        given_up = self.insert_job("reindex", {}, status="running", attempts=3, heartbeat_at=datetime.utcnow() - timedelta(hours=1))
+        self.app.test_cli_runner().invoke(args=["run-jobs"])
+        self.assertEqual(self.get(given_up)["status"], "failed")
+
+
+class ThreadPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        uri = "sqlite:///" + os.path.join(self.dir.name, "jobs.db")
+        self.app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": uri, "JOB_WORKERS": 2})
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all(bind_key=None)
+            db.session.add(Job(kind="reindex", params="{}"))  # queued before this process started
+            db.session.commit()
+        self.addCleanup(lambda: self.app.extensions["jobs"].executor.shutdown())
+
+    def test_jobs_run_on_the_pool_and_queued_ones_resume(self):
+        r = self.client.post("/users", json={"username": "u", "library_name": "l"})
+        user_id = r.get_json()["id"]
+        r = self.client.delete(f"/users/{user_id}", headers=ASYNC)
+        self.assertEqual(r.status_code, 202)
+        self.app.extensions["jobs"].join()
+        statuses = [j["status"] for j in (self.client.get(f"/jobs/{i}").get_json() for i in (1, 2))]
+        self.assertEqual(statuses, ["done", "done"])
+        self.assertEqual(self.client.get(f"/users/{user_id}").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
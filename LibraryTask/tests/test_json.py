@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime, timezone
+from app import create_app
+from app.jsonprovider import orjson
+from support import DBTestCase
+
+SAMPLE = {"id": 1, "when": datetime(2026, 1, 2, 3, 4, 5, 600), "day": datetime(2026, 1, 1),
+          "aware": datetime(2026, 1, 1, tzinfo=timezone.utc), "nested": [{"x": None, "y": "é"}]}
+
+
+class JSONProviderTests(unittest.TestCase):
+    def dumps(self, provider):
+        return create_app({"JSON_PROVIDER": provider, "METRICS_ENABLED": False}).json.dumps(SAMPLE)
+
+    def test_stdlib_renders_datetimes(self):
+        self.assertEqual(self.dumps("stdlib"), (
+            '{"id":1,"when":"2026-01-02T03:04:05.000600Z","day":"2026-01-01T00:00:00Z",'
+            '"aware":"2026-01-01T00:00:00+00:00","nested":[{"x":null,"y":"é"}]}'
+        ))
+
+    @unittest.skipIf(orjson is None, "orjson not installed")
+    def test_orjson_matches_stdlib_for_naive_datetimes(self):
+        sample = dict(SAMPLE)
+        del sample["aware"]  # orjson writes UTC offsets as "Z"
+        apps = [create_app({"JSON_PROVIDER": p}) for p in ("stdlib", "orjson")]
+        self.assertEqual(apps[0].json.dumps(sample), apps[1].json.dumps(sample))
+
+
+class BookJSONTests(DBTestCase):
+    config = {"JSON_PROVIDER": "stdlib"}
+
+    def test_created_at_format_unchanged(self):
+        lib = self.make_user("u")["library"]["id"]
+        created = self.client.post("/books", json={"title": "t", "author": "a", "library_id": lib}).get_json()
+        self.assertRegex(created["created_at"], r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{6})?Z$")
+        self.assertEqual(self.client.get("/books").get_json(), [created])
+        self.assertEqual(self.client.post("/books/bulk", json=[{"title": "t", "author": "a", "library_id": lib}])
+                         .get_json()["results"][0]["book"]["created_at"][-1], "Z")
+
+
+class OrjsonBookJSONTests(BookJSONTests):
+    config = {"JSON_PROVIDER": "auto"}
+
+
+if __name__ == "__main__":
+    unittest.main()
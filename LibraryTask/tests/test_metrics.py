@@ -0,0 +1,42 @@
+import re
+import unittest
+from support import DBTestCase
+
+
+class RequestMetricsTests(DBTestCase):
+    config = {"QUERY_COUNT_WARN": 2}
+
+    def setUp(self):
+        super().setUp()
+        self.make_user("a")
+
+    def test_server_timing_header(self):
+        timing = self.client.get("/users").headers["Server-Timing"]
+        self.assertIn('desc="1 queries"', timing)
+        self.assertRegex(timing, r"serialize;dur=\d+\.\d+, total;dur=\d+\.\d+")
+
+    def test_prometheus_histograms(self):
+        self.client.get("/users")
+        self.client.get("/users")
+        body = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn('http_request_queries_bucket{endpoint="list_users",le="1"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{endpoint="list_users"} 2', body)
+        self.assertNotIn('endpoint="metrics"', body)
+
+    def test_query_heavy_request_is_logged(self):
+        with self.assertLogs("app.slow_query", "WARNING") as logs:
+            self.client.post("/users", json={"username": "b", "library_name": "l"})
+        self.assertTrue(any(re.search(r"create_user ran 3 queries", line) for line in logs.output))
+
+
+class MetricsDisabledTests(DBTestCase):
+    config = {"METRICS_ENABLED": False}
+
+    def test_no_header_or_endpoint(self):
+        self.assertNotIn("Server-Timing", self.client.get("/users").headers)
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
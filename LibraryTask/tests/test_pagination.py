@@ -0,0 +1,61 @@
+import base64
+import json
+import unittest
+from support import DBTestCase
+
+
+class KeysetPaginationTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lib = self.make_user("owner")["library"]["id"]
+        for i in range(7):
+            self.client.post("/books", json={"title": f"t{i}", "author": "a", "library_id": self.lib})
+
+    def walk(self, url):
+        seen, cursor = [], None
+        while True:
+            r = self.client.get(url + (f"&cursor={cursor}" if cursor else ""))
+            self.assertEqual(r.status_code, 200)
+            d = r.get_json()
+            seen.extend(d["items"])
+            cursor = d["next_cursor"]
+            if not cursor:
+                return seen
+
+    def test_books_pages_cover_everything_once(self):
+        books = self.walk("/books?limit=3")
+        self.assertEqual([b["title"] for b in books], [f"t{i}" for i in range(7)])
+
+    def test_books_under_library_pages(self):
+        books = self.walk(f"/libraries/{self.lib}/books?limit=2&x=1")
+        self.assertEqual(len(books), 7)
+
+    def test_users_and_libraries_page_by_id(self):
+        for i in range(4):
+            self.make_user(f"u{i}")
+        self.assertEqual(len(self.walk("/users?limit=2")), 5)
+        self.assertEqual(len(self.walk("/libraries?limit=2")), 5)
+
+    def test_unpaginated_listing_is_still_an_array(self):
+        self.assertEqual(len(self.client.get("/books").get_json()), 7)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get("/books?limit=0").status_code, 400)
+        self.assertEqual(self.client.get("/books?limit=abc").status_code, 400)
+        self.assertEqual(self.client.get("/books?cursor=garbage").status_code, 400)
+        # valid base64 and JSON, but not the keys' types
+        for values in ([{"a": 1}], ["x"], [True], [1.5]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            for path in ("/users", "/libraries"):
+                self.assertEqual(self.client.get(f"{path}?cursor={cursor}").status_code, 400, (path, values))
+        cursor = base64.urlsafe_b64encode(json.dumps(["2024-01-01T00:00:00", "x"]).encode()).decode()
+        self.assertEqual(self.client.get(f"/books?cursor={cursor}").status_code, 400)
+
+    def test_page_is_one_statement(self):
+        cursor = self.client.get("/books?limit=3").get_json()["next_cursor"]
+        with self.assertQueries(1):
+            self.client.get(f"/books?limit=3&cursor={cursor}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from support import DBTestCase
+from app.extensions import db
+from app.lookups import library_exists, user_with_library
+from app.models import User
+
+
+class UserQueryCountTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [self.make_user(f"u{i}") for i in range(5)]
+
+    def test_list_users_single_statement(self):
+        with self.assertQueries(1):
+            r = self.client.get("/users")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([u["library"]["name"] for u in r.get_json()], [f"u{i}-lib" for i in range(5)])
+
+    def test_get_user_single_statement(self):
+        with self.assertQueries(1):
+            r = self.client.get(f"/users/{self.users[2]['id']}")
+        self.assertEqual(r.get_json()["library"], self.users[2]["library"])
+
+    def test_create_user_reads_back_in_one_statement(self):
+        # insert user + insert library + one joined read-back
+        with self.assertQueries(3):
+            r = self.client.post("/users", json={"username": "new", "library_name": "NL"})
+        self.assertEqual(r.get_json()["library"]["name"], "NL")
+
+    def test_update_user(self):
+        uid = self.users[0]["id"]
+        # joined load, update user, update library, joined read-back
+        with self.assertQueries(4):
+            r = self.client.put(f"/users/{uid}", json={"username": "renamed", "library_name": "RL"})
+        d = r.get_json()
+        self.assertEqual((d["username"], d["library"]["name"]), ("renamed", "RL"))
+
+    def test_point_reads_do_not_autoflush(self):
+        uid, lib = self.users[0]["id"], self.users[0]["library"]["id"]
+        self.assertEqual(self.client.get(f"/users/{uid}").headers["ETag"], '"1.1"')
+        with self.app.app_context():
+            db.session.add(User(username="pending"))
+            with self.assertQueries(2) as q:
+                row = user_with_library(uid)
+                self.assertTrue(library_exists(lib))
+            self.assertEqual((row.username, row.library_id, row.library_name), ("u0", lib, "u0-lib"))
+            self.assertEqual(q.statements[1], "SELECT 1 \nFROM library \nWHERE library.id = ?")
+            self.assertFalse(library_exists(999))
+            self.assertIsNone(user_with_library(999))
+            db.session.rollback()
+
+    def test_duplicate_username(self):
+        r = self.client.post("/users", json={"username": "u0", "library_name": "x"})
+        self.assertEqual(r.status_code, 409)
+
+
+class SelectinUserQueryCountTests(DBTestCase):
+    config = {"USER_LIBRARY_LOADING": "selectin"}
+
+    def test_list_users_constant_statements(self):
+        for i in range(5):
+            self.make_user(f"u{i}")
+        # one statement for users plus one IN query for all of their libraries
+        with self.assertQueries(2):
+            r = self.client.get("/users")
+        self.assertEqual(len(r.get_json()), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
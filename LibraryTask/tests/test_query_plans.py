@@ -0,0 +1,99 @@
+import os
+import re
+import unittest
+from sqlalchemy import event, text
+from support import DBTestCase
+from app.extensions import db
+
+# TEST_DATABASE_URL=postgresql://... runs the same checks against Postgres
+DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite://")
+
+
+class QueryPlanTests(DBTestCase):
+    """Every statement a route sends with a WHERE clause has to reach its rows through an index.
+
+    Full listings without a filter are allowed to scan; anything that filters, joins or seeks is not.
+    """
+
+    config = {"SQLALCHEMY_DATABASE_URI": DATABASE_URL, "TRANSFER_CHUNK_SIZE": 2}
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("owner")
+        self.lib = self.user["library"]["id"]
+        self.other = self.make_user("other")["library"]["id"]
+        items = [{"title": f"t{i}", "author": "tolkien" if i % 2 else "other", "library_id": self.lib} for i in range(6)]
+        self.books = [x["book"]["id"] for x in self.client.post("/books/bulk", json=items).get_json()["results"]]
+
+    def record(self):
+        with self.app.app_context():
+            engine = db.engine
+        seen = []
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            if executemany:
+                parameters = parameters[0]
+            seen.append((statement, parameters))
+        event.listen(engine, "before_cursor_execute", before)
+        self.addCleanup(event.remove, engine, "before_cursor_execute", before)
+        return seen
+
+    def explain(self, conn, statement, parameters):
+        if conn.dialect.name == "sqlite":
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            return [r[-1] for r in rows]
+        # tiny tables make a sequential scan the cheapest plan; this asks whether an index could serve it
+        conn.execute(text("SET enable_seqscan = off"))
+        return [r[0] for r in conn.exec_driver_sql("EXPLAIN " + statement, parameters).all()]
+
+    def full_scans(self, plan):
+        if DATABASE_URL.startswith("sqlite"):
+            # "SCAN book" reads the table; "SCAN book USING INDEX ...", virtual tables (FTS) and
+            # subqueries ("SCAN anon_1") do not
+            return [line for line in plan if re.fullmatch(r"SCAN (\w+)", line) and line[5:] in db.metadata.tables]
+        return [line for line in plan if "Seq Scan" in line]
+
+    def test_route_queries_use_indexes(self):
+        seen = self.record()
+        uid, lib, other, book = self.user["id"], self.lib, self.other, self.books[0]
+        requests = [
+            ("GET", "/users?limit=1", None),
+            ("GET", f"/users/{uid}", None),
+            ("GET", f"/users?ids={uid},99", None),
+            ("GET", f"/books?ids={book},99&fields=title", None),
+            ("GET", f"/users/{uid}/books/count", None),
+            ("GET", f"/libraries/{lib}/books", None),
+            ("GET", f"/libraries/{lib}/books?limit=2", None),
+            ("GET", "/books?limit=2", None),
+            ("GET", f"/books?library_id={lib}", None),
+            ("GET", "/books?q=tolk", None),
+            ("PUT", f"/books/{book}", {"title": "u"}),
+            ("POST", f"/books/{book}/transfer", {"to_library_id": other}),
+            ("PATCH", "/books/bulk", [{"id": book, "author": "x"}]),
+            ("POST", f"/libraries/{other}/transfer", {"from_library_id": lib, "author": "tolkien"}),
+            ("POST", f"/libraries/{other}/transfer", {"author": "other"}),
+            ("POST", f"/libraries/{other}/transfer", {"book_ids": self.books[1:3]}),
+            ("POST", "/jobs", {"kind": "reconcile_book_counts"}),
+            ("GET", "/jobs/1", None),
+            ("GET", "/changes?limit=5", None),
+            ("GET", "/stats/authors?limit=2", None),
+            ("GET", "/stats/libraries?limit=1", None),
+            ("GET", "/stats/daily", None),
+            ("DELETE", f"/books/{book}", None),
+            ("DELETE", "/books/bulk", [self.books[-1]]),
+            ("DELETE", f"/users/{uid}", None),
+        ]
+        for method, path, body in requests:
+            r = self.client.open(path, method=method, json=body)
+            self.assertLess(r.status_code, 400, path)
+
+        with self.app.app_context(), db.engine.connect() as conn:
+            for statement, parameters in seen:
+                if not re.search(r"\bWHERE\b", statement) or not statement.lstrip().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                scans = self.full_scans(self.explain(conn, statement, parameters))
+                self.assertEqual(scans, [], statement)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from support import DBTestCase
+
+
+class SearchTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lib = self.make_user("owner")["library"]["id"]
+        self.ids = {}
+        for title, author in [("Harry Potter", "Rowling"), ("The Hobbit", "Tolkien"),
+                              ("Potter's Field", "Ellis Peters"), ("Silmarillion", "Tolkien")]:
+            self.ids[title] = self.client.post("/books", json={"title": title, "author": author, "library_id": self.lib}).get_json()["id"]
+
+    def titles(self, q):
+        return sorted(b["title"] for b in self.client.get(f"/books?q={q}").get_json())
+
+    def test_prefix_match_on_title_and_author(self):
+        self.assertEqual(self.titles("pot"), ["Harry Potter", "Potter's Field"])
+        self.assertEqual(self.titles("tolk"), ["Silmarillion", "The Hobbit"])
+        self.assertEqual(self.titles("harry pot"), ["Harry Potter"])
+
+    def test_ranked_results(self):
+        self.client.post("/books", json={"title": "Tolkien on Tolkien", "author": "Tolkien", "library_id": self.lib})
+        self.assertEqual(self.client.get("/books?q=tolkien").get_json()[0]["title"], "Tolkien on Tolkien")
+
+    def test_index_follows_updates_and_deletes(self):
+        self.client.put(f"/books/{self.ids['The Hobbit']}", json={"title": "There and Back Again"})
+        self.client.delete(f"/books/{self.ids['Harry Potter']}")
+        self.assertEqual(self.titles("hobbit"), [])
+        self.assertEqual(self.titles("back"), ["There and Back Again"])
+        self.assertEqual(self.titles("harry"), [])
+
+    def test_search_with_library_filter_and_pages(self):
+        other = self.make_user("other")["library"]["id"]
+        self.client.post("/books", json={"title": "Potter Again", "author": "x", "library_id": other})
+        self.assertEqual(len(self.client.get(f"/books?q=potter&library_id={other}").get_json()), 1)
+        page = self.client.get("/books?q=potter&limit=1").get_json()
+        self.assertEqual(len(page["items"]), 1)
+        self.assertIsNotNone(page["next_cursor"])
+
+    def test_punctuation_only_query_falls_back_to_like(self):
+        self.assertEqual(self.titles("'"), ["Potter's Field"])
+
+
+class LikeSearchTests(SearchTests):
+    config = {"SEARCH_BACKEND": "like"}
+
+    def test_prefix_match_on_title_and_author(self):
+        self.assertEqual(self.titles("otter"), ["Harry Potter", "Potter's Field"])
+
+    @unittest.skip("LIKE results are unranked")
+    def test_ranked_results(self):
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()
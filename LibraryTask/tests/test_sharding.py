@@ -0,0 +1,148 @@
+import os
+import tempfile
+import unittest
+from sqlalchemy import func, select, text
+from support import DBTestCase
+from app.engine import on_shard
+from app.extensions import db
+from app.models import Book, library_book_count
+
+SHARDS = 3
+
+
+class ShardingTests(DBTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.config = {"BOOK_SHARDS": [f"sqlite:///{os.path.join(self.dir.name, f'shard{i}.db')}" for i in range(SHARDS)]}
+        super().setUp()
+        self.addCleanup(self.app.extensions["book_shards"].shutdown)
+        self.assertIn("3 shards ready", self.app.test_cli_runner().invoke(args=["init-shards"]).output)
+        # library ids 1, 2, 3 land on shards 1, 2, 0
+        self.users = [self.make_user(name) for name in ("a", "b", "c")]
+        self.libs = [u["library"]["id"] for u in self.users]
+
+    def tearDown(self):
+        with self.app.app_context():
+            for key in range(SHARDS):
+                db.engines[f"shard{key}"].dispose()
+        super().tearDown()
+
+    def add(self, lib, title="t", author="a"):
+        r = self.client.post("/books", json={"title": title, "author": author, "library_id": lib})
+        self.assertEqual(r.status_code, 201)
+        return r.get_json()
+
+    def on_shards(self):
+        """{shard: [(book id, library id)]} straight from each shard's book table."""
+        with self.app.app_context():
+            result = {}
+            for i in range(SHARDS):
+                with on_shard(i):
+                    result[i] = db.session.execute(select(Book.id, Book.library_id).order_by(Book.id)).all()
+            return result
+
+    def count(self, user):
+        return self.client.get(f"/users/{user['id']}/books/count").get_json()["count"]
+
+    def test_books_live_on_their_library_shard(self):
+        books = [self.add(lib, title=f"t{i}") for i, lib in enumerate(self.libs * 2)]
+        for shard, rows in self.on_shards().items():
+            self.assertEqual(len(rows), 2)
+            self.assertTrue(all(lib % SHARDS == shard and book_id % SHARDS == shard for book_id, lib in rows))
+        with self.app.app_context():
+            self.assertEqual(db.session.execute(text("SELECT count(*) FROM book")).scalar(), 0)  # primary
+        self.assertEqual([self.count(u) for u in self.users], [2, 2, 2])
+
+        # merged listings keep the (created_at, id) order, whole and page by page
+        self.assertEqual([b["id"] for b in self.client.get("/books").get_json()], [b["id"] for b in books])
+        seen, cursor = [], ""
+        while True:
+            page = self.client.get(f"/books?limit=4&fields=title{cursor}").get_json()
+            seen += [b["title"] for b in page["items"]]
+            if not page["next_cursor"]:
+                break
+            cursor = f"&cursor={page['next_cursor']}"
+        self.assertEqual(seen, [f"t{i}" for i in range(6)])
+        self.assertEqual(len(self.client.get(f"/libraries/{self.libs[0]}/books").get_json()), 2)
+        self.assertEqual(len(self.client.get(f"/books?library_id={self.libs[1]}").get_json()), 2)
+        self.assertEqual(self.client.get("/books?stream=1").get_json(), self.client.get("/books").get_json())
+        self.client.put(f"/books/{books[0]['id']}", json={"title": "hobbit"})
+        self.assertEqual([b["id"] for b in self.client.get("/books?q=hobbit").get_json()], [books[0]["id"]])
+
+    def test_routes_by_book_id_find_its_shard(self):
+        book = self.add(self.libs[0])
+        other = self.add(self.libs[2])
+        r = self.client.put(f"/books/{book['id']}", json={"title": "renamed"})
+        self.assertEqual(r.get_json()["title"], "renamed")
+        before_move = r.headers["ETag"]
+        r = self.client.get(f"/books?ids={book['id']},{other['id']},999&fields=title")
+        self.assertEqual([x["status"] for x in r.get_json()["results"]], [200, 200, 404])
+
+        # across shards: same id, new home, counters follow
+        r = self.client.post(f"/books/{book['id']}/transfer", json={"to_library_id": self.libs[1]})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.get_json()["book"]["id"], r.get_json()["book"]["title"]), (book["id"], "renamed"))
+        shards = self.on_shards()
+        self.assertEqual(shards[1], [])
+        self.assertIn((book["id"], self.libs[1]), shards[2])
+        self.assertEqual([self.count(u) for u in self.users], [0, 1, 1])
+        # the ETag from before the move no longer matches
+        r = self.client.put(f"/books/{book['id']}", json={"library_id": self.libs[0]}, headers={"If-Match": before_move})
+        self.assertEqual(r.status_code, 412)
+        r = self.client.put(f"/books/{book['id']}", json={"library_id": self.libs[0], "author": "moved"})
+        self.assertEqual((r.status_code, r.get_json()["author"]), (200, "moved"))
+        self.assertEqual([self.count(u) for u in self.users], [1, 0, 1])
+
+        self.assertEqual(self.client.delete(f"/books/{book['id']}").status_code, 200)
+        self.assertEqual(self.client.delete(f"/books/{book['id']}").status_code, 404)
+        self.assertEqual([self.count(u) for u in self.users], [0, 0, 1])
+
+    def test_bulk_routes_split_by_shard(self):
+        items = [{"title": f"t{i}", "author": "a", "library_id": self.libs[i % SHARDS]} for i in range(6)]
+        results = self.client.post("/books/bulk", json=items).get_json()["results"]
+        ids = [x["book"]["id"] for x in results]
+        self.assertEqual([x["book"]["title"] for x in results], [f"t{i}" for i in range(6)])
+        self.assertEqual(len(set(ids)), 6)
+
+        r = self.client.patch("/books/bulk", json=[
+            {"id": ids[0], "title": "x"}, {"id": ids[1], "library_id": self.libs[0]}, {"id": ids[2], "author": "y"},
+        ])
+        self.assertEqual([x["status"] for x in r.get_json()["results"]], [200, 409, 200])
+        self.assertEqual(r.get_json()["results"][2]["book"]["author"], "y")
+
+        r = self.client.delete("/books/bulk", json=ids[:4] + [999])
+        self.assertEqual([x["status"] for x in r.get_json()["results"]], [200] * 4 + [404])
+        self.assertEqual([self.count(u) for u in self.users], [0, 1, 1])
+
+    def test_stats_add_up_the_shards(self):
+        items = [{"title": "t", "author": "same" if i < 4 else "other", "library_id": self.libs[i % SHARDS]} for i in range(5)]
+        self.client.post("/books/bulk", json=items)
+        self.assertEqual(self.client.get("/stats/authors").get_json()["authors"],
+                         [{"author": "same", "book_count": 4}, {"author": "other", "book_count": 1}])
+        self.assertEqual(self.client.get("/stats/daily").get_json()["days"][-1]["book_count"], 5)
+        page = self.client.get("/stats/libraries?limit=2").get_json()
+        self.assertEqual([x["book_count"] for x in page["items"]], [2, 2])
+        page = self.client.get(f"/stats/libraries?limit=2&cursor={page['next_cursor']}").get_json()
+        self.assertEqual([x["book_count"] for x in page["items"]], [1])
+        # counted per shard: "same" has rows on all three
+        self.assertIn("4 authors and 3 days rebuilt", self.app.test_cli_runner().invoke(args=["rebuild-stats"]).output)
+
+    def test_delete_user_and_unsupported_routes(self):
+        self.add(self.libs[0])
+        self.assertEqual(self.client.delete(f"/users/{self.users[0]['id']}").status_code, 200)
+        with self.app.app_context(), on_shard(self.libs[0] % SHARDS):
+            self.assertEqual(db.session.scalar(select(func.count()).select_from(Book)), 0)
+            self.assertIsNone(db.session.scalar(select(library_book_count.c.book_count)))
+        self.assertEqual(self.client.post("/jobs", json={"kind": "reindex"}).get_json()["status"], "done")
+
+        self.assertEqual(self.client.get("/changes").status_code, 501)
+        self.assertEqual(self.client.post("/jobs", json={"kind": "reconcile_book_counts"}).status_code, 501)
+        r = self.client.post(f"/libraries/{self.libs[1]}/transfer", json={"all": True})
+        self.assertEqual(r.status_code, 501)
+        with self.app.app_context(), self.assertRaises(RuntimeError):
+            db.session.execute(select(Book.id))
+
+
+if __name__ == "__main__":
+    unittest.main()
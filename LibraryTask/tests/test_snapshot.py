@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+from sqlalchemy import insert, select, text, update
+from support import DBTestCase
+from app.extensions import db
+from app.models import AuthorStats, Book, Library, User
+
+TITLES = ['comma, "quoted"', "two\nlines", "naïve café ☕", "12"]
+
+
+class SnapshotTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.lib = self.make_user("owner")["library"]["id"]
+        self.other = self.make_user("other")["library"]["id"]
+        for i, title in enumerate(TITLES):
+            self.client.post("/books", json={"title": title, "author": f"author{i % 2}", "library_id": self.lib})
+        self.client.post("/books", json={"title": "glass stone", "author": "tolkien", "library_id": self.other})
+        with self.app.app_context():
+            db.session.execute(update(Book).where(Book.title == "12").values(updated_at=None))
+            # the API refuses empty titles; it must still come back as "", not NULL
+            db.session.execute(insert(Book), [{"title": "", "author": "author1", "library_id": self.lib}])
+            db.session.commit()
+        self.since = self.client.get("/changes?since=now").get_json()["next_since"]
+        self.cli = self.app.test_cli_runner()
+
+    def rows(self):
+        with self.app.app_context():
+            return [db.session.execute(select(m.__table__).order_by(m.id)).all() for m in (User, Library, Book)]
+
+    def schema(self):
+        with self.app.app_context():
+            return db.session.execute(text("SELECT type, name FROM sqlite_master ORDER BY name")).all()
+
+    def export(self):
+        out = self.cli.invoke(args=["snapshot", "export", self.dir.name]).output
+        self.assertIn("2 user, 2 library, 6 book rows written", out)
+
+    def test_round_trip(self):
+        before, schema = self.rows(), self.schema()
+        self.export()
+        self.client.post("/books", json={"title": "after", "author": "x", "library_id": self.lib})
+        self.client.delete(f"/users/{self.make_user('gone')['id']}")
+        self.client.put(f"/libraries/{self.other}", json={"name": "renamed"})
+
+        out = self.cli.invoke(args=["snapshot", "restore", self.dir.name, "--yes"]).output
+        self.assertIn("2 user, 2 library, 6 book rows restored", out)
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(self.schema(), schema)  # every index and trigger is back
+        self.assertEqual([b["title"] for b in self.client.get("/books?q=glass").get_json()], ["glass stone"])
+        self.assertEqual(self.client.get("/stats/authors").get_json()["authors"][0], {"author": "author1", "book_count": 3})
+        self.assertEqual(self.client.get("/changes", query_string={"since": self.since}).status_code, 410)
+
+        since = self.client.get("/changes?since=now").get_json()["next_since"]
+        book = self.client.post("/books", json={"title": "new", "author": "tolkien", "library_id": self.other}).get_json()
+        self.assertGreater(book["id"], max(r.id for r in before[2]))
+        feed = self.client.get("/changes", query_string={"since": since}).get_json()
+        self.assertEqual([(c["type"], c["id"]) for c in feed["changes"]], [("book", book["id"])])
+        with self.app.app_context():
+            self.assertEqual(db.session.get(AuthorStats, "tolkien").book_count, 2)
+
+    def test_bad_snapshot_changes_nothing(self):
+        before = self.rows()
+        self.assertIn("cannot read manifest.json", self.cli.invoke(args=["snapshot", "restore", self.dir.name, "--yes"]).output)
+        self.export()
+        path = os.path.join(self.dir.name, "manifest.json")
+        with open(path) as f:
+            manifest = json.load(f)
+        manifest["tables"]["book"]["rows"] += 1
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+        out = self.cli.invoke(args=["snapshot", "restore", self.dir.name, "--yes"]).output
+        self.assertIn("6 book rows loaded, the manifest says 7; nothing was changed", out)
+        manifest["format"] = 2
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+        self.assertIn("snapshot format 2", self.cli.invoke(args=["snapshot", "restore", self.dir.name, "--yes"]).output)
+        self.assertEqual(self.rows(), before)
+
+    def test_orphaned_books_are_rejected(self):
+        with self.app.app_context():
+            db.session.execute(text("PRAGMA foreign_keys=OFF"))
+            db.session.execute(insert(Book), [{"title": "orphan", "author": "a", "library_id": 999}])
+            db.session.commit()
+        before = self.rows()
+        self.cli.invoke(args=["snapshot", "export", self.dir.name])
+        out = self.cli.invoke(args=["snapshot", "restore", self.dir.name, "--yes"]).output
+        self.assertIn("1 rows point to missing parents", out)
+        self.assertEqual(self.rows(), before)
+
+    def test_restore_asks_first(self):
+        self.export()
+        r = self.cli.invoke(args=["snapshot", "restore", self.dir.name], input="n\n")
+        self.assertNotEqual(r.exit_code, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert, select, update
+from support import DBTestCase
+from app.extensions import db
+from app.models import AuthorStats, Book, DailyBookStats, Library
+
+
+class StatsTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("owner")
+        self.lib = self.user["library"]["id"]
+        self.other = self.make_user("other")["library"]["id"]
+
+    def rollups(self):
+        with self.app.app_context():
+            return (dict(db.session.execute(select(AuthorStats.author, AuthorStats.book_count)).all()),
+                    dict(db.session.execute(select(DailyBookStats.day, DailyBookStats.book_count)).all()))
+
+    def from_books(self):
+        with self.app.app_context():
+            authors = dict(db.session.execute(select(Book.author, func.count()).group_by(Book.author)).all())
+            days = {}
+            for (created_at,) in db.session.execute(select(Book.created_at)):
+                days[created_at.date()] = days.get(created_at.date(), 0) + 1
+            return authors, days
+
+    def add_old_books(self, *days_ago):
+        with self.app.app_context():
+            db.session.execute(insert(Book), [{"title": "old", "author": "archive", "library_id": self.lib,
+                                               "created_at": datetime.utcnow() - timedelta(days=n)} for n in days_ago])
+            db.session.commit()
+
+    def test_every_write_path_keeps_the_rollups(self):
+        book = self.client.post("/books", json={"title": "t", "author": "tolkien", "library_id": self.lib}).get_json()
+        items = [{"title": f"b{i}", "author": "austen" if i % 2 else "tolkien", "library_id": self.other} for i in range(4)]
+        ids = [r["book"]["id"] for r in self.client.post("/books/bulk", json=items).get_json()["results"]]
+        self.add_old_books(3, 3, 40)
+        self.assertEqual(self.rollups(), self.from_books())
+        self.assertEqual(self.rollups()[0], {"tolkien": 3, "austen": 2, "archive": 3})
+
+        self.client.put(f"/books/{book['id']}", json={"author": "le guin"})
+        self.client.patch("/books/bulk", json=[{"id": ids[0], "author": "austen"}, {"id": ids[1], "title": "same author"}])
+        self.client.post(f"/books/{ids[2]}/transfer", json={"to_library_id": self.lib})
+        self.assertEqual(self.rollups(), self.from_books())
+        self.assertEqual(self.rollups()[0], {"le guin": 1, "tolkien": 1, "austen": 3, "archive": 3})
+
+        self.client.delete(f"/books/{book['id']}")
+        self.client.delete("/books/bulk", json=ids[:2])
+        self.client.delete(f"/users/{self.user['id']}")
+        self.assertEqual(self.rollups(), self.from_books())
+        self.assertNotIn("archive", self.rollups()[0])  # dropped to zero
+
+    def test_endpoints(self):
+        items = [{"title": "t", "author": a, "library_id": self.lib} for a in ("b", "a", "b", "c", "c")]
+        self.client.post("/books/bulk", json=items)
+        self.add_old_books(2)
+        r = self.client.get("/stats/authors?limit=3").get_json()
+        self.assertEqual(r["authors"], [{"author": "b", "book_count": 2}, {"author": "c", "book_count": 2},
+                                        {"author": "a", "book_count": 1}])
+        self.assertEqual(self.client.get("/stats/authors?limit=0").status_code, 400)
+
+        page = self.client.get("/stats/libraries?limit=1").get_json()
+        self.assertEqual(page["items"], [{"library_id": self.lib, "name": "owner-lib", "book_count": 5}])  # old books skip the counter
+        nxt = self.client.get(f"/stats/libraries?limit=1&cursor={page['next_cursor']}").get_json()
+        self.assertEqual((nxt["items"][0]["book_count"], nxt["next_cursor"]), (0, None))
+
+        today = datetime.utcnow().date()
+        days = self.client.get("/stats/daily").get_json()["days"]
+        self.assertEqual(len(days), 30)
+        self.assertEqual(days[-1], {"day": today.isoformat(), "book_count": 5})
+        self.assertEqual(days[-3]["book_count"], 1)
+        r = self.client.get(f"/stats/daily?from={today - timedelta(days=2)}&to={today - timedelta(days=1)}").get_json()
+        self.assertEqual([d["book_count"] for d in r["days"]], [1, 0])
+        self.assertEqual(self.client.get("/stats/daily?from=yesterday").status_code, 400)
+        self.assertEqual(self.client.get(f"/stats/daily?from={today}&to={today - timedelta(days=1)}").status_code, 400)
+        self.assertEqual(self.client.get(f"/stats/daily?from={date(2000, 1, 1)}&to={today}").status_code, 400)
+
+    def test_rebuild_command_repairs_drift(self):
+        self.client.post("/books/bulk", json=[{"title": "t", "author": a, "library_id": self.lib} for a in "abcab"])
+        self.add_old_books(1, 5, 9, 9, 400)
+        expected = self.from_books()
+        with self.app.app_context():
+            db.session.execute(AuthorStats.__table__.delete().where(AuthorStats.author == "a"))
+            db.session.add(AuthorStats(author="ghost", book_count=4))
+            db.session.execute(update(DailyBookStats).values(book_count=DailyBookStats.book_count + 1))
+            db.session.add(DailyBookStats(day=date(1999, 1, 1), book_count=1))
+            db.session.execute(update(Library).values(book_count=0))
+            db.session.commit()
+        output = self.app.test_cli_runner().invoke(args=["rebuild-stats", "--chunk-size", "2"]).output
+        self.assertIn("4 authors and 5 days rebuilt", output)
+        self.assertIn("1 library book counts repaired", output)
+        self.assertEqual(self.rollups(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
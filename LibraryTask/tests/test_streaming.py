@@ -0,0 +1,38 @@
+import json
+import unittest
+from support import DBTestCase
+
+
+class StreamingExportTests(DBTestCase):
+    config = {"STREAM_BATCH_SIZE": 2}
+
+    def setUp(self):
+        super().setUp()
+        self.lib = self.make_user("owner")["library"]["id"]
+        for i in range(5):
+            self.client.post("/books", json={"title": f"t{i}", "author": "a", "library_id": self.lib})
+
+    def test_ndjson_via_accept_header(self):
+        r = self.client.get("/books", headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.mimetype, "application/x-ndjson")
+        self.assertTrue(r.is_streamed)
+        lines = r.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(l)["title"] for l in lines], [f"t{i}" for i in range(5)])
+
+    def test_stream_json_array_matches_plain_listing(self):
+        r = self.client.get("/books?stream=1")
+        self.assertTrue(r.is_streamed)
+        self.assertEqual(json.loads(r.get_data()), self.client.get("/books").get_json())
+
+    def test_stream_respects_filters(self):
+        r = self.client.get(f"/books?stream=1&format=ndjson&q=t3&library_id={self.lib}")
+        self.assertEqual(len(r.get_data(as_text=True).splitlines()), 1)
+
+    def test_empty_stream(self):
+        r = self.client.get("/books?stream=1&q=nothing")
+        self.assertEqual(json.loads(r.get_data()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
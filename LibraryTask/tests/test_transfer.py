@@ -0,0 +1,48 @@
+import unittest
+from support import DBTestCase
+
+
+class BulkTransferTests(DBTestCase):
+    config = {"TRANSFER_CHUNK_SIZE": 2}
+
+    def setUp(self):
+        super().setUp()
+        self.src = self.make_user("src")["library"]["id"]
+        self.dst = self.make_user("dst")["library"]["id"]
+        items = [{"title": f"t{i}", "author": "tolkien" if i % 2 else "other", "library_id": self.src} for i in range(5)]
+        self.ids = [x["book"]["id"] for x in self.client.post("/books/bulk", json=items).get_json()["results"]]
+
+    def count(self, lib):
+        return len(self.client.get(f"/libraries/{lib}/books").get_json())
+
+    def transfer(self, body, to=None):
+        return self.client.post(f"/libraries/{to or self.dst}/transfer", json=body)
+
+    def test_by_ids(self):
+        r = self.transfer({"book_ids": self.ids[:3] + [999]})
+        self.assertEqual(r.get_json()["moved"], 3)
+        self.assertEqual((self.count(self.src), self.count(self.dst)), (2, 3))
+
+    def test_by_filter_in_chunks(self):
+        # destination check, capped count (inline or job); per chunk of 2: read rows, UPDATE, counters; then an empty read
+        with self.assertQueries(6):
+            r = self.transfer({"from_library_id": self.src, "author": "tolkien"})
+        self.assertEqual(r.get_json()["moved"], 2)
+        self.assertEqual(self.transfer({"from_library_id": self.src}).get_json()["moved"], 3)
+        self.assertEqual(self.count(self.dst), 5)
+
+    def test_all_requires_opt_in(self):
+        self.assertEqual(self.transfer({}).status_code, 400)
+        self.assertEqual(self.transfer({"all": True}).get_json()["moved"], 5)
+
+    def test_created_range(self):
+        self.assertEqual(self.transfer({"created_before": "2000-01-01T00:00:00Z"}).get_json()["moved"], 0)
+        self.assertEqual(self.transfer({"created_after": "2000-01-01T00:00:00Z"}).get_json()["moved"], 5)
+        self.assertEqual(self.transfer({"created_after": "yesterday"}).status_code, 400)
+
+    def test_unknown_destination(self):
+        self.assertEqual(self.transfer({"book_ids": self.ids}, to=999).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
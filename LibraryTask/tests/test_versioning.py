@@ -0,0 +1,125 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import event, update
+from support import DBTestCase
+from app.extensions import db
+from app.models import IdempotencyKey
+
+
+class OptimisticConcurrencyTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("owner")
+        self.lib = self.user["library"]["id"]
+        self.other = self.make_user("other")["library"]["id"]
+        r = self.client.post("/books", json={"title": "t", "author": "a", "library_id": self.lib})
+        self.book = r.get_json()["id"]
+        self.etag = r.headers["ETag"]
+
+    def test_write_responses_carry_the_new_version(self):
+        self.assertEqual(self.etag, '"1"')
+        r = self.client.put(f"/books/{self.book}", json={"title": "u"}, headers={"If-Match": self.etag})
+        self.assertEqual((r.status_code, r.headers["ETag"]), (200, '"2"'))
+        r = self.client.post(f"/books/{self.book}/transfer", json={"to_library_id": self.other}, headers={"If-Match": '"2"'})
+        self.assertEqual((r.status_code, r.headers["ETag"]), (200, '"3"'))
+
+    def test_stale_if_match_is_rejected(self):
+        self.client.put(f"/books/{self.book}", json={"title": "first"})
+        for method, path, body in [("PUT", f"/books/{self.book}", {"title": "second"}),
+                                   ("POST", f"/books/{self.book}/transfer", {"to_library_id": self.other}),
+                                   ("DELETE", f"/books/{self.book}", None)]:
+            r = self.client.open(path, method=method, json=body, headers={"If-Match": self.etag})
+            self.assertEqual(r.status_code, 412, path)
+            self.assertEqual(r.headers["ETag"], '"2"')
+        self.assertEqual(self.client.get("/books").get_json()[0]["title"], "first")
+        self.assertEqual(self.client.put(f"/books/{self.book}", json={"title": "x"}, headers={"If-Match": "*"}).status_code, 200)
+
+    def test_user_etag_covers_the_library(self):
+        uid = self.user["id"]
+        tag = self.client.get(f"/users/{uid}").headers["ETag"]
+        self.assertEqual(tag, '"1.1"')
+        r = self.client.put(f"/users/{uid}", json={"library_name": "renamed"}, headers={"If-Match": tag})
+        self.assertEqual((r.status_code, r.headers["ETag"]), (200, '"1.2"'))
+        self.assertEqual(self.client.put(f"/users/{uid}", json={"username": "x"}, headers={"If-Match": tag}).status_code, 412)
+        self.assertEqual(self.client.delete(f"/users/{uid}", headers={"If-Match": tag}).status_code, 412)
+        self.assertEqual(self.client.get(f"/users/{uid}", headers={"If-None-Match": '"1.2"'}).status_code, 304)
+
+    def racing_writer(self):
+        # bumps the row from another "client" right before the request's own UPDATE reaches the database
+        with self.app.app_context():
+            engine = db.engine
+
+        def before(conn, cursor, statement, *args):
+            if statement.startswith("UPDATE book SET"):
+                cursor.connection.execute("UPDATE book SET version_id = version_id + 1")
+        event.listen(engine, "before_cursor_execute", before)
+        self.addCleanup(event.remove, engine, "before_cursor_execute", before)
+
+    def test_race_after_the_check_is_caught_in_sql(self):
+        self.racing_writer()
+        r = self.client.put(f"/books/{self.book}", json={"title": "mine"}, headers={"If-Match": self.etag})
+        self.assertEqual(r.status_code, 412)
+        r = self.client.put(f"/books/{self.book}", json={"title": "mine"})
+        self.assertEqual(r.status_code, 409)
+        self.assertEqual(self.client.get("/books").get_json()[0]["title"], "t")
+
+    def test_bulk_update_and_transfer_bump_versions(self):
+        self.client.patch("/books/bulk", json=[{"id": self.book, "title": "b"}])
+        self.client.post(f"/libraries/{self.other}/transfer", json={"book_ids": [self.book]})
+        r = self.client.put(f"/books/{self.book}", json={"title": "c"}, headers={"If-Match": '"3"'})
+        self.assertEqual(r.status_code, 200)
+
+
+class IdempotencyKeyTests(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lib = self.make_user("owner")["library"]["id"]
+
+    def post(self, body, key="k1"):
+        return self.client.post("/books", json=body, headers={"Idempotency-Key": key})
+
+    def book_count(self):
+        return len(self.client.get("/books").get_json())
+
+    def test_retry_replays_the_first_response(self):
+        body = {"title": "t", "author": "a", "library_id": self.lib}
+        first = self.post(body)
+        with self.assertQueries(1):
+            again = self.post(body)
+        self.assertEqual((again.status_code, again.get_json()), (201, first.get_json()))
+        self.assertEqual(again.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(self.book_count(), 1)
+        self.post(body, key="k2")
+        self.client.post("/books", json=body)
+        self.assertEqual(self.book_count(), 3)
+
+    def test_key_reused_for_another_request(self):
+        self.post({"title": "t", "author": "a", "library_id": self.lib})
+        self.assertEqual(self.post({"title": "other", "author": "a", "library_id": self.lib}).status_code, 422)
+
+    def test_client_errors_are_replayed_too(self):
+        self.assertEqual(self.post({"title": "t", "author": "a", "library_id": 999}).status_code, 404)
+        self.assertEqual(self.post({"title": "t", "author": "a", "library_id": 999}).status_code, 404)
+        # a rolled back view (duplicate username) still stores its answer
+        r = self.client.post("/users", json={"username": "owner", "library_name": "x"}, headers={"Idempotency-Key": "u"})
+        self.assertEqual(r.status_code, 409)
+        r = self.client.post("/users", json={"username": "owner", "library_name": "x"}, headers={"Idempotency-Key": "u"})
+        self.assertEqual((r.status_code, r.headers.get("Idempotent-Replayed")), (409, "true"))
+
+    def test_expired_keys_run_again_and_are_pruned(self):
+        body = {"title": "t", "author": "a", "library_id": self.lib}
+        self.post(body)
+        with self.app.app_context():
+            db.session.execute(update(IdempotencyKey).values(created_at=datetime.utcnow() - timedelta(days=2)))
+            db.session.commit()
+        self.assertNotIn("Idempotent-Replayed", self.post(body).headers)
+        self.assertEqual(self.book_count(), 2)
+        with self.app.app_context():
+            db.session.execute(update(IdempotencyKey).values(created_at=datetime.utcnow() - timedelta(days=2)))
+            db.session.commit()
+        out = self.app.test_cli_runner().invoke(args=["prune-idempotency-keys"]).output
+        self.assertIn("1 keys deleted", out)
+
+
+if __name__ == "__main__":
+    unittest.main()